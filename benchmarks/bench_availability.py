@@ -0,0 +1,91 @@
+"""
+Đo thông lượng câu hỏi lịch trống nhiều ngày ("90 phút trống đầu tiên trong N ngày tới, chỉ buổi sáng").
+
+    python benchmarks/bench_availability.py [--schedules 3000] [--days 120] [--queries 500]
+
+So sánh trên cùng DB (lịch ngẫu nhiên trong --days ngày), mỗi truy vấn chọn ngẫu nhiên thời lượng,
+khung giờ (sáng / chiều / cả ngày) và tầm tìm (1 tuần đến --days ngày):
+- sweep: FreeSlotFinder (quét khoảng trống từng ngày), lấy slot đầu tiên
+- bitmap: AvailabilityEngine (mảng phút trống theo ngày, cache), lấy slot đầu tiên
+Kết quả hai cách được đối chiếu.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from core.services.availability import AvailabilityEngine
+from core.services.free_slots import FreeSlotFinder
+from core.services.schedule_index import ScheduleIntervalIndex
+from utils.timezone_utils import VIETNAM_TZ
+
+START = datetime(2025, 3, 3, tzinfo=VIETNAM_TZ)
+WINDOWS = ((8, 12), (13, 17), (8, 17))
+
+
+def seed(db_path: str, count: int, days: int):
+    rng = random.Random(9)
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for _ in range(count):
+        start = START + timedelta(days=rng.randrange(days), hours=rng.randrange(8, 17), minutes=15 * rng.randrange(4))
+        end = start + timedelta(minutes=15 * rng.randrange(1, 8))
+        rows.append(('Lịch', start.isoformat(), end.isoformat(), start.isoformat()))
+    conn.executemany('INSERT INTO schedules (title, start_time, end_time, created_at) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedules', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [(START + timedelta(days=rng.randrange(7), hours=rng.randrange(24)), rng.choice((30, 60, 90, 120)),
+                rng.choice(WINDOWS), rng.randrange(7, args.days + 1)) for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'schedule.db')
+        ScheduleAdvisor(db_path=db_path)
+        seed(db_path, args.schedules, args.days)
+        index = ScheduleIntervalIndex(db_path)
+        finder = FreeSlotFinder(index, VIETNAM_TZ)
+        engine = AvailabilityEngine(index)
+
+        started = time.perf_counter()
+        expected = []
+        for start, duration, (low, high), horizon in queries:
+            found = finder.slots(start, START + timedelta(days=horizon), duration, step_minutes=1, limit=1,
+                                 start_hour=low, end_hour=high)
+            expected.append(found[0][0] if found else None)
+        swept = time.perf_counter() - started
+
+        started = time.perf_counter()
+        engine.find_slots(START, 60, horizon_days=args.days, limit=None)
+        warmup = time.perf_counter() - started
+        started = time.perf_counter()
+        results = []
+        for start, duration, window, horizon in queries:
+            days = ((START + timedelta(days=horizon)).date() - start.date()).days
+            results.append(engine.first_free(start, duration, horizon_days=days, window=window))
+        bitmap = time.perf_counter() - started
+
+        mismatches = sum(a != b for a, b in zip(results, expected))
+        print(f"sweep   queries={len(queries)} qps={len(queries) / swept:9.0f} mean={swept / len(queries) * 1e3:6.2f}ms")
+        print(f"bitmap  queries={len(queries)} qps={len(queries) / bitmap:9.0f} mean={bitmap / len(queries) * 1e3:6.2f}ms "
+              f"(dựng {args.days} ngày lần đầu: {warmup * 1e3:.1f}ms) mismatches={mismatches}")
+        print(f"stats   {engine.get_stats()}")
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Đo chỉ mục truy hồi ngữ cảnh (vector n-gram băm, NumPy) trên một session rất dài.
+
+    python benchmarks/bench_context_retrieval.py [--messages 100000] [--repeat 200]
+
+Message sinh từ âm tiết tiếng Việt tổng hợp (Zipf) như bench_history_search, 5% có thêm
+các từ thường gặp khi đặt lịch. Đo:
+- nạp chỉ mục từ DB (lần truy vấn đầu của session)
+- thêm một message (cập nhật tăng dần khi add_user_message)
+- một truy vấn top-k (get_relevant_context), p50/p95/p99
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_history_search import WORDS, _vocabulary
+from core.config import Config
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.timezone_utils import VIETNAM_TZ
+
+QUERIES = ('họp team lúc mấy giờ', 'lịch đi khám bác sĩ', 'tuần sau đi Đà Nẵng', 'nhắc tôi nộp thuế',
+           'đón con chiều mai')
+
+
+def seed(db_path: str, messages: int):
+    rng = random.Random(7)
+    vocabulary = _vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    base = datetime(2024, 1, 1, 8, 0, tzinfo=VIETNAM_TZ)
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for i in range(messages):
+        words = rng.choices(vocabulary, weights, k=rng.randint(6, 20))
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(len(words)), rng.choice(WORDS))
+        ts = (base + timedelta(seconds=i)).isoformat()
+        rows.append(('bench', 'user' if i % 2 == 0 else 'assistant', ' '.join(words), ts, ts))
+    conn.executemany('''
+        INSERT INTO conversation_history (session_id, role, content, timestamp, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'schedule.db')
+        pool = SQLitePool(db_path)
+        service = ConversationService(db_path=db_path, max_history=args.messages * 2, pool=pool,
+                                      write_behind=False)
+        seed(db_path, args.messages)
+
+        started = time.perf_counter()
+        service.get_relevant_context('bench', QUERIES[0])
+        print(f"load    messages={args.messages} dim={Config.RETRIEVAL_DIM} "
+              f"time={(time.perf_counter() - started) * 1000:9.1f}ms")
+
+        adds = []
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            service._retriever.add('bench', -i, f'tin nhắn mới {i}: họp team chiều mai', '')
+            adds.append(time.perf_counter() - started)
+        print(f"add     mean={statistics.mean(adds) * 1000:7.3f}ms p95={percentile(adds, 0.95):7.3f}ms")
+
+        latencies = []
+        for i in range(args.repeat):
+            query = QUERIES[i % len(QUERIES)]
+            started = time.perf_counter()
+            service.get_relevant_context('bench', query)
+            latencies.append(time.perf_counter() - started)
+        print(f"query   top_k={Config.RETRIEVAL_TOP_K} mean={statistics.mean(latencies) * 1000:7.3f}ms "
+              f"p50={percentile(latencies, 0.5):7.3f}ms p95={percentile(latencies, 0.95):7.3f}ms "
+              f"p99={percentile(latencies, 0.99):7.3f}ms")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Đo chi phí lịch sử hội thoại trên mỗi lượt: add_user_message, get_recent_context,
+add_assistant_message (kèm cleanup) và get_session_stats khi tạo agent.
+
+    python benchmarks/bench_conversation_history.py [--turns 2000] [--sessions 20]
+
+So sánh hai chế độ:
+- connect-per-call: mở/đóng sqlite3.connect ở mỗi method (hành vi trước khi có pool)
+- pooled: SQLitePool dùng chung, kết nối sống lâu với WAL + prepared statement cache
+- write-behind: pooled + bộ đệm HistoryWriteBuffer, INSERT/cleanup chạy theo batch ở thread nền
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import Config
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from core.services.history_buffer import HistoryWriteBuffer
+
+
+class ConnectPerCallPool:
+    """Mô phỏng hành vi cũ: mỗi lần dùng là một sqlite3.connect mới, không pragma."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+def run_turns(service: ConversationService, turns: int, sessions: int):
+    latencies = []
+    for i in range(turns):
+        session_id = f"bench-{i % sessions}"
+        started = time.perf_counter()
+        if i < sessions:
+            service.get_session_stats(session_id)
+        service.add_user_message(f"tin nhắn {i}: họp team chiều mai 60 phút", session_id)
+        service.get_recent_context(session_id, Config.CONTEXT_WINDOW_SIZE)
+        service.add_assistant_message(f"phản hồi {i}", session_id=session_id)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    print(f"{name:18s} turns={len(latencies):6d} "
+          f"mean={statistics.mean(latencies) * 1000:7.3f}ms p50={p(0.5):7.3f}ms "
+          f"p95={p(0.95):7.3f}ms p99={p(0.99):7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=20)
+    args = parser.parse_args()
+
+    for name, make_pool, write_behind in (
+        ('connect-per-call', ConnectPerCallPool, False),
+        ('pooled', SQLitePool, False),
+        ('write-behind', SQLitePool, True),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'schedule.db')
+            pool = make_pool(db_path)
+            service = ConversationService(db_path=db_path, pool=pool)
+            if write_behind:
+                # Bộ đệm riêng cho benchmark thay vì singleton theo đường dẫn
+                service._buffer = HistoryWriteBuffer(pool)
+                service._buffer.set_after_flush(service._cleanup_sessions)
+            run_turns(service, min(200, args.turns), args.sessions)  # warm-up
+            report(name, run_turns(service, args.turns, args.sessions))
+            if write_behind:
+                service._buffer.close()
+                stats = service._buffer.get_stats()
+                print(f"{'':18s} flushes={stats['batch_size']['count']} "
+                      f"avg_batch={stats['batch_size']['avg']:.1f} "
+                      f"avg_flush={stats['flush_latency_seconds']['avg'] * 1000:.3f}ms "
+                      f"max_flush={stats['flush_latency_seconds']['max'] * 1000:.3f}ms")
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Đo thời gian tìm khung giờ trống theo độ mịn của bước nhảy.
+
+    python benchmarks/bench_free_slots.py [--schedules 300] [--days 30] [--duration 60]
+
+So sánh trên cùng DB (lịch ngẫu nhiên trong --days ngày):
+- stepping: duyệt từng bước trong giờ làm việc, mỗi bước một lần kiểm tra trùng lịch
+  (GoogleCalendarService.is_time_slot_free: mở kết nối SQLite mới mỗi lần) như trước thay đổi
+- sweep: FreeSlotFinder, lấy khối bận một lần mỗi ngày và quét một lượt
+Cả hai đều trả mọi slot trong --days ngày (không giới hạn số slot); số slot được đối chiếu.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from core.services.google_calendar_service import GoogleCalendarService
+from utils.timezone_utils import VIETNAM_TZ
+
+START = datetime(2025, 3, 3, tzinfo=VIETNAM_TZ)
+
+
+def seed(db_path: str, count: int, days: int):
+    rng = random.Random(5)
+    conn = sqlite3.connect(db_path)
+    # Cột đồng bộ do ExecuteSchedule tạo, GoogleCalendarService cần khi khởi tạo
+    conn.execute('ALTER TABLE schedules ADD COLUMN google_event_id TEXT')
+    rows = []
+    for _ in range(count):
+        start = START + timedelta(days=rng.randrange(days), hours=rng.randrange(8, 17), minutes=15 * rng.randrange(4))
+        end = start + timedelta(minutes=15 * rng.randrange(1, 8))
+        rows.append(('Lịch', start.isoformat(), end.isoformat(), start.isoformat()))
+    conn.executemany('INSERT INTO schedules (title, start_time, end_time, created_at) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def stepping(calendar: GoogleCalendarService, days: int, duration: int, step: int) -> int:
+    found = 0
+    for offset in range(days):
+        day = START + timedelta(days=offset)
+        slot, close = day.replace(hour=8), day.replace(hour=17)
+        while slot + timedelta(minutes=duration) <= close:
+            end = slot + timedelta(minutes=duration)
+            if (end <= day.replace(hour=12) or slot >= day.replace(hour=13)) and \
+                    calendar.is_time_slot_free(slot.isoformat(), end.isoformat()):
+                found += 1
+            slot += timedelta(minutes=step)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedules', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--duration', type=int, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'schedule.db')
+        advisor = ScheduleAdvisor(db_path=db_path)
+        seed(db_path, args.schedules, args.days)
+        calendar = GoogleCalendarService(db_path=db_path)
+        end = START + timedelta(days=args.days)
+        for step in (60, 15, 5, 1):
+            started = time.perf_counter()
+            expected = stepping(calendar, args.days, args.duration, step)
+            stepped = time.perf_counter() - started
+
+            started = time.perf_counter()
+            slots = advisor.free_slot_finder.slots(START, end, args.duration, step_minutes=step)
+            swept = time.perf_counter() - started
+            print(f"step={step:3}m slots={len(slots):6} stepping={stepped * 1e3:9.1f}ms "
+                  f"sweep={swept * 1e3:7.1f}ms mismatches={abs(len(slots) - expected)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Đo thời gian tìm khung giờ trống chung theo số người tham gia.
+
+    python benchmarks/bench_group_availability.py [--events 6] [--days 30] [--duration 60]
+
+Mỗi người là một calendar Google (qua LocalFreeBusyService thay cho endpoint freebusy) với
+--events lịch ngẫu nhiên trong --days ngày. Với 1, 10, 25, 50, 100 người:
+- fetch: lấy khoảng bận của mọi calendar (request freebusy gộp 50 calendar)
+- merge: trộn k đường (heapq.merge) thành dòng thời gian bận chung
+- slots: quét khoảng trống trong giờ làm việc, trả mọi slot trên lưới 15 phút
+- pairwise: cách làm thẳng, mỗi điểm lưới kiểm tra lần lượt từng người (trên dữ liệu đã lấy)
+Kết quả slots và pairwise được đối chiếu.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.services.free_slots import FreeSlotFinder
+from core.services.google_calendar_service import GoogleCalendarService
+from core.services.group_availability import BusyTimeline, GroupAvailability, LocalFreeBusyService, merge_busy
+from utils.timezone_utils import VIETNAM_TZ
+
+START = datetime(2025, 3, 3, tzinfo=VIETNAM_TZ)
+STEP = 15
+
+
+def calendars(people: int, events: int, days: int):
+    rng = random.Random(people)
+    result = {}
+    for person in range(people):
+        items = []
+        for _ in range(events):
+            start = START + timedelta(days=rng.randrange(days), hours=rng.randrange(8, 17), minutes=15 * rng.randrange(4))
+            items.append((start.isoformat(), (start + timedelta(minutes=15 * rng.randrange(1, 6))).isoformat()))
+        result[f'person-{person}@example.com'] = items
+    return result
+
+
+def pairwise(busy, end: datetime, duration: int) -> int:
+    timelines = [BusyTimeline(intervals) for intervals in busy.values()]
+    found = 0
+    day = START
+    while day < end:
+        slot = day.replace(hour=8)
+        while slot + timedelta(minutes=duration) <= day.replace(hour=17):
+            slot_end = slot + timedelta(minutes=duration)
+            if (slot_end <= day.replace(hour=12) or slot >= day.replace(hour=13)) and \
+                    all(timeline.is_free(slot, slot_end) for timeline in timelines):
+                found += 1
+            slot += timedelta(minutes=STEP)
+        day += timedelta(days=1)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=6)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--duration', type=int, default=60)
+    args = parser.parse_args()
+
+    end = START + timedelta(days=args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        calendar_service = GoogleCalendarService(db_path=os.path.join(tmp, 'google.db'))
+        for people in (1, 10, 25, 50, 100):
+            data = calendars(people, args.events, args.days)
+            stand_in = LocalFreeBusyService(data)
+            group = GroupAvailability(google_calendar_ids=list(data), calendar_service=calendar_service,
+                                      freebusy_service=stand_in)
+
+            started = time.perf_counter()
+            busy = group.busy_by_calendar(START, end)
+            fetched = time.perf_counter() - started
+
+            started = time.perf_counter()
+            common = merge_busy(busy.values())
+            merged = time.perf_counter() - started
+
+            started = time.perf_counter()
+            slots = FreeSlotFinder(BusyTimeline(common), VIETNAM_TZ).slots(START, end, args.duration, step_minutes=STEP)
+            swept = time.perf_counter() - started
+
+            started = time.perf_counter()
+            expected = pairwise(busy, end, args.duration)
+            naive = time.perf_counter() - started
+
+            intervals = sum(len(intervals) for intervals in busy.values())
+            print(f"people={people:3} busy={intervals:5} requests={stand_in.requests} fetch={fetched * 1e3:7.1f}ms "
+                  f"merge={merged * 1e3:6.2f}ms slots={swept * 1e3:6.2f}ms ({len(slots)}) "
+                  f"pairwise={naive * 1e3:8.1f}ms mismatches={abs(len(slots) - expected)}")
+
+
+if __name__ == '__main__':
+    main()
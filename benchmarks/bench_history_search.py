@@ -0,0 +1,131 @@
+"""
+So sánh tìm kiếm lịch sử hội thoại: LIKE '%query%' (cách cũ) với chỉ mục FTS5.
+
+    python benchmarks/bench_history_search.py [--messages 1000000] [--sessions 20000] [--repeat 20]
+
+Dữ liệu sinh ngẫu nhiên từ âm tiết tiếng Việt tổng hợp (Zipf), 5% message có thêm
+một từ thường gặp khi đặt lịch. Mỗi truy vấn đo
+trong một session và trên toàn bộ lịch sử; FTS5 không phân biệt dấu nên cũng khớp
+những message mà LIKE bỏ sót (cột hits).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.timezone_utils import VIETNAM_TZ
+
+# Các từ xuất hiện trong truy vấn, chèn thêm vào message với tần suất thấp
+WORDS = (
+    "họp team khách hàng báo cáo dự án đi khám bác sĩ sinh nhật mẹ nộp thuế gặp đối tác "
+    "Đà Nẵng Hà Nội sáng chiều tối mai thứ hai thứ ba thứ năm tuần sau lúc giờ phút "
+    "nhắc tôi đặt lịch hủy dời phỏng vấn ứng viên học tiếng Anh tập gym đón con"
+).split()
+QUERIES = ('họp', 'bác sĩ', 'Đà Nẵng', 'phong van', 'nop thue')
+
+# Âm tiết tổng hợp (phụ âm đầu + vần + thanh) làm từ vựng nền, phân bố Zipf
+_ONSETS = ('', 'b', 'c', 'ch', 'd', 'đ', 'g', 'gi', 'h', 'k', 'kh', 'l', 'm', 'n', 'ng', 'nh',
+           'ph', 'qu', 'r', 's', 't', 'th', 'tr', 'v', 'x')
+_RHYMES = ('a', 'ai', 'am', 'an', 'ang', 'anh', 'ao', 'at', 'e', 'em', 'en', 'i', 'im', 'in',
+           'o', 'oi', 'om', 'on', 'ong', 'u', 'ui', 'um', 'un', 'ung', 'ư', 'ưa', 'ương', 'ơi', 'ôn')
+_TONES = ('', '\u0300', '\u0301', '\u0303', '\u0309', '\u0323')
+
+
+def _vocabulary(rng: random.Random, size: int = 5000):
+    import unicodedata
+    words = {unicodedata.normalize('NFC', o + r[0] + t + r[1:])
+             for o in _ONSETS for r in _RHYMES for t in _TONES}
+    words = sorted(words)
+    rng.shuffle(words)
+    return words[:size]
+
+
+def seed(db_path: str, messages: int, sessions: int):
+    rng = random.Random(7)
+    vocabulary = _vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    base = datetime(2024, 1, 1, 8, 0, tzinfo=VIETNAM_TZ)
+    conn = sqlite3.connect(db_path)
+    batch = []
+    for i in range(messages):
+        ts = (base + timedelta(seconds=i)).isoformat()
+        words = rng.choices(vocabulary, weights, k=rng.randint(4, 14))
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(WORDS))
+        content = ' '.join(words)
+        batch.append((f'bench-{i % sessions}', 'user' if i % 2 == 0 else 'assistant', content, ts, ts))
+        if len(batch) >= 50000:
+            conn.executemany('''
+                INSERT INTO conversation_history (session_id, role, content, timestamp, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', batch)
+            batch.clear()
+    conn.executemany('''
+        INSERT INTO conversation_history (session_id, role, content, timestamp, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', batch)
+    conn.commit()
+    conn.close()
+
+
+def like_search(pool: SQLitePool, query: str, session_id, limit: int = 10):
+    """Truy vấn LIKE trước khi có FTS5 (thêm nhánh không lọc session để so sánh)."""
+    session_filter = "session_id = ? AND" if session_id is not None else ""
+    params = ([session_id] if session_id is not None else []) + [f'%{query}%', limit]
+    with pool.connection() as conn:
+        return conn.execute(f'''
+            SELECT id, role, content, timestamp, created_at
+            FROM conversation_history
+            WHERE {session_filter} content LIKE ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', params).fetchall()
+
+
+def measure(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'schedule.db')
+        pool = SQLitePool(db_path)
+        service = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+        started = time.perf_counter()
+        seed(db_path, args.messages, args.sessions)
+        print(f"seeded {args.messages} messages (FTS5 qua trigger) in {time.perf_counter() - started:.1f}s, "
+              f"db={os.path.getsize(db_path) / 1e6:.0f}MB")
+
+        for scope, session_id in (('session', 'bench-42'), ('all', None)):
+            for query in QUERIES:
+                like_ms, like_hits = measure(lambda: like_search(pool, query, session_id), args.repeat)
+                fts_ms, fts_hits = measure(
+                    lambda: service.search_conversations(query, session_id, 10), args.repeat)
+                print(f"{scope:7s} {query:10s} LIKE p50={like_ms:8.3f}ms hits={like_hits:2d}   "
+                      f"FTS5 p50={fts_ms:8.3f}ms hits={fts_hits:2d}   x{like_ms / fts_ms:6.1f}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
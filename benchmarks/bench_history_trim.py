@@ -0,0 +1,105 @@
+"""
+Đo chi phí giữ lịch sử hội thoại trong giới hạn MAX_CONVERSATION_HISTORY khi các session
+đã ở sát giới hạn (mỗi message mới đều có thể kích hoạt cắt).
+
+    python benchmarks/bench_history_trim.py [--sessions 2000] [--inserts 5000]
+
+So sánh hai chế độ:
+- count+delete: COUNT(*) rồi DELETE ... NOT IN (SELECT ... LIMIT) sau mỗi message (hành vi cũ)
+- amortized: bộ đếm theo session, chỉ range delete khi vượt high-water mark
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import Config
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.timezone_utils import VIETNAM_TZ
+
+
+class CountDeleteConversationService(ConversationService):
+    """Mô phỏng _cleanup_old_messages cũ: đếm và xóa sau mỗi lần chèn."""
+
+    def _cleanup_old_messages(self, session_id, conn, added=1):
+        count = conn.execute(
+            'SELECT COUNT(*) FROM conversation_history WHERE session_id = ?', (session_id,)
+        ).fetchone()[0]
+        if count > self.max_history:
+            conn.execute('''
+                DELETE FROM conversation_history
+                WHERE session_id = ? AND id NOT IN (
+                    SELECT id FROM conversation_history
+                    WHERE session_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                )
+            ''', (session_id, session_id, self.max_history))
+
+
+def seed(db_path: str, sessions: int, per_session: int):
+    base = datetime(2024, 1, 1, 8, 0, tzinfo=VIETNAM_TZ)
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for s in range(sessions):
+        for m in range(per_session):
+            ts = (base + timedelta(seconds=s * per_session + m)).isoformat()
+            rows.append((f'bench-{s}', 'user' if m % 2 == 0 else 'assistant', f'tin nhắn {m}', ts, ts))
+    conn.executemany('''
+        INSERT INTO conversation_history (session_id, role, content, timestamp, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def run(service: ConversationService, sessions: int, inserts: int):
+    latencies = []
+    for i in range(inserts):
+        started = time.perf_counter()
+        service.add_user_message(f'tin mới {i}', f'bench-{i % sessions}')
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies, db_path: str):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    conn = sqlite3.connect(db_path)
+    worst = conn.execute('''
+        SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM conversation_history GROUP BY session_id)
+    ''').fetchone()[0]
+    conn.close()
+    print(f"{name:14s} inserts={len(latencies):6d} "
+          f"mean={statistics.mean(latencies) * 1000:7.3f}ms p50={p(0.5):7.3f}ms "
+          f"p95={p(0.95):7.3f}ms p99={p(0.99):7.3f}ms max_rows/session={worst}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--inserts', type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, service_cls in (
+        ('count+delete', CountDeleteConversationService),
+        ('amortized', ConversationService),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'schedule.db')
+            pool = SQLitePool(db_path)
+            service = service_cls(db_path=db_path, pool=pool, write_behind=False)
+            seed(db_path, args.sessions, Config.MAX_CONVERSATION_HISTORY)
+            report(name, run(service, args.sessions, args.inserts), db_path)
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
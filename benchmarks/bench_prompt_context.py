@@ -0,0 +1,88 @@
+"""
+Đo kích thước và độ trễ dựng phần ngữ cảnh hội thoại của system prompt cho một session dài.
+
+    python benchmarks/bench_prompt_context.py [--turns 120] [--repeat 2000]
+
+So sánh:
+- window=12: CONTEXT_WINDOW_SIZE tin nhắn gần nhất, không tóm tắt (trước thay đổi)
+- window=50: tăng cửa sổ để nhớ lâu hơn (prompt phình to)
+- window=12+summary: tóm tắt các lượt cũ + 12 tin nhắn gần nhất
+Cột name cho biết tên người dùng (giới thiệu ở lượt đầu) còn trong prompt hay không.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import Config
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def build_session(service: ConversationService, turns: int):
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        service.add_user_message('xin chào tôi tên là Long, tôi thích họp vào buổi sáng', 'bench')
+        for i in range(turns):
+            clock.advance(seconds=30)
+            service.add_user_message(f'thêm lịch họp dự án {i} lúc 9h ngày {i % 28 + 1} tháng 4', 'bench')
+            clock.advance(seconds=30)
+            service.add_assistant_message(
+                f'✅ Đã thêm lịch "Họp dự án {i}" vào 09:00 ngày {i % 28 + 1:02d}/04/2025.',
+                function_call={'name': 'smart_add_schedule', 'args': {
+                    'title': f'Họp dự án {i}', 'start_time': f'2025-04-{i % 28 + 1:02d}T09:00:00+07:00'}},
+                session_id='bench'
+            )
+    if service._summarizer is not None:
+        # Gộp nốt phần thread nền chưa kịp xử lý để số đo ổn định
+        service._summarizer.compact('bench')
+
+
+def measure(service: ConversationService, window: int, with_summary: bool, repeat: int):
+    def context():
+        parts = [service.get_summary_context('bench') if with_summary else '',
+                 service.get_recent_context('bench', window)]
+        return "\n\n".join(p for p in parts if p)
+
+    text = context()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        context()
+        timings.append(time.perf_counter() - started)
+    return text, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, window, max_history, with_summary in (
+        ('window=12', Config.CONTEXT_WINDOW_SIZE, Config.MAX_CONVERSATION_HISTORY, False),
+        ('window=50', 50, max(50, Config.MAX_CONVERSATION_HISTORY), False),
+        ('window=12+summary', Config.CONTEXT_WINDOW_SIZE, Config.MAX_CONVERSATION_HISTORY, True),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'schedule.db')
+            pool = SQLitePool(db_path)
+            service = ConversationService(db_path=db_path, max_history=max_history, pool=pool, write_behind=False)
+            if not with_summary:
+                service._summarizer = None
+            build_session(service, args.turns)
+            text, latency_ms = measure(service, window, with_summary, args.repeat)
+            print(f"{name:18s} chars={len(text):6d} ~tokens={len(text) // 4:5d} "
+                  f"p50={latency_ms:6.3f}ms name={'yes' if 'Long' in text else 'no'}")
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Đo thông lượng trích xuất thời gian (ScheduleAdvisor._extract_time) trên một tập câu mẫu.
+
+    python benchmarks/bench_time_matcher.py [--sentences 2000] [--passes 3]
+
+So sánh:
+- cascade: re.search lần lượt từng pattern (chuỗi chưa biên dịch) như trước thay đổi
+- matcher: pattern biên dịch sẵn + lọc theo literal, không cache
+- matcher+cache: như trên, cache LRU theo câu đã chuẩn hóa (mỗi câu được parse --passes lần,
+  giống advise / fallback / smart add cùng parse một câu trong một lượt)
+Cả ba đều parse bằng cùng các hàm trong time_patterns; kết quả được đối chiếu với cascade.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from utils.clock import FixedClock
+from utils.time_matcher import TimeExpressionMatcher
+from utils.timezone_utils import VIETNAM_TZ
+
+TASKS = ('họp team', 'đi khám bác sĩ', 'gọi cho khách hàng', 'nộp báo cáo', 'học tiếng Anh', 'đón con',
+         'ăn trưa với Long', 'review code dự án mới')
+TIMES = ('lúc 9h', 'vào 14:30', 'sáng mai', 'chiều thứ 6', 'thứ 3 tuần sau', '8h thứ 7 tuần này',
+         'ngày 15/11', 'sau 3 ngày', 'tuần sau', 'tối chủ nhật lúc 8h', 'hôm nay', '10 giờ 30 phút',
+         't5 lúc 16h', 'tháng sau', '', '', '')
+
+
+def sentences(count: int):
+    rng = random.Random(3)
+    return [f'{rng.choice(("tôi muốn", "nhắc tôi", "thêm lịch", "giúp tôi"))} {rng.choice(TASKS)} '
+            f'{rng.choice(TIMES)}'.strip() for _ in range(count)]
+
+
+def cascade(advisor: ScheduleAdvisor, text: str):
+    now = advisor.current_time
+    text_lower = text.lower()
+    for pattern, parser, _ in advisor.time_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            try:
+                result = parser(match, now)
+                if result:
+                    if result.tzinfo is None or result.tzinfo.utcoffset(result) is None:
+                        result = advisor.vietnam_tz.localize(result)
+                    if result > now:
+                        return result
+            except (ValueError, TypeError):
+                continue
+    return None
+
+
+def run(label: str, extract, texts, passes: int, expected=None):
+    started = time.perf_counter()
+    results = [extract(text) for _ in range(passes) for text in texts]
+    elapsed = time.perf_counter() - started
+    calls = len(texts) * passes
+    mismatches = 0 if expected is None else sum(a != b for a, b in zip(results, expected))
+    print(f"{label:14} calls={calls} throughput={calls / elapsed:10.0f}/s "
+          f"mean={elapsed / calls * 1e6:7.2f}us mismatches={mismatches}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', type=int, default=2000)
+    parser.add_argument('--passes', type=int, default=3)
+    args = parser.parse_args()
+
+    texts = sentences(args.sentences)
+    with tempfile.TemporaryDirectory() as tmp:
+        advisor = ScheduleAdvisor(db_path=os.path.join(tmp, 'schedule.db'),
+                                  clock=FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ)))
+        patterns = [(pattern, requires) for pattern, _, requires in advisor.time_patterns]
+
+        expected = run('cascade', lambda text: cascade(advisor, text), texts, args.passes)
+
+        advisor._time_matcher = TimeExpressionMatcher(patterns, cache_size=0)
+        run('matcher', advisor._extract_time, texts, args.passes, expected)
+
+        advisor._time_matcher = TimeExpressionMatcher(patterns)
+        run('matcher+cache', advisor._extract_time, texts, args.passes, expected)
+        print(f"stats          {advisor._time_matcher.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,36 +4,60 @@ from core.notification import get_notification_manager
 from core.services.ScheduleAdvisor import ScheduleAdvisor
 from core.services.gemini_service import GeminiService
 from core.services.conversation_service import ConversationService
+from core.services.ephemeral_sessions import EphemeralConversationService, is_ephemeral_session
 from core.config import Config
 from core.exceptions import GeminiAPIError
+import hashlib
+import itertools
+import json
 from datetime import datetime, timedelta
+from core.logger import get_logger, log_context
+from core.replay import get_turn_recorder
+from utils.clock import get_clock
+
+logger = get_logger(__name__)
 
 class AIAgent:
-    def __init__(self, session_id: str = 'default'):
+    def __init__(self, session_id: str = 'default', ephemeral: bool = False):
+        """ephemeral: giữ lịch sử trong bộ nhớ (không ghi đĩa); session có tiền tố tạm luôn là ephemeral."""
         self.session_id = session_id
         self.gemini_service = GeminiService()
         self.advisor = ScheduleAdvisor(llm=self.gemini_service)
         self.function_handler = FunctionCallHandler(self.advisor)
         self.functions = get_function_definitions()
         self.notification_manager = get_notification_manager()
-        self.conversation_service = ConversationService()
+        self._select_conversation_service(ephemeral)
 
         self._load_conversation_context()
 
+    def _select_conversation_service(self, ephemeral: bool = False):
+        self.ephemeral = ephemeral or is_ephemeral_session(self.session_id)
+        self.conversation_service = EphemeralConversationService() if self.ephemeral else ConversationService()
+
     def _load_conversation_context(self):
         """Load conversation context khi agent khởi động."""
+        restored = self.conversation_service.restore_session(self.session_id)
+        if restored:
+            logger.info("[AI Agent] Đã khôi phục %s tin nhắn lưu trữ của session %s", restored, self.session_id)
         stats = self.conversation_service.get_session_stats(self.session_id)
         if stats['total_messages'] > 0:
-            print(f"[AI Agent] Đã tải {stats['total_messages']} tin nhắn từ session trước")
+            logger.info("[AI Agent] Đã tải %s tin nhắn từ session trước", stats['total_messages'])
         else:
-            print(f"[AI Agent] Bắt đầu session mới: {self.session_id}")
+            logger.info("[AI Agent] Bắt đầu session mới: %s", self.session_id)
 
     async def process_user_input(self, user_input: str) -> str | dict[str, str]:
         """Main processing loop for user input."""
-        print(f"\n[Người dùng]: {user_input}")
-        print("---------------------------------")
-        print("[Hệ thống]: Đang xử lý yêu cầu...")
+        with log_context(session_id=self.session_id):
+            # Nội dung tin nhắn có thể chứa thông tin cá nhân: INFO chỉ ghi độ dài và hash ngắn
+            logger.info("Đang xử lý yêu cầu", extra={'input_chars': len(user_input),
+                                                     'input_hash': hashlib.sha256(user_input.encode()).hexdigest()[:12]})
+            logger.debug("Nội dung yêu cầu", extra={'user_input': user_input})
+            recorder = get_turn_recorder()
+            if recorder.enabled:
+                return await recorder.record(self, user_input, self._handle_user_input)
+            return await self._handle_user_input(user_input)
 
+    async def _handle_user_input(self, user_input: str) -> str | dict[str, str]:
         # 1. Lưu user input vào conversation history
         self.conversation_service.add_user_message(user_input, self.session_id)
 
@@ -125,7 +149,7 @@ class AIAgent:
             return error_msg
 
     def _build_system_prompt(self, user_input: str) -> str:
-        now = datetime.now()
+        now = get_clock().now()
         current_date = now.strftime('%Y-%m-%d')
         current_year = now.year
         current_weekday_index = now.weekday()
@@ -144,11 +168,8 @@ class AIAgent:
             days_to_add = (day_index - current_weekday_index + 7) % 7
             next_weekdays[day_name] = today + timedelta(days=days_to_add)
 
-        # Lấy conversation context
-        conversation_context = self.conversation_service.get_recent_context(
-            session_id=self.session_id, 
-            last_n_messages=Config.CONTEXT_WINDOW_SIZE
-        )
+        # Lấy conversation context: tóm tắt các lượt cũ + tin nhắn cũ liên quan + các lượt gần đây
+        conversation_context = self._conversation_context(user_input)
 
         return f"""QUAN TRỌNG: Hôm nay là {current_date} (Thứ {current_weekday_index + 1}) - NĂM {current_year} 🚨
 
@@ -212,52 +233,51 @@ class AIAgent:
 
         Yêu cầu hiện tại: {user_input}"""
 
+    def _conversation_context(self, user_input: str = None) -> str:
+        """
+        Hồ sơ người dùng, bản tóm tắt các lượt cũ (nếu có), các tin nhắn cũ liên quan tới
+        user_input (nếu có) rồi tới CONTEXT_WINDOW_SIZE tin nhắn gần nhất.
+        """
+        profile = self.conversation_service.get_profile_context(self.session_id)
+        summary = self.conversation_service.get_summary_context(self.session_id)
+        relevant = self.conversation_service.get_relevant_context(self.session_id, user_input) if user_input else ""
+        recent = self.conversation_service.get_recent_context(
+            session_id=self.session_id, 
+            last_n_messages=Config.CONTEXT_WINDOW_SIZE
+        )
+        return "\n\n".join(part for part in (profile, summary, relevant, recent) if part)
+
     def _can_answer_from_context(self, user_input: str) -> bool:
-        """Kiểm tra xem câu hỏi có thể trả lời từ context không."""
+        """Kiểm tra xem câu hỏi có thể trả lời từ hồ sơ người dùng không."""
         context_questions = [
             "biết tên tôi", "tên tôi là gì", "tôi tên gì", 
             "nhớ tên", "tên của tôi", "ai tôi là",
-            "nhớ kĩ tên", "hãy nhớ tên", "tên tôi là"
+            "nhớ kĩ tên", "hãy nhớ tên", "tên tôi là",
+            "email của tôi", "email tôi là gì"
         ]
         
         return any(q in user_input.lower() for q in context_questions)
 
     def _answer_from_context(self, user_input: str) -> str:
-        """Trả lời câu hỏi dựa trên context có sẵn."""
-        # Lấy context từ conversation history
-        context = self.conversation_service.get_recent_context(
-            session_id=self.session_id, 
-            last_n_messages=Config.CONTEXT_WINDOW_SIZE
-        )
+        """Trả lời câu hỏi về tên/email bằng hồ sơ người dùng (đã cập nhật cả từ câu hiện tại)."""
+        profile = self.conversation_service.get_profile(self.session_id)
+        name = profile['name']
+        lowered = user_input.lower()
         
         # Nếu user đang giới thiệu hoặc nhắc nhở về tên
-        if any(phrase in user_input.lower() for phrase in ["tên tôi là", "nhớ kĩ tên", "hãy nhớ tên"]):
-            import re
-            # Tìm tên trong câu hiện tại
-            name_match = re.search(r"tên (?:tôi là|là) (\w+)", user_input, re.IGNORECASE)
-            if name_match:
-                name = name_match.group(1)
-                return f"Dạ, tôi đã ghi nhớ tên của bạn là {name}! Rất vui được làm quen với bạn, {name}. Tôi có thể giúp gì về lập lịch cho bạn không?"
+        if any(phrase in lowered for phrase in ["tên tôi là", "nhớ kĩ tên", "hãy nhớ tên"]) and name:
+            return f"Dạ, tôi đã ghi nhớ tên của bạn là {name}! Rất vui được làm quen với bạn, {name}. Tôi có thể giúp gì về lập lịch cho bạn không?"
         
-        # Tìm tên trong context cho câu hỏi về tên
-        if "biết tên" in user_input.lower() or "tên tôi" in user_input.lower():
-            # Tìm pattern "tên là [Tên]" trong context
-            import re
-            name_patterns = [
-                r"tên (?:là|tôi là) (\w+)",
-                r"tôi (?:là|tên) (\w+)",
-                r"chào (?:tôi tên là|mình là) (\w+)",
-                r"nhớ (?:kĩ )?tên (?:tôi là|là) (\w+)"
-            ]
-            
-            for pattern in name_patterns:
-                matches = re.findall(pattern, context, re.IGNORECASE)
-                if matches:
-                    name = matches[-1]  # Lấy tên gần nhất
-                    return f"Dạ, tôi nhớ bạn tên là {name}! Bạn cần giúp gì về lập lịch không?"
-            
+        if "biết tên" in lowered or "tên tôi" in lowered:
+            if name:
+                return f"Dạ, tôi nhớ bạn tên là {name}! Bạn cần giúp gì về lập lịch không?"
             return "Xin lỗi, tôi chưa thấy bạn giới thiệu tên trong cuộc trò chuyện này. Bạn có thể cho tôi biết tên của bạn không?"
         
+        if "email" in lowered:
+            if profile['email']:
+                return f"Dạ, email nhận thông báo của bạn là {profile['email']}."
+            return "Tôi chưa có email nhận thông báo của bạn. Bạn có thể cho tôi biết địa chỉ email không?"
+        
         return None
 
     def _handle_direct_response(self, user_input: str) -> str:
@@ -269,47 +289,73 @@ class AIAgent:
         """Lấy lịch sử conversation của session hiện tại."""
         return self.conversation_service.get_conversation_history(self.session_id, limit)
     
+    def get_conversation_page(self, limit: int = None, after: str = None, before: str = None,
+                              newest: bool = False) -> dict:
+        """Một trang lịch sử theo cursor của session hiện tại."""
+        return self.conversation_service.get_history_page(self.session_id, limit, after, before, newest)
+    
     def clear_conversation_history(self) -> int:
         """Xóa toàn bộ lịch sử conversation của session hiện tại."""
         deleted_count = self.conversation_service.clear_session(self.session_id)
-        print(f"[AI Agent] Đã xóa {deleted_count} tin nhắn khỏi session {self.session_id}")
+        logger.info("[AI Agent] Đã xóa %s tin nhắn khỏi session %s", deleted_count, self.session_id)
         return deleted_count
     
     def get_conversation_stats(self) -> dict:
         """Lấy thống kê conversation của session hiện tại."""
         return self.conversation_service.get_session_stats(self.session_id)
     
-    def search_conversation(self, query: str, limit: int = 10) -> list:
+    def search_conversation(self, query: str, limit: int = 10, offset: int = 0) -> list:
         """Tìm kiếm trong lịch sử conversation."""
-        return self.conversation_service.search_conversations(query, self.session_id, limit)
+        return self.conversation_service.search_conversations(query, self.session_id, limit, offset)
     
     def switch_session(self, new_session_id: str):
         """Chuyển sang session khác."""
         old_session = self.session_id
         self.session_id = new_session_id
+        self._select_conversation_service(self.ephemeral and not is_ephemeral_session(old_session))
         self._load_conversation_context()
-        print(f"[AI Agent] Đã chuyển từ session '{old_session}' sang '{new_session_id}'")
+        logger.info("[AI Agent] Đã chuyển từ session '%s' sang '%s'", old_session, new_session_id)
+
+    def promote_session(self, target_session_id: str = None) -> int:
+        """Chuyển session tạm sang lưu bền (có thể đổi tên); trả về số message đã chép."""
+        if not self.ephemeral:
+            raise ValueError(f"Session '{self.session_id}' không phải session tạm")
+        persistent = ConversationService()
+        promoted = self.conversation_service.promote_session(self.session_id, persistent, target_session_id)
+        old_session = self.session_id
+        self.session_id = target_session_id or old_session
+        self.ephemeral = False
+        self.conversation_service = persistent
+        logger.info("[AI Agent] Đã chuyển %s tin nhắn của session tạm '%s' sang '%s'",
+                    promoted, old_session, self.session_id)
+        return promoted
     
     def export_conversation(self) -> str:
         """Export conversation history thành text."""
-        history = self.get_conversation_history()
-        if not history:
-            return "Chưa có lịch sử conversation nào."
-        
-        lines = []
-        lines.append(f"=== LỊCH SỬ CUỘC TRÒ CHUYỆN - SESSION: {self.session_id} ===")
-        lines.append("")
-        
-        for msg in history:
+        return "".join(self.iter_export('text'))
+    
+    def iter_export(self, format: str = 'text'):
+        """
+        Export lịch sử theo từng đoạn để stream: 'text' (giống export_conversation) hoặc
+        'ndjson' (mỗi dòng một message JSON). Lịch sử được đọc theo batch, không nạp cả session.
+        """
+        if format not in ('text', 'ndjson'):
+            raise ValueError(f"Định dạng export không hỗ trợ: {format}")
+        messages = self.conversation_service.iter_conversation(self.session_id)
+        if format == 'ndjson':
+            return (json.dumps(msg, ensure_ascii=False) + "\n" for msg in messages)
+        return self._iter_export_text(messages)
+    
+    def _iter_export_text(self, messages):
+        first = next(messages, None)
+        if first is None:
+            yield "Chưa có lịch sử conversation nào."
+            return
+        yield f"=== LỊCH SỬ CUỘC TRÒ CHUYỆN - SESSION: {self.session_id} ===\n"
+        for msg in itertools.chain((first,), messages):
             role = "Người dùng" if msg['role'] == 'user' else "Trợ lý"
-            timestamp = msg['created_at']
-            lines.append(f"[{timestamp}] {role}:")
-            lines.append(f"{msg['content']}")
-            
+            lines = ["", f"[{msg['created_at']}] {role}:", f"{msg['content']}"]
             if msg['function_call']:
                 func_name = msg['function_call'].get('name', 'Unknown')
                 lines.append(f"Function: {func_name}")
-            
-            lines.append("")
-        
-        return "\n".join(lines)
+            yield "\n".join(lines) + "\n"
@@ -13,6 +13,8 @@ class Config:
     # Database Settings
     DATABASE_PATH = 'database/schedule.db'
     CONNECTION_TIMEOUT = 10
+    DB_POOL_SIZE = 4  # số kết nối SQLite tối đa mỗi file DB
+    DB_CACHED_STATEMENTS = 128  # số prepared statement sqlite3 cache trên mỗi kết nối
     
     # Google Calendar
     GOOGLE_CREDENTIALS_PATH = os.getenv('GOOGLE_CREDENTIALS_PATH', 'core/OAuth/credentials.json')
@@ -37,6 +39,8 @@ class Config:
     DEFAULT_DURATION = 60
     TIMEZONE = 'Asia/Ho_Chi_Minh'  # Vietnam timezone
     TIMEZONE_OFFSET = '+07:00'     # GMT+7
+    TIME_MATCH_CACHE_SIZE = 2048  # số câu (đã chuẩn hóa) giữ kết quả so khớp pattern thời gian
+    AVAILABILITY_CACHE_DAYS = 400  # số ngày giữ mảng phút trống trong bộ nhớ (AvailabilityEngine)
     
     # Notification Settings
     SCAN_INTERVAL = 60  # seconds
@@ -45,3 +49,54 @@ class Config:
     # Conversation Settings
     MAX_CONVERSATION_HISTORY = 50  
     CONTEXT_WINDOW_SIZE = 12  
+    CONTEXT_CACHE_SESSIONS = 1000  # số session giữ ring context đã render trong bộ nhớ
+    SUMMARY_ENABLED = True  # gộp các message đã trượt khỏi cửa sổ context vào bản tóm tắt theo session
+    SUMMARY_EVERY = 10  # số message mới trước khi gộp ở thread nền
+    SUMMARY_USE_LLM = os.getenv('SUMMARY_USE_LLM', 'false').lower() == 'true'  # nhờ Gemini viết đoạn tóm tắt
+    SUMMARY_MAX_ITEMS = 5  # số sở thích / lịch giữ lại trong bản tóm tắt
+    SUMMARY_MAX_CHARS = 600  # độ dài tối đa đoạn tóm tắt do Gemini viết
+    PROFILE_TOP_ITEMS = 3  # số giờ hay đặt lịch / thời lượng thường dùng hiển thị trong hồ sơ người dùng
+    RETRIEVAL_ENABLED = True  # thêm các message cũ liên quan tới câu hỏi (ngoài cửa sổ context) vào prompt
+    RETRIEVAL_TOP_K = 3  # số message cũ liên quan tối đa
+    RETRIEVAL_MIN_SCORE = 0.25  # độ tương đồng cosine tối thiểu để coi là liên quan
+    RETRIEVAL_DIM = 256  # số chiều vector n-gram băm
+    RETRIEVAL_SESSIONS = 200  # số session giữ chỉ mục vector trong bộ nhớ
+    HISTORY_TRIM_SLACK = 0.2  # cho phép vượt MAX_CONVERSATION_HISTORY 20% rồi mới cắt một lần
+    HISTORY_SEARCH_SNIPPET_TOKENS = 12  # số token tối đa trong snippet kết quả tìm kiếm
+    HISTORY_WRITE_BEHIND = os.getenv('HISTORY_WRITE_BEHIND', 'false').lower() == 'true'  # ghi lịch sử hội thoại theo batch ở thread nền
+    HISTORY_FLUSH_INTERVAL = 0.5  # seconds; thời gian tối đa một message nằm trong bộ đệm write-behind
+    HISTORY_FLUSH_MAX_BATCH = 200  # số message trong bộ đệm để flush ngay không chờ hết interval
+    HISTORY_PAGE_SIZE = 50  # số message mặc định mỗi trang lịch sử (phân trang theo cursor)
+    HISTORY_PAGE_MAX = 500  # giới hạn trên của limit mỗi trang
+    HISTORY_EXPORT_BATCH = 500  # số message đọc mỗi lần khi stream export
+    # Lưu trữ session không hoạt động quá số ngày này (chuyển lịch sử, tóm tắt, hồ sơ ra file gzip
+    # rồi xóa khỏi DB). Mặc định 0: tắt; bật bằng biến môi trường, vd: HISTORY_RETENTION_DAYS=90
+    HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '0'))
+    HISTORY_RETENTION_INTERVAL = 3600  # seconds; chu kỳ quét session hết hạn
+    HISTORY_ARCHIVE_DIR = os.getenv('HISTORY_ARCHIVE_DIR', 'database/archive')
+    HISTORY_ARCHIVE_BATCH = 500  # số message mỗi transaction khi xóa/khôi phục
+    EPHEMERAL_SESSION_PREFIXES = tuple(p for p in os.getenv('EPHEMERAL_SESSION_PREFIXES', 'guest-,anon-').split(',') if p)  # session tạm: chỉ giữ trong bộ nhớ
+    EPHEMERAL_MAX_SESSIONS = 1000  # số session tạm tối đa; vượt thì bỏ session ít hoạt động nhất
+    
+    # Admin / Diagnostics Settings
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # /admin yêu cầu header X-Admin-Token khớp; chưa thiết lập thì /admin bị tắt
+    PROFILER_SAMPLE_INTERVAL = 0.005  # seconds giữa 2 lần lấy mẫu
+    PROFILER_MIN_INTERVAL = 0.001  # seconds; khoảng lấy mẫu nhỏ nhất cho phép (nhỏ hơn sẽ chiếm trọn một core)
+    PROFILER_MAX_SECONDS = 120  # thời lượng tối đa của một phiên profiling
+    LOOP_LAG_INTERVAL = 0.1  # seconds giữa 2 lần đo độ trễ event loop
+    LOOP_LAG_THRESHOLD = 0.25  # seconds; vượt ngưỡng sẽ chụp stack coroutine đang chặn
+    MEMORY_TRACE_FRAMES = 10  # số frame tracemalloc lưu cho mỗi lần cấp phát
+    MEMORY_MAX_SNAPSHOTS = 5  # số snapshot tracemalloc giữ lại trong bộ nhớ
+    USAGE_FLUSH_EVERY = 20  # số lượt gọi LLM gom lại trước khi ghi thống kê xuống DB
+    USAGE_FLUSH_INTERVAL = 60  # seconds; ghi thống kê ít nhất mỗi khoảng này nếu có lượt gọi mới
+    
+    # Logging Settings
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_MODULE_LEVELS = os.getenv('LOG_MODULE_LEVELS', '')  # vd: "core.services=DEBUG,core.notification=WARNING"
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' hoặc 'text'
+    LOG_DEBUG_SAMPLE_EVERY = 10  # chỉ ghi 1/N log DEBUG lặp lại cùng một message
+    
+    # Record & Replay Settings
+    REPLAY_RECORD = os.getenv('REPLAY_RECORD', 'false').lower() == 'true'  # ghi lại các lượt hội thoại để replay
+    REPLAY_RECORD_DIR = os.getenv('REPLAY_RECORD_DIR', 'recordings')
+    REPLAY_SNAPSHOT_DAYS = 60  # số ngày lịch phía trước được chụp vào mỗi lượt ghi
@@ -1,24 +1,47 @@
-from fastapi import HTTPException
+import secrets
+
+from fastapi import HTTPException, Header
+from typing import Optional
 from core.ai_agent import AIAgent
 from core.exceptions import GeminiAPIError
+from core.config import Config
 
 _ai_agent_instances = {}
 
-def get_ai_agent(session_id: str = "default"):
-    """Lấy hoặc tạo một instance của AIAgent cho session_id cụ thể."""
+def get_ai_agent(session_id: str = "default", ephemeral: bool = False):
+    """
+    Lấy hoặc tạo một instance của AIAgent cho session_id cụ thể.
+    ephemeral chỉ có tác dụng khi tạo agent mới (session tạm, không ghi đĩa).
+    """
     global _ai_agent_instances
     
     if session_id not in _ai_agent_instances:
         try:
-            _ai_agent_instances[session_id] = AIAgent(session_id=session_id)
+            _ai_agent_instances[session_id] = AIAgent(session_id=session_id, ephemeral=ephemeral)
         except GeminiAPIError as e:
             raise HTTPException(status_code=500, detail=f"Lỗi khởi tạo AI Agent: {e}")
     
     return _ai_agent_instances[session_id]
 
+def promote_ai_agent(session_id: str, target_session_id: Optional[str] = None) -> int:
+    """Chuyển session tạm sang lưu bền và đổi khóa cache của agent nếu đổi tên session."""
+    agent = get_ai_agent(session_id)
+    promoted = agent.promote_session(target_session_id)
+    if agent.session_id != session_id:
+        _ai_agent_instances.pop(session_id, None)
+        _ai_agent_instances[agent.session_id] = agent
+    return promoted
+
 def clear_ai_agent_cache():
     """Xóa cache của tất cả AI Agent instances."""
     global _ai_agent_instances
     count = len(_ai_agent_instances)
     _ai_agent_instances.clear()
-    return count
\ No newline at end of file
+    return count
+
+def require_admin(x_admin_token: Optional[str] = Header(None, alias="x-admin-token")):
+    """Chặn các endpoint /admin: chưa thiết lập ADMIN_TOKEN thì tắt hẳn, header không khớp thì 403."""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Chưa thiết lập ADMIN_TOKEN, các endpoint /admin bị tắt")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), Config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token không hợp lệ")
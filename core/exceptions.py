@@ -22,3 +22,8 @@ class GoogleCalendarError(AIAgentException):
 class ValidationError(AIAgentException):
     """Input validation errors"""
     pass
+
+
+class ProfilerBusyError(AIAgentException):
+    """A profiling session is already running"""
+    pass
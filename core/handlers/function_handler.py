@@ -7,6 +7,9 @@ from core.services.ScheduleAdvisor import ScheduleAdvisor
 from core.services.ExecuteSchedule import ExecuteSchedule
 from core.notification import get_notification_manager
 from core.services.gemini_service import GeminiService
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 class FunctionCallHandler:
     def __init__(self, advisor: ScheduleAdvisor = None):
@@ -70,7 +73,7 @@ class FunctionCallHandler:
         """
         try:
             # Gọi LLM để có phản hồi chỉ text
-            response = self.agent.get_ai_response(prompt)
+            response = self.agent.get_ai_response(prompt, feature='greeting')
             text_response = self.agent.format_response(response)
             return text_response or "Chào bạn, tôi có thể giúp gì cho bạn?"
         except Exception as e:
@@ -88,7 +91,7 @@ class FunctionCallHandler:
         """
         try:
             # Gọi LLM để có phản hồi chỉ text
-            response = self.agent.get_ai_response(prompt)
+            response = self.agent.get_ai_response(prompt, feature='off_topic')
             text_response = self.agent.format_response(response)
             return text_response or "Xin lỗi, tôi chỉ có thể hỗ trợ các vấn đề liên quan đến lịch trình."
         except Exception as e:
@@ -108,7 +111,7 @@ class FunctionCallHandler:
             if intelligent_response and len(intelligent_response.strip()) > 0:
                 return intelligent_response
         except Exception as e:
-            print(f"Lỗi khi sử dụng tư vấn thông minh: {e}")
+            logger.warning("Lỗi khi sử dụng tư vấn thông minh: %s", e)
         
         # Fallback về phương thức truyền thống
         preferred_time_of_day = args.get('preferred_time_of_day')
@@ -0,0 +1,201 @@
+# Logging có cấu trúc, ghi bất đồng bộ qua queue
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from core.config import Config
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+_session_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('session_id', default=None)
+
+# Các thuộc tính chuẩn của LogRecord, phần còn lại là dữ liệu `extra=` của người gọi
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def get_session_id() -> Optional[str]:
+    return _session_id.get()
+
+
+@contextmanager
+def log_context(request_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Gắn request_id/session_id cho mọi log record phát ra trong khối with."""
+    tokens = []
+    if request_id is not None:
+        tokens.append((_request_id, _request_id.set(request_id)))
+    if session_id is not None:
+        tokens.append((_session_id, _session_id.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Gắn request_id/session_id vào record ngay trên thread phát log."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.session_id = _session_id.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Chỉ giữ 1/N record DEBUG cho mỗi (logger, message template) để các sự kiện
+    tần suất cao như lỗi parse thời gian không làm ngập log.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+_exception_formatter = logging.Formatter()
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler giữ traceback ở record.exc_text thay vì gộp vào msg như bản chuẩn,
+    để formatter phía listener tách được trường 'exc'.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        if record.stack_info:
+            payload['stack'] = record.stack_info
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [req=%(request_id)s session=%(session_id)s] %(message)s')
+
+
+def _parse_module_levels(spec: str) -> Dict[str, str]:
+    """'core.services=DEBUG,core.notification=WARNING' -> {tên logger: level}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, module_levels: Optional[str] = None,
+                  fmt: Optional[str] = None, debug_sample_every: Optional[int] = None) -> None:
+    """
+    Cấu hình root logger: QueueHandler trên hot path, một QueueListener chạy nền
+    ghi ra stdout. Gọi nhiều lần an toàn (chỉ cấu hình một lần).
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        queue_handler = StructuredQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(DebugSamplingFilter(debug_sample_every or Config.LOG_DEBUG_SAMPLE_EVERY))
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        use_json = (fmt or Config.LOG_FORMAT) == 'json'
+        stream_handler.setFormatter(JsonFormatter() if use_json else TextFormatter())
+
+        root = logging.getLogger()
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+        root.addHandler(queue_handler)
+        for name, module_level in _parse_module_levels(module_levels or Config.LOG_MODULE_LEVELS).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Dừng thread ghi log sau khi đã xả hết queue."""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+class RequestContextMiddleware:
+    """ASGI middleware gắn request_id (X-Request-ID hoặc sinh mới) và session_id cho log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers') or [])
+        request_id = headers.get(b'x-request-id', b'').decode('latin-1') or uuid.uuid4().hex[:12]
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        session_id = query.get('session_id', [None])[0]
+        with log_context(request_id=request_id, session_id=session_id):
+            await self.app(scope, receive, send)
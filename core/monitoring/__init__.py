@@ -0,0 +1,6 @@
+from .profiler import get_profiler, ProfilerMiddleware
+from .loop_monitor import get_loop_monitor
+from .memory import get_memory_profiler, collect_resource_gauges
+from .usage import get_usage_tracker, close_usage_tracker
+
+__all__ = ['get_profiler', 'ProfilerMiddleware', 'get_loop_monitor', 'get_memory_profiler', 'collect_resource_gauges', 'get_usage_tracker', 'close_usage_tracker']
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from core.config import Config
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Thư mục gốc của ứng dụng, dùng để nhận diện frame thuộc code của app
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_APP_PACKAGES = tuple(os.path.join(_APP_ROOT, pkg) + os.sep for pkg in ('core', 'utils'))
+_MONITORING_PACKAGE = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# Các bucket (giây) của histogram độ trễ event loop
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LagHistogram:
+    """Histogram tích lũy kiểu Prometheus cho độ trễ event loop (giây)."""
+
+    def __init__(self, buckets=LAG_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # phần tử cuối là +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        value = max(0.0, value)
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bound, c in zip(self.buckets + (float('inf'),), self.counts):
+                running += c
+                cumulative.append({'le': '+Inf' if bound == float('inf') else bound, 'count': running})
+            return {
+                'buckets': cumulative,
+                'count': self.count,
+                'sum': round(self.sum, 6),
+                'max': round(self.max, 6),
+                'avg': round(self.sum / self.count, 6) if self.count else 0.0
+            }
+
+    def to_prometheus(self, name: str) -> str:
+        snap = self.snapshot()
+        lines = [f"# TYPE {name} histogram"]
+        for bucket in snap['buckets']:
+            lines.append(f'{name}_bucket{{le="{bucket["le"]}"}} {bucket["count"]}')
+        lines.append(f"{name}_sum {snap['sum']}")
+        lines.append(f"{name}_count {snap['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class EventLoopMonitor:
+    """
+    Đo độ trễ event loop liên tục bằng một coroutine ngủ theo chu kỳ.
+    Một thread watchdog phát hiện khi loop bị chặn quá ngưỡng và chụp stack
+    của thread chạy loop để biết hàm nào của app đang giữ loop.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None, max_reports: int = 50):
+        self.interval = interval or Config.LOOP_LAG_INTERVAL
+        self.threshold = threshold or Config.LOOP_LAG_THRESHOLD
+        self.histogram = LagHistogram()
+        self.blocking_reports: deque = deque(maxlen=max_reports)
+        self.is_running = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._probe_task: Optional[asyncio.Task] = None
+        self._watchdog_thread: Optional[threading.Thread] = None
+        self._last_tick = 0.0
+        self._reported_tick: Optional[float] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> bool:
+        if self.is_running:
+            return True
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self.is_running = True
+        self._probe_task = self._loop.create_task(self._probe())
+        self._watchdog_thread = threading.Thread(target=self._watchdog, daemon=True, name="LoopLagWatchdog")
+        self._watchdog_thread.start()
+        return True
+
+    def stop(self) -> bool:
+        if not self.is_running:
+            return True
+        self.is_running = False
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+        if self._watchdog_thread and self._watchdog_thread.is_alive():
+            self._watchdog_thread.join(timeout=2)
+        return True
+
+    async def _probe(self):
+        while self.is_running:
+            start = time.perf_counter()
+            self._last_tick = start
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(time.perf_counter() - start - self.interval)
+
+    def _watchdog(self):
+        check_every = max(self.threshold / 4, 0.01)
+        while self.is_running:
+            time.sleep(check_every)
+            tick = self._last_tick
+            stalled = time.perf_counter() - tick - self.interval
+            if stalled >= self.threshold and self._reported_tick != tick:
+                self._reported_tick = tick
+                self._report_blocking(stalled)
+
+    def _report_blocking(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        app_frames = _app_frames(frame)
+        culprit = app_frames[0] if app_frames else _describe_frame(frame)
+        report = {
+            'detected_at': time.time(),
+            'stalled_ms': round(stalled * 1000, 1),
+            'app_function': culprit,
+            'app_stack': app_frames,
+            'innermost_frame': _describe_frame(frame)
+        }
+        self.blocking_reports.append(report)
+        logger.warning("[LoopMonitor] Event loop bị chặn %sms tại %s", report['stalled_ms'], culprit,
+                       extra={'app_stack': app_frames})
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'is_running': self.is_running,
+            'interval': self.interval,
+            'threshold': self.threshold,
+            'lag_seconds': self.histogram.snapshot(),
+            'blocking_reports': list(self.blocking_reports)
+        }
+
+
+def _describe_frame(frame) -> str:
+    code = frame.f_code
+    try:
+        filename = os.path.relpath(code.co_filename, _APP_ROOT)
+    except ValueError:
+        filename = code.co_filename
+    return f"{filename}:{frame.f_lineno} {getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _app_frames(frame) -> List[str]:
+    """Các frame thuộc core/ và utils/, từ trong ra ngoài (frame đầu tiên là hàm đang chặn)."""
+    frames = []
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_PACKAGES) and not filename.startswith(_MONITORING_PACKAGE):
+            frames.append(_describe_frame(frame))
+        frame = frame.f_back
+    return frames
+
+
+_loop_monitor = None
+
+def get_loop_monitor() -> EventLoopMonitor:
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = EventLoopMonitor()
+    return _loop_monitor
@@ -0,0 +1,181 @@
+import gc
+import os
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from core.config import Config
+
+
+class MemoryProfiler:
+    """
+    Bọc tracemalloc để chụp snapshot theo tên và so sánh giữa các snapshot.
+    tracemalloc chỉ được bật khi cần vì nó làm chậm mọi lần cấp phát bộ nhớ.
+    """
+
+    def __init__(self, max_snapshots: int = None):
+        self.max_snapshots = max_snapshots or Config.MEMORY_MAX_SNAPSHOTS
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = None) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or Config.MEMORY_TRACE_FRAMES)
+        return self.get_status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.get_status()
+
+    def take_snapshot(self, name: Optional[str] = None) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc chưa được bật, gọi start trước")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        name = name or f"snap-{int(time.time() * 1000)}"
+        entry = {
+            'name': name,
+            'taken_at': time.time(),
+            'snapshot': snapshot,
+            'total_bytes': sum(stat.size for stat in snapshot.statistics('filename')),
+        }
+        with self._lock:
+            self._snapshots[name] = entry
+            self._snapshots.move_to_end(name)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return _describe_snapshot(entry)
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [_describe_snapshot(entry) for entry in self._snapshots.values()]
+
+    def top(self, name: str, limit: int = 20, group_by: str = 'lineno') -> List[Dict[str, Any]]:
+        snapshot = self._get(name)['snapshot']
+        return [_format_stat(stat) for stat in snapshot.statistics(group_by)[:limit]]
+
+    def diff(self, base: str, target: Optional[str] = None, limit: int = 20,
+             group_by: str = 'lineno') -> Dict[str, Any]:
+        """So sánh snapshot `base` với `target` (hoặc một snapshot mới nếu không chỉ định)."""
+        base_entry = self._get(base)
+        target_entry = self._get(target) if target else self._get(self.take_snapshot()['name'])
+        stats = target_entry['snapshot'].compare_to(base_entry['snapshot'], group_by)
+        return {
+            'base': base_entry['name'],
+            'target': target_entry['name'],
+            'total_diff_bytes': target_entry['total_bytes'] - base_entry['total_bytes'],
+            'top': [_format_stat(stat) for stat in stats[:limit]]
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'traced_current_bytes': current,
+            'traced_peak_bytes': peak,
+            'snapshots': self.list_snapshots()
+        }
+
+    def _get(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._snapshots.get(name)
+        if entry is None:
+            raise KeyError(f"Không tìm thấy snapshot: {name}")
+        return entry
+
+
+def _describe_snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {'name': entry['name'], 'taken_at': entry['taken_at'], 'total_bytes': entry['total_bytes']}
+
+
+def _format_stat(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    result = {
+        'location': f"{frame.filename}:{frame.lineno}",
+        'size_bytes': stat.size,
+        'count': stat.count
+    }
+    if hasattr(stat, 'size_diff'):
+        result['size_diff_bytes'] = stat.size_diff
+        result['count_diff'] = stat.count_diff
+    return result
+
+
+def _open_file_descriptors() -> Optional[List[str]]:
+    """Danh sách đích của các file descriptor đang mở (chỉ hỗ trợ Linux /proc)."""
+    fd_dir = '/proc/self/fd'
+    if not os.path.isdir(fd_dir):
+        return None
+    targets = []
+    for fd in os.listdir(fd_dir):
+        try:
+            targets.append(os.readlink(os.path.join(fd_dir, fd)))
+        except OSError:
+            continue
+    return targets
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def collect_resource_gauges(include_gc_objects: bool = False) -> Dict[str, Any]:
+    """
+    Các gauge cho server chạy lâu: số AIAgent đang cache, thread, kết nối sqlite,
+    socket và bộ nhớ. Dùng cho endpoint /admin/gauges và soak test.
+    """
+    from core.dependencies import _ai_agent_instances
+
+    threads = threading.enumerate()
+    # Gom nhóm theo tên (bỏ số thứ tự) để thấy thread nào bị rò, vd: "Thread-N (_call_gemini_api)"
+    thread_groups = Counter(re.sub(r'-\d+', '-N', t.name) for t in threads)
+
+    fds = _open_file_descriptors()
+    sqlite_files = None
+    sockets = None
+    if fds is not None:
+        sqlite_files = Counter(
+            os.path.basename(target) for target in fds
+            if target.endswith(('.db', '.sqlite', '.sqlite3'))
+        )
+        sockets = sum(1 for target in fds if target.startswith('socket:'))
+
+    return {
+        'live_agents': len(_ai_agent_instances),
+        'threads': len(threads),
+        'thread_groups': dict(thread_groups),
+        'open_fds': len(fds) if fds is not None else None,
+        'sqlite_connections': sum(sqlite_files.values()) if sqlite_files is not None else None,
+        'sqlite_connections_by_file': dict(sqlite_files) if sqlite_files is not None else None,
+        'sockets': sockets,
+        'rss_bytes': _rss_bytes(),
+        'traced_memory_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        # Đếm object của gc tốn vài ms nên chỉ làm khi được yêu cầu
+        'gc_objects': len(gc.get_objects()) if include_gc_objects else None
+    }
+
+
+_memory_profiler = None
+
+def get_memory_profiler() -> MemoryProfiler:
+    global _memory_profiler
+    if _memory_profiler is None:
+        _memory_profiler = MemoryProfiler()
+    return _memory_profiler
@@ -0,0 +1,198 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from core.config import Config
+from core.exceptions import ProfilerBusyError
+
+
+class ProfileSession:
+    """
+    Một phiên lấy mẫu stack của toàn bộ thread trong process.
+    - mode 'duration': lấy mẫu liên tục trong N giây
+    - mode 'requests': chỉ lấy mẫu khi có request của route đang xử lý, dừng sau N request
+    """
+
+    def __init__(self, mode: str, seconds: Optional[float] = None, route: Optional[str] = None,
+                 request_count: Optional[int] = None, interval: float = None, timeout: float = None):
+        self.mode = mode
+        self.seconds = seconds
+        self.route = route
+        self.request_count = request_count
+        self.interval = max(interval or Config.PROFILER_SAMPLE_INTERVAL, Config.PROFILER_MIN_INTERVAL)
+        self.timeout = min(timeout or Config.PROFILER_MAX_SECONDS, Config.PROFILER_MAX_SECONDS)
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+        self._inflight = 0
+        self._completed_requests = 0
+        self._counter_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SamplingProfiler")
+
+    # ------------- Lifecycle -------------
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    # ------------- Request tracking (mode 'requests') -------------
+    def matches(self, path: str) -> bool:
+        return self.mode == 'requests' and not self._stop.is_set() and path == self.route
+
+    def request_started(self):
+        with self._counter_lock:
+            self._inflight += 1
+
+    def request_finished(self):
+        with self._counter_lock:
+            self._inflight -= 1
+            self._completed_requests += 1
+            if self._completed_requests >= self.request_count:
+                self._stop.set()
+
+    # ------------- Sampling -------------
+    def _run(self):
+        deadline = self.started_at + (self.seconds if self.mode == 'duration' else self.timeout)
+        own_ident = threading.get_ident()
+        try:
+            while not self._stop.is_set() and time.time() < deadline:
+                if self.mode == 'duration' or self._inflight > 0:
+                    self._sample_once(own_ident)
+                time.sleep(self.interval)
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    def _sample_once(self, own_ident: int):
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_format_frame(frame))
+                frame = frame.f_back
+            stack.append(f"thread:{thread_names.get(ident, ident)}")
+            stack.reverse()
+            self.samples[';'.join(stack)] += 1
+        self.sample_count += 1
+
+    def to_collapsed(self) -> str:
+        """Xuất theo định dạng collapsed-stack (flamegraph.pl, speedscope, inferno)."""
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            'mode': self.mode,
+            'route': self.route,
+            'samples': self.sample_count,
+            'unique_stacks': len(self.samples),
+            'completed_requests': self._completed_requests,
+            'elapsed_seconds': round((self.finished_at or time.time()) - self.started_at, 3)
+        }
+
+
+def _format_frame(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    try:
+        filename = os.path.relpath(filename)
+    except ValueError:
+        pass
+    # ';' là ký tự phân tách frame trong định dạng collapsed
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu theo yêu cầu. Khi rảnh không có thread nào chạy,
+    middleware chỉ kiểm tra một thuộc tính nên chi phí gần như bằng 0.
+    Chỉ cho phép một phiên tại một thời điểm để các phiên không làm nhiễu nhau.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session: Optional[ProfileSession] = None
+
+    @property
+    def active_session(self) -> Optional[ProfileSession]:
+        session = self._session
+        if session is None or session.finished:
+            return None
+        return session
+
+    def start(self, mode: str, seconds: Optional[float] = None, route: Optional[str] = None,
+              request_count: Optional[int] = None, interval: Optional[float] = None,
+              timeout: Optional[float] = None) -> ProfileSession:
+        if mode == 'duration':
+            if not seconds or seconds <= 0 or seconds > Config.PROFILER_MAX_SECONDS:
+                raise ValueError(f"seconds phải nằm trong (0, {Config.PROFILER_MAX_SECONDS}]")
+        elif mode == 'requests':
+            if not route or not request_count or request_count <= 0:
+                raise ValueError("Cần route và request_count > 0")
+        else:
+            raise ValueError(f"mode không hợp lệ: {mode}")
+        if timeout is not None and (timeout <= 0 or timeout > Config.PROFILER_MAX_SECONDS):
+            raise ValueError(f"timeout phải nằm trong (0, {Config.PROFILER_MAX_SECONDS}]")
+        if interval is not None and interval < Config.PROFILER_MIN_INTERVAL:
+            raise ValueError(f"interval phải >= {Config.PROFILER_MIN_INTERVAL * 1000:g} ms")
+
+        with self._lock:
+            if self.active_session is not None:
+                raise ProfilerBusyError("Đang có một phiên profiling khác chạy")
+            session = ProfileSession(mode, seconds=seconds, route=route, request_count=request_count,
+                                     interval=interval, timeout=timeout)
+            self._session = session
+            session.start()
+        return session
+
+    def session_for_path(self, path: str) -> Optional[ProfileSession]:
+        session = self._session
+        if session is not None and session.matches(path):
+            return session
+        return None
+
+
+class ProfilerMiddleware:
+    """ASGI middleware đếm các request của route đang được profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = None
+        if scope['type'] == 'http':
+            session = get_profiler().session_for_path(scope['path'])
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+        session.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.request_finished()
+
+
+_profiler = None
+
+def get_profiler() -> SamplingProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,254 @@
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pytz
+
+from core.config import Config
+from core.logger import get_logger, get_session_id
+
+logger = get_logger(__name__)
+
+# Các cột số được cộng dồn trong mỗi bucket (giờ, session, feature, model)
+_COUNTERS = ('calls', 'errors', 'prompt_tokens', 'response_tokens', 'latency_ms_total')
+_GROUP_COLUMNS = {
+    'session': 'session_id',
+    'feature': 'feature',
+    'hour': 'hour',
+    'model': 'model',
+}
+
+
+class UsageTracker:
+    """
+    Thống kê lượt gọi Gemini theo giờ, session, feature và model.
+    Mỗi lần gọi chỉ cộng vào một bucket trong bộ nhớ; một thread nền ghi các bucket
+    xuống bảng llm_usage_hourly theo lô (upsert) khi đủ flush_every lượt hoặc sau
+    flush_interval giây, nên hot path không chạm SQLite.
+    """
+
+    def __init__(self, db_path: str = None, flush_every: int = None, flush_interval: float = None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.flush_every = flush_every or Config.USAGE_FLUSH_EVERY
+        self.flush_interval = flush_interval or Config.USAGE_FLUSH_INTERVAL
+        self.vietnam_tz = pytz.timezone(Config.TIMEZONE)
+        self._pending: Dict[tuple, Dict[str, float]] = {}
+        self._pending_calls = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._create_table()
+
+    def _create_table(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_usage_hourly (
+                    hour TEXT NOT NULL,  -- 'YYYY-MM-DD HH:00' theo giờ Việt Nam
+                    session_id TEXT NOT NULL,
+                    feature TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    response_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency_ms_total REAL NOT NULL DEFAULT 0,
+                    latency_ms_max REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour, session_id, feature, model)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_llm_usage_session_hour
+                ON llm_usage_hourly(session_id, hour)
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record(self, feature: str, model: str, latency: float, response: Any = None,
+               error: bool = False, session_id: Optional[str] = None):
+        """Ghi nhận một lần gọi LLM; session_id mặc định lấy từ log context của lượt hiện tại."""
+        prompt_tokens, response_tokens = _token_counts(response)
+        hour = datetime.now(self.vietnam_tz).strftime('%Y-%m-%d %H:00')
+        key = (hour, session_id or get_session_id() or 'unknown', feature, model)
+        latency_ms = latency * 1000
+
+        with self._lock:
+            bucket = self._pending.get(key)
+            if bucket is None:
+                bucket = self._pending[key] = dict.fromkeys(_COUNTERS + ('latency_ms_max',), 0)
+            bucket['calls'] += 1
+            bucket['errors'] += 1 if error else 0
+            bucket['prompt_tokens'] += prompt_tokens
+            bucket['response_tokens'] += response_tokens
+            bucket['latency_ms_total'] += latency_ms
+            bucket['latency_ms_max'] = max(bucket['latency_ms_max'], latency_ms)
+            self._pending_calls += 1
+            full = self._pending_calls >= self.flush_every
+
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if full:
+            self._wakeup.set()
+
+    def start(self):
+        if self._stopped.is_set() or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="UsageFlush")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("[Usage] Lỗi thread ghi thống kê: %s", e)
+
+    def close(self):
+        """Dừng thread nền và ghi nốt các bucket còn lại (gọi khi tắt ứng dụng)."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=Config.CONNECTION_TIMEOUT)
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Ghi các bucket đang chờ xuống SQLite, trả về số bucket đã ghi."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_calls = 0
+            if not pending:
+                return 0
+            rows = [key + tuple(b[c] for c in _COUNTERS) + (b['latency_ms_max'],) for key, b in pending.items()]
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=Config.CONNECTION_TIMEOUT)
+                try:
+                    conn.executemany('''
+                        INSERT INTO llm_usage_hourly
+                            (hour, session_id, feature, model, calls, errors, prompt_tokens,
+                             response_tokens, latency_ms_total, latency_ms_max)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (hour, session_id, feature, model) DO UPDATE SET
+                            calls = calls + excluded.calls,
+                            errors = errors + excluded.errors,
+                            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                            response_tokens = response_tokens + excluded.response_tokens,
+                            latency_ms_total = latency_ms_total + excluded.latency_ms_total,
+                            latency_ms_max = MAX(latency_ms_max, excluded.latency_ms_max)
+                    ''', rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.error("[Usage] Không ghi được thống kê LLM: %s", e)
+                self._restore(pending)
+                return 0
+            return len(rows)
+
+    def _restore(self, pending: Dict[tuple, Dict[str, float]]):
+        """Trả các bucket ghi lỗi về hàng chờ để lần flush sau thử lại."""
+        with self._lock:
+            for key, old in pending.items():
+                bucket = self._pending.setdefault(key, dict.fromkeys(_COUNTERS + ('latency_ms_max',), 0))
+                for column in _COUNTERS:
+                    bucket[column] += old[column]
+                bucket['latency_ms_max'] = max(bucket['latency_ms_max'], old['latency_ms_max'])
+                self._pending_calls += int(old['calls'])
+
+    def summary(self, group_by: str = 'session', session_id: Optional[str] = None,
+                feature: Optional[str] = None, since: Optional[str] = None,
+                until: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Tổng hợp usage theo session, feature, hour hoặc model.
+        since/until là mốc giờ dạng 'YYYY-MM-DD HH:00' (hoặc tiền tố 'YYYY-MM-DD').
+        """
+        column = _GROUP_COLUMNS.get(group_by)
+        if column is None:
+            raise ValueError(f"group_by phải là một trong: {', '.join(_GROUP_COLUMNS)}")
+        self.flush()
+
+        conditions, params = [], []
+        if session_id:
+            conditions.append('session_id = ?')
+            params.append(session_id)
+        if feature:
+            conditions.append('feature = ?')
+            params.append(feature)
+        if since:
+            conditions.append('hour >= ?')
+            params.append(since)
+        if until:
+            conditions.append('hour < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'hour DESC' if group_by == 'hour' else 'total_tokens DESC'
+
+        conn = sqlite3.connect(self.db_path, timeout=Config.CONNECTION_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(f'''
+                SELECT {column} AS key,
+                       SUM(calls) AS calls,
+                       SUM(errors) AS errors,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(response_tokens) AS response_tokens,
+                       SUM(prompt_tokens + response_tokens) AS total_tokens,
+                       SUM(latency_ms_total) AS latency_ms_total,
+                       MAX(latency_ms_max) AS latency_ms_max
+                FROM llm_usage_hourly
+                {where}
+                GROUP BY {column}
+                ORDER BY {order}
+                LIMIT ?
+            ''', params + [limit]).fetchall()
+        finally:
+            conn.close()
+
+        result = []
+        for row in rows:
+            item = dict(row)
+            item[group_by] = item.pop('key')
+            item['latency_ms_avg'] = round(item.pop('latency_ms_total') / item['calls'], 1) if item['calls'] else 0.0
+            item['latency_ms_max'] = round(item['latency_ms_max'], 1)
+            result.append(item)
+        return result
+
+
+def _token_counts(response: Any) -> tuple:
+    """Lấy số token prompt/response từ usage_metadata của phản hồi Gemini (0 nếu không có)."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return 0, 0
+    return (getattr(usage, 'prompt_token_count', 0) or 0,
+            getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+_usage_tracker = None
+_usage_tracker_lock = threading.Lock()
+
+def get_usage_tracker() -> UsageTracker:
+    global _usage_tracker
+    if _usage_tracker is None:
+        with _usage_tracker_lock:
+            if _usage_tracker is None:
+                _usage_tracker = UsageTracker()
+    return _usage_tracker
+
+
+def close_usage_tracker():
+    """Dừng thread ghi thống kê và flush phần còn lại."""
+    global _usage_tracker
+    with _usage_tracker_lock:
+        tracker, _usage_tracker = _usage_tracker, None
+    if tracker is not None:
+        tracker.close()
+
+atexit.register(close_usage_tracker)
@@ -7,6 +7,9 @@ from email.message import EmailMessage
 from typing import List, Tuple, Optional, Dict, Any
 from core.config import Config
 from utils.timezone_utils import get_vietnam_now, get_vietnam_time, vietnam_isoformat, get_vietnam_date_display
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 class EmailService:
     def __init__(self):
@@ -28,11 +31,11 @@ class EmailService:
                 smtp.login(self.smtp_config['user'], self.smtp_config['password'])
                 smtp.send_message(email)
             
-            print(f"Đã gửi email thành công đến: {to_email}")
+            logger.info("Đã gửi email thành công đến: %s", to_email)
             return True
             
         except Exception as e:
-            print(f"Lỗi khi gửi email: {e}")
+            logger.error("Lỗi khi gửi email: %s", e)
             return False
     
     def _validate_email_config(self) -> bool:
@@ -139,7 +142,7 @@ class UserConfigService:
             conn.close()
             return True
         except Exception as e:
-            print(f"Lỗi khi thiết lập cấu hình {key}: {e}")
+            logger.error("Lỗi khi thiết lập cấu hình %s: %s", key, e)
             return False
     
     def _get_config(self, key: str) -> Optional[str]:
@@ -151,7 +154,7 @@ class UserConfigService:
             conn.close()
             return result[0] if result else None
         except Exception as e:
-            print(f"Lỗi khi lấy cấu hình {key}: {e}")
+            logger.error("Lỗi khi lấy cấu hình %s: %s", key, e)
             return None
 
 
@@ -184,10 +187,16 @@ class NotificationDatabaseService:
             if 'notification_sent_at' not in columns:
                 cursor.execute('ALTER TABLE schedules ADD COLUMN notification_sent_at TEXT')
             
+            # Partial index: scheduler chỉ quét các lịch chưa gửi thông báo
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_schedules_pending_notification
+                ON schedules(start_time) WHERE COALESCE(notified, 0) = 0
+            ''')
+            
             conn.commit()
             conn.close()
         except Exception as e:
-            print(f"Lỗi khi cập nhật cấu trúc database: {e}")
+            logger.error("Lỗi khi cập nhật cấu trúc database: %s", e)
     
     def get_upcoming_schedules(self, reminder_minutes: int = 15) -> List[Tuple]:
         try:
@@ -200,9 +209,9 @@ class NotificationDatabaseService:
             query = '''
                 SELECT id, title, description, start_time, end_time
                 FROM schedules 
-                WHERE start_time <= ? 
-                AND start_time > ? 
-                AND (notified IS NULL OR notified = 0)
+                WHERE COALESCE(notified, 0) = 0
+                AND start_time <= ?
+                AND start_time > ?
             '''
             
             cursor.execute(query, (
@@ -214,7 +223,7 @@ class NotificationDatabaseService:
             conn.close()
             return results
         except Exception as e:
-            print(f"Lỗi khi truy vấn lịch sắp tới: {e}")
+            logger.error("Lỗi khi truy vấn lịch sắp tới: %s", e)
             return []
     
     def mark_notification_sent(self, schedule_id: int) -> bool:
@@ -230,7 +239,7 @@ class NotificationDatabaseService:
             conn.close()
             return True
         except Exception as e:
-            print(f"Lỗi khi cập nhật trạng thái thông báo: {e}")
+            logger.error("Lỗi khi cập nhật trạng thái thông báo: %s", e)
             return False
     
     def get_notification_stats(self) -> dict:
@@ -241,11 +250,9 @@ class NotificationDatabaseService:
             cursor.execute('SELECT COUNT(*) FROM schedules')
             total_schedules = cursor.fetchone()[0]
             
-            cursor.execute('SELECT COUNT(*) FROM schedules WHERE notified = 1')
-            notified_schedules = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM schedules WHERE notified = 0 OR notified IS NULL')
+            cursor.execute('SELECT COUNT(*) FROM schedules WHERE COALESCE(notified, 0) = 0')
             pending_schedules = cursor.fetchone()[0]
+            notified_schedules = total_schedules - pending_schedules
             
             conn.close()
             
@@ -255,7 +262,7 @@ class NotificationDatabaseService:
                 'pending_schedules': pending_schedules
             }
         except Exception as e:
-            print(f"Lỗi khi lấy thống kê: {e}")
+            logger.error("Lỗi khi lấy thống kê: %s", e)
             return {}
 
 
@@ -5,6 +5,9 @@ from typing import Optional
 
 from .NotificationCore import EmailService, EmailTemplateService, UserConfigService, NotificationDatabaseService
 from core.config import Config
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 class NotificationScheduler:
@@ -31,10 +34,10 @@ class NotificationScheduler:
                 name="NotificationScheduler"
             )
             self.scheduler_thread.start()
-            print("NotificationScheduler đã được khởi động")
+            logger.info("NotificationScheduler đã được khởi động")
             return True
         except Exception as e:
-            print(f"Lỗi khi khởi động NotificationScheduler: {e}")
+            logger.error("Lỗi khi khởi động NotificationScheduler: %s", e)
             self.is_running = False
             return False
     
@@ -46,10 +49,10 @@ class NotificationScheduler:
             self.is_running = False
             if self.scheduler_thread and self.scheduler_thread.is_alive():
                 self.scheduler_thread.join(timeout=5)
-            print("NotificationScheduler đã được dừng")
+            logger.info("NotificationScheduler đã được dừng")
             return True
         except Exception as e:
-            print(f"Lỗi khi dừng NotificationScheduler: {e}")
+            logger.error("Lỗi khi dừng NotificationScheduler: %s", e)
             return False
     
     def _scheduler_loop(self):
@@ -57,7 +60,7 @@ class NotificationScheduler:
             try:
                 self._check_and_send_notifications()
             except Exception as e:
-                print(f"Lỗi trong vòng lặp scheduler: {e}")
+                logger.error("Lỗi trong vòng lặp scheduler: %s", e)
             
             time.sleep(self.scan_interval)
     
@@ -71,7 +74,7 @@ class NotificationScheduler:
         if not upcoming_schedules:
             return
         
-        print(f"Tìm thấy {len(upcoming_schedules)} lịch cần gửi thông báo")
+        logger.info("Tìm thấy %d lịch cần gửi thông báo", len(upcoming_schedules))
         
         for schedule in upcoming_schedules:
             schedule_id, title, description, start_time, end_time = schedule
@@ -91,9 +94,9 @@ class NotificationScheduler:
                 body=email_content['body']
             ):
                 self.db_service.mark_notification_sent(schedule_id)
-                print(f"Đã gửi thông báo cho lịch: {title} (ID: {schedule_id})")
+                logger.info("Đã gửi thông báo cho lịch: %s (ID: %s)", title, schedule_id)
             else:
-                print(f"Không thể gửi thông báo cho lịch: {title} (ID: {schedule_id})")
+                logger.warning("Không thể gửi thông báo cho lịch: %s (ID: %s)", title, schedule_id)
     
     def get_status(self) -> dict:
         return {
@@ -0,0 +1,4 @@
+from .recorder import get_turn_recorder, read_recordings, TurnRecorder, RecordingLLM
+from .runner import ReplayRunner, ReplayLLM
+
+__all__ = ['get_turn_recorder', 'read_recordings', 'TurnRecorder', 'RecordingLLM', 'ReplayRunner', 'ReplayLLM']
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.config import Config
+from core.logger import get_logger, get_request_id
+from utils.clock import get_clock
+
+logger = get_logger(__name__)
+
+# Danh sách lượt gọi LLM của lượt hội thoại đang được ghi (None nếu không ghi)
+_current_calls: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    'replay_current_calls', default=None
+)
+
+
+def to_plain(value: Any) -> Any:
+    """Chuyển args của function call (MapComposite/RepeatedComposite của proto) sang kiểu JSON."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, 'items'):
+        return {str(k): to_plain(v) for k, v in value.items()}
+    if hasattr(value, '__iter__'):
+        return [to_plain(v) for v in value]
+    return str(value)
+
+
+def serialize_response(response: Any, function_call: Any = None) -> Dict[str, Any]:
+    """Rút gọn phản hồi Gemini thành phần mà agent thực sự dùng: function call và text."""
+    if isinstance(response, str):
+        return {'function_call': None, 'text': response}
+    call = None
+    if function_call is not None and getattr(function_call, 'name', None):
+        call = {'name': function_call.name, 'args': to_plain(function_call.args) if function_call.args else {}}
+    try:
+        text = response.text
+    except Exception:
+        text = None
+    return {'function_call': call, 'text': text}
+
+
+class RecordingLLM:
+    """
+    Bọc GeminiService: chuyển tiếp mọi lời gọi và ghi prompt + phản hồi thô
+    vào lượt hội thoại đang được ghi (nếu có).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def _capture(self, method: str, prompt: str, feature: Optional[str], result: Any = None, error: Exception = None):
+        calls = _current_calls.get()
+        if calls is None:
+            return
+        entry = {'method': method, 'feature': feature, 'prompt': prompt}
+        if error is not None:
+            entry['error'] = str(error)
+        else:
+            function_call = None
+            if method == 'generate_with_timeout':
+                try:
+                    function_call = self.inner.extract_function_call(result)
+                except Exception:
+                    function_call = None
+            entry['response'] = serialize_response(result, function_call)
+        calls.append(entry)
+
+    def generate_with_timeout(self, system_prompt: str, functions: list, **kwargs) -> Any:
+        try:
+            result = self.inner.generate_with_timeout(system_prompt, functions, **kwargs)
+        except Exception as e:
+            self._capture('generate_with_timeout', system_prompt, kwargs.get('feature'), error=e)
+            raise
+        self._capture('generate_with_timeout', system_prompt, kwargs.get('feature'), result)
+        return result
+
+    def get_ai_response(self, prompt: str, **kwargs) -> Any:
+        try:
+            result = self.inner.get_ai_response(prompt, **kwargs)
+        except Exception as e:
+            self._capture('get_ai_response', prompt, kwargs.get('feature'), error=e)
+            raise
+        self._capture('get_ai_response', prompt, kwargs.get('feature'), result)
+        return result
+
+    async def process_message(self, message: str, **kwargs) -> str:
+        try:
+            result = await self.inner.process_message(message, **kwargs)
+        except Exception as e:
+            self._capture('process_message', message, kwargs.get('feature'), error=e)
+            raise
+        self._capture('process_message', message, kwargs.get('feature'), result)
+        return result
+
+
+class TurnRecorder:
+    """
+    Ghi lại từng lượt AIAgent.process_user_input (input, đồng hồ, snapshot lịch,
+    ngữ cảnh hội thoại, phản hồi Gemini thô và output) để replay offline.
+    Mỗi ngày một file recordings/turns-YYYY-MM-DD.jsonl.gz, chỉ append:
+    mỗi lượt là một gzip member riêng nên file vẫn đọc được khi process bị dừng giữa chừng.
+    """
+
+    def __init__(self, directory: str = None, db_path: str = None, enabled: bool = None):
+        self.directory = directory or Config.REPLAY_RECORD_DIR
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.enabled = Config.REPLAY_RECORD if enabled is None else enabled
+        self.recorded_turns = 0
+        self._write_lock = threading.Lock()
+
+    def set_enabled(self, enabled: bool) -> Dict[str, Any]:
+        self.enabled = enabled
+        return self.get_status()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'directory': os.path.abspath(self.directory),
+            'recorded_turns': self.recorded_turns
+        }
+
+    def attach(self, agent) -> None:
+        """Thay các tham chiếu GeminiService của agent bằng RecordingLLM (idempotent)."""
+        if isinstance(agent.gemini_service, RecordingLLM):
+            return
+        recording = RecordingLLM(agent.gemini_service)
+        agent.gemini_service = recording
+        if getattr(agent.advisor, 'llm', None) is recording.inner:
+            agent.advisor.llm = recording
+        handler = agent.function_handler
+        if getattr(handler, 'agent', None) is not None and not isinstance(handler.agent, RecordingLLM):
+            handler.agent = RecordingLLM(handler.agent)
+
+    async def record(self, agent, user_input: str,
+                     handle: Callable[[str], Awaitable[Any]]) -> Any:
+        self.attach(agent)
+        now = get_clock().now()
+        entry = {
+            'id': uuid.uuid4().hex[:12],
+            'request_id': get_request_id(),
+            'session_id': agent.session_id,
+            'ephemeral': bool(getattr(agent, 'ephemeral', False)),
+            'clock': now.isoformat(),
+            'user_input': user_input,
+        }
+        try:
+            entry.update(await asyncio.to_thread(self._snapshot_state, agent.session_id, now,
+                                                 agent.conversation_service))
+        except sqlite3.Error as e:
+            logger.warning("[Replay] Không chụp được snapshot DB: %s", e)
+
+        calls: List[Dict[str, Any]] = []
+        token = _current_calls.set(calls)
+        started = time.perf_counter()
+        try:
+            result = await handle(user_input)
+        finally:
+            _current_calls.reset(token)
+        entry['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        entry['llm_calls'] = calls
+        entry['output'] = result
+
+        try:
+            await asyncio.to_thread(self._append, entry, now.strftime('%Y-%m-%d'))
+            self.recorded_turns += 1
+        except OSError as e:
+            logger.error("[Replay] Không ghi được recording: %s", e)
+        return result
+
+    def _snapshot_state(self, session_id: str, now, service=None) -> Dict[str, Any]:
+        """
+        Lịch quanh thời điểm hiện tại và ngữ cảnh hội thoại mà lượt này đọc. Ngữ cảnh lấy qua
+        ConversationService của agent (gồm message còn trong bộ đệm write-behind, session tạm
+        đọc từ kho trong bộ nhớ), giới hạn ở phần prompt có thể dùng (get_session_snapshot).
+        """
+        window_start = (now - timedelta(days=1)).isoformat()
+        window_end = (now + timedelta(days=Config.REPLAY_SNAPSHOT_DAYS)).isoformat()
+        conn = sqlite3.connect(self.db_path, timeout=Config.CONNECTION_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        try:
+            schedules = [dict(row) for row in conn.execute(
+                'SELECT * FROM schedules WHERE end_time >= ? AND start_time <= ? ORDER BY start_time',
+                (window_start, window_end)
+            )]
+        except sqlite3.OperationalError:
+            # Bảng chưa được tạo (DB mới)
+            schedules = []
+        finally:
+            conn.close()
+        if service is None:
+            from core.services.conversation_service import ConversationService
+            service = ConversationService(db_path=self.db_path)
+        state = service.get_session_snapshot(session_id)
+        state['schedules'] = schedules
+        return state
+
+    def _append(self, entry: Dict[str, Any], day: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"turns-{day}.jsonl.gz")
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str) + "\n"
+        with self._write_lock:
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                f.write(line)
+
+
+def read_recordings(paths: List[str]):
+    """Đọc lần lượt các lượt đã ghi từ một hoặc nhiều file/thư mục recording."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith('.jsonl.gz')
+            ))
+        else:
+            files.append(path)
+    for file_path in files:
+        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+_turn_recorder = None
+
+def get_turn_recorder() -> TurnRecorder:
+    global _turn_recorder
+    if _turn_recorder is None:
+        _turn_recorder = TurnRecorder()
+    return _turn_recorder
@@ -0,0 +1,291 @@
+"""
+Replay offline các lượt hội thoại đã ghi bởi TurnRecorder với build hiện tại.
+
+    python -m core.replay.runner recordings/ [--session abc] [--limit 100] [--json] [--fail-on-diff]
+
+Mỗi lượt chạy trong một DB tạm được seed từ snapshot lịch + ngữ cảnh hội thoại,
+đồng hồ cố định ở thời điểm ghi, Gemini được thay bằng các phản hồi đã ghi và
+mọi lời gọi Google Calendar là no-op. Báo cáo gồm diff output, diff prompt và
+chênh lệch độ trễ so với lúc ghi.
+"""
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from core.exceptions import GeminiAPIError
+from core.replay.recorder import read_recordings
+from core.services.connection_pool import close_all_pools
+from core.services.history_buffer import close_history_buffers
+from core.services.conversation_summary import close_conversation_summarizers
+from core.services.conversation_retention import close_conversation_archivers
+from utils.clock import FixedClock, use_clock
+
+
+class ReplayLLM:
+    """Thay GeminiService: trả lần lượt các phản hồi đã ghi và giữ lại prompt nhận được."""
+
+    def __init__(self, recorded_calls: List[Dict[str, Any]]):
+        self._pending = list(recorded_calls)
+        self.prompts: List[Dict[str, Any]] = []
+
+    def _next(self, method: str, prompt: str) -> Any:
+        self.prompts.append({'method': method, 'prompt': prompt})
+        if not self._pending or self._pending[0]['method'] != method:
+            raise GeminiAPIError(f"[Replay] Không có phản hồi đã ghi cho lời gọi {method}")
+        call = self._pending.pop(0)
+        if 'error' in call:
+            raise GeminiAPIError(call['error'])
+        response = call['response']
+        function_call = None
+        if response.get('function_call'):
+            fc = response['function_call']
+            function_call = SimpleNamespace(name=fc['name'], args=dict(fc.get('args') or {}))
+        return SimpleNamespace(function_call=function_call, text=response.get('text'))
+
+    def generate_with_timeout(self, system_prompt: str, functions: list, **kwargs) -> Any:
+        return self._next('generate_with_timeout', system_prompt)
+
+    def get_ai_response(self, prompt: str, **kwargs) -> Any:
+        return self._next('get_ai_response', prompt)
+
+    async def process_message(self, message: str, **kwargs) -> str:
+        return self._next('process_message', message).text
+
+    def extract_function_call(self, response):
+        return getattr(response, 'function_call', None)
+
+    def format_response(self, response) -> str:
+        if isinstance(response, str):
+            return response
+        text = getattr(response, 'text', None)
+        return text if text is not None else "Không thể định dạng loại phản hồi không xác định."
+
+    @property
+    def unused_calls(self) -> int:
+        return len(self._pending)
+
+
+def _noop_google():
+    """Patch toàn bộ lời gọi mạng của GoogleCalendarService thành no-op."""
+    from core.services.google_calendar_service import GoogleCalendarService
+    stack = ExitStack()
+    for name, value in (
+        ('create_event', None),
+        ('update_event', True),
+        ('delete_event', True),
+        ('sync_from_google', {'synced': 0}),
+        ('start_watch', {}),
+        ('stop_watch', True),
+    ):
+        stack.enter_context(mock.patch.object(GoogleCalendarService, name, return_value=value))
+    stack.enter_context(mock.patch.object(
+        GoogleCalendarService, '_build_service',
+        side_effect=RuntimeError("[Replay] Google Calendar bị tắt khi replay")
+    ))
+    return stack
+
+
+@contextmanager
+def _workspace():
+    """Chạy trong thư mục tạm: các service dùng đường dẫn tương đối database/schedule.db."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='replay-') as tmp:
+        os.makedirs(os.path.join(tmp, 'database'))
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            close_history_buffers()
+            close_conversation_summarizers()
+            close_conversation_archivers()
+            close_all_pools()
+            os.chdir(previous)
+
+
+def _seed_database(turn: Dict[str, Any]):
+    """
+    Đưa DB tạm về đúng trạng thái lúc ghi: lịch trong cửa sổ snapshot và ngữ cảnh hội thoại
+    (session tạm: ngữ cảnh được seed vào kho session tạm trong bộ nhớ như lúc ghi).
+    """
+    from core.services.ExecuteSchedule import ExecuteSchedule
+    from core.services.conversation_service import ConversationService
+    from core.services.ephemeral_sessions import EphemeralConversationService, get_ephemeral_store
+    from core.services.context_cache import invalidate_context_caches
+    from core.services.context_retrieval import invalidate_context_retrievers
+    from core.services.user_profile import invalidate_profile_stores
+
+    ConversationService()
+    ExecuteSchedule(enable_google_calendar=False).close()
+    conn = sqlite3.connect('database/schedule.db')
+    try:
+        conn.execute('DELETE FROM schedules')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(schedules)')}
+        for row in turn.get('schedules', []):
+            data = {k: v for k, v in row.items() if k in columns}
+            conn.execute(
+                f"INSERT INTO schedules ({', '.join(data)}) VALUES ({', '.join('?' * len(data))})",
+                tuple(data.values())
+            )
+        _seed_conversation(conn, turn if not turn.get('ephemeral') else {})
+        conn.commit()
+    finally:
+        conn.close()
+    EphemeralConversationService()
+    with get_ephemeral_store().pool.connection() as conn:
+        _seed_conversation(conn, turn if turn.get('ephemeral') else {})
+    # Ghi trực tiếp vào DB nên ring context, chỉ mục truy hồi và hồ sơ trong bộ nhớ không còn đúng
+    invalidate_context_caches()
+    invalidate_context_retrievers()
+    invalidate_profile_stores()
+
+
+def _seed_conversation(conn: sqlite3.Connection, turn: Dict[str, Any]):
+    """Thay ngữ cảnh hội thoại trong conn bằng snapshot của turn (turn rỗng: chỉ xóa)."""
+    conn.execute('DELETE FROM conversation_history')
+    conn.execute('DELETE FROM conversation_summaries')
+    conn.execute('DELETE FROM user_profiles')
+    for msg in turn.get('conversation', []):
+        conn.execute('''
+            INSERT INTO conversation_history
+            (session_id, role, content, function_call, function_response, timestamp, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (turn['session_id'], msg['role'], msg['content'], msg.get('function_call'),
+              msg.get('function_response'), msg['timestamp'], msg['created_at']))
+    summary = turn.get('summary')
+    if summary:
+        conn.execute('''
+            INSERT INTO conversation_summaries
+            (session_id, summary, facts, folded_messages, last_message_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (turn['session_id'], summary['summary'], summary['facts'], summary['folded_messages'],
+              summary['last_message_id'], summary['updated_at']))
+    if turn.get('profile'):
+        conn.execute('INSERT INTO user_profiles (session_id, profile, updated_at) VALUES (?, ?, ?)',
+                     (turn['session_id'], turn['profile'], turn['clock']))
+
+
+def _diff(recorded: str, replayed: str, label: str) -> List[str]:
+    return list(difflib.unified_diff(
+        recorded.splitlines(), replayed.splitlines(),
+        fromfile=f'recorded/{label}', tofile=f'replay/{label}', lineterm=''
+    ))
+
+
+def _as_text(output: Any) -> str:
+    if isinstance(output, str):
+        return output
+    return json.dumps(output, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class ReplayRunner:
+    def __init__(self, compare_prompts: bool = True):
+        self.compare_prompts = compare_prompts
+
+    def replay_turn(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        import core.ai_agent
+        import core.handlers.function_handler
+
+        llm = ReplayLLM(turn.get('llm_calls', []))
+        _seed_database(turn)
+
+        # Advisor đọc đồng hồ ở mỗi lần parse nên cả lượt chạy theo thời điểm bắt đầu lượt
+        clock = FixedClock(datetime.fromisoformat(turn['clock']))
+        with use_clock(clock), \
+                mock.patch.object(core.ai_agent, 'GeminiService', lambda: llm), \
+                mock.patch.object(core.handlers.function_handler, 'GeminiService', lambda: llm):
+            agent = core.ai_agent.AIAgent(session_id=turn['session_id'], ephemeral=turn.get('ephemeral', False))
+            started = time.perf_counter()
+            output = asyncio.run(agent._handle_user_input(turn['user_input']))
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        output_diff = _diff(_as_text(turn.get('output')), _as_text(output), 'output')
+        prompt_diffs = []
+        if self.compare_prompts:
+            for i, (recorded, replayed) in enumerate(zip(turn.get('llm_calls', []), llm.prompts)):
+                diff = _diff(recorded.get('prompt') or '', replayed['prompt'] or '', f"{replayed['method']}#{i}")
+                if diff:
+                    prompt_diffs.append(diff)
+
+        recorded_latency = turn.get('latency_ms')
+        return {
+            'id': turn.get('id'),
+            'session_id': turn['session_id'],
+            'user_input': turn['user_input'],
+            'changed': bool(output_diff),
+            'output_diff': output_diff,
+            'prompt_diffs': prompt_diffs,
+            'unused_llm_calls': llm.unused_calls,
+            'latency_ms_recorded': recorded_latency,
+            'latency_ms_replay': latency_ms,
+            'latency_ms_delta': round(latency_ms - recorded_latency, 2) if recorded_latency is not None else None,
+        }
+
+    def run(self, paths: List[str], session_id: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        results = []
+        with _workspace(), _noop_google():
+            for turn in read_recordings(paths):
+                if session_id and turn['session_id'] != session_id:
+                    continue
+                results.append(self.replay_turn(turn))
+                if limit and len(results) >= limit:
+                    break
+        return {'summary': summarize(results), 'turns': results}
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    deltas = sorted(r['latency_ms_delta'] for r in results if r['latency_ms_delta'] is not None)
+    return {
+        'turns': len(results),
+        'changed_outputs': sum(1 for r in results if r['changed']),
+        'changed_prompts': sum(1 for r in results if r['prompt_diffs']),
+        'latency_ms_delta_median': deltas[len(deltas) // 2] if deltas else None,
+        'latency_ms_delta_max': deltas[-1] if deltas else None,
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    for r in report['turns']:
+        status = 'CHANGED' if r['changed'] or r['prompt_diffs'] else 'same'
+        print(f"[{status}] {r['id']} session={r['session_id']} "
+              f"latency {r['latency_ms_recorded']}ms -> {r['latency_ms_replay']}ms: {r['user_input']}")
+        for line in r['output_diff']:
+            print(f"    {line}")
+        for diff in r['prompt_diffs']:
+            for line in diff:
+                print(f"    {line}")
+    print(json.dumps(report['summary'], ensure_ascii=False))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay các lượt hội thoại đã ghi")
+    parser.add_argument('paths', nargs='+', help="file .jsonl.gz hoặc thư mục recordings")
+    parser.add_argument('--session', help="chỉ replay một session")
+    parser.add_argument('--limit', type=int, help="số lượt tối đa")
+    parser.add_argument('--no-prompts', action='store_true', help="bỏ qua so sánh prompt")
+    parser.add_argument('--json', action='store_true', help="in báo cáo dạng JSON")
+    parser.add_argument('--fail-on-diff', action='store_true', help="exit code 1 nếu có output thay đổi")
+    args = parser.parse_args(argv)
+
+    paths = [os.path.abspath(p) for p in args.paths]
+    report = ReplayRunner(compare_prompts=not args.no_prompts).run(paths, args.session, args.limit)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+    changed = report['summary']['changed_outputs'] or report['summary']['changed_prompts']
+    return 1 if args.fail_on_diff and changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
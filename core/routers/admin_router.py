@@ -0,0 +1,187 @@
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from core.dependencies import require_admin
+from core.exceptions import ProfilerBusyError
+from core.replay import get_turn_recorder
+from core.services.history_buffer import get_history_buffers
+from core.services.conversation_retention import get_conversation_archiver, get_conversation_archivers
+from core.monitoring import get_profiler, get_loop_monitor, get_memory_profiler, collect_resource_gauges, get_usage_tracker
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def run_profiler(
+    seconds: Optional[float] = None,
+    route: Optional[str] = None,
+    requests: Optional[int] = None,
+    timeout: Optional[float] = None,
+    interval_ms: Optional[float] = None,
+):
+    """
+    Chạy sampling profiler và trả về file collapsed-stack cho flamegraph.
+    - ?seconds=10: lấy mẫu toàn process trong 10 giây
+    - ?route=/schedules/prompt&requests=5: lấy mẫu trong lúc 5 request tiếp theo của route được xử lý
+      (tối đa timeout giây, không quá PROFILER_MAX_SECONDS)
+    - interval_ms: khoảng lấy mẫu, không nhỏ hơn PROFILER_MIN_INTERVAL
+    """
+    mode = 'requests' if route else 'duration'
+    interval = interval_ms / 1000 if interval_ms is not None else None
+    try:
+        session = get_profiler().start(mode, seconds=seconds, route=route, request_count=requests,
+                                       interval=interval, timeout=timeout)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await asyncio.to_thread(session.wait)
+
+    summary = session.summary()
+    filename = f"profile-{int(session.started_at)}.collapsed"
+    return PlainTextResponse(
+        session.to_collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(summary['samples']),
+            "X-Profile-Requests": str(summary['completed_requests']),
+            "X-Profile-Elapsed": str(summary['elapsed_seconds']),
+        }
+    )
+
+
+@router.get("/profile/status")
+def profiler_status():
+    """Trạng thái phiên profiling hiện tại (nếu có)."""
+    session = get_profiler().active_session
+    return {
+        "active": session is not None,
+        "session": session.summary() if session else None,
+        "server_time": time.time()
+    }
+
+
+@router.get("/loop-lag")
+def loop_lag(format: str = "json"):
+    """Histogram độ trễ event loop và các lần loop bị chặn gần nhất."""
+    monitor = get_loop_monitor()
+    if format == "prometheus":
+        return PlainTextResponse(monitor.histogram.to_prometheus("event_loop_lag_seconds"))
+    return monitor.get_status()
+
+
+@router.get("/gauges")
+def resource_gauges(gc_objects: bool = False):
+    """Số agent đang cache, thread, kết nối sqlite, socket và bộ nhớ của process."""
+    return collect_resource_gauges(include_gc_objects=gc_objects)
+
+
+@router.get("/memory")
+def memory_status():
+    """Trạng thái tracemalloc và danh sách snapshot đang giữ."""
+    return get_memory_profiler().get_status()
+
+
+@router.post("/memory/start")
+def memory_start(frames: Optional[int] = None):
+    """Bật tracemalloc (làm chậm cấp phát bộ nhớ cho tới khi tắt)."""
+    return get_memory_profiler().start(frames)
+
+
+@router.post("/memory/stop")
+def memory_stop():
+    """Tắt tracemalloc và xóa các snapshot."""
+    return get_memory_profiler().stop()
+
+
+@router.post("/memory/snapshot")
+def memory_snapshot(name: Optional[str] = None):
+    """Chụp snapshot tracemalloc với tên cho trước."""
+    try:
+        return get_memory_profiler().take_snapshot(name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/memory/snapshot/{name}")
+def memory_snapshot_top(name: str, limit: int = 20, group_by: str = "lineno"):
+    """Các vị trí cấp phát nhiều bộ nhớ nhất trong một snapshot."""
+    try:
+        return {"name": name, "top": get_memory_profiler().top(name, limit, group_by)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/memory/diff")
+def memory_diff(base: str, target: Optional[str] = None, limit: int = 20, group_by: str = "lineno"):
+    """So sánh hai snapshot; bỏ trống target để so với trạng thái hiện tại."""
+    try:
+        return get_memory_profiler().diff(base, target, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/usage")
+def llm_usage(
+    group_by: str = "session",
+    session_id: Optional[str] = None,
+    feature: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 100,
+):
+    """
+    Thống kê lượt gọi Gemini (token, độ trễ, lỗi) theo session, feature, hour hoặc model.
+    - ?group_by=feature&session_id=abc: feature nào của session abc tốn token nhất
+    - ?group_by=hour&since=2025-01-01: usage theo từng giờ kể từ ngày 01/01
+    """
+    try:
+        rows = get_usage_tracker().summary(group_by, session_id=session_id, feature=feature,
+                                           since=since, until=until, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "rows": rows}
+
+
+@router.get("/recording")
+def recording_status():
+    """Trạng thái ghi lượt hội thoại phục vụ replay."""
+    return get_turn_recorder().get_status()
+
+
+@router.post("/recording")
+def set_recording(enabled: bool):
+    """Bật/tắt ghi lượt hội thoại (input, đồng hồ, snapshot lịch, phản hồi Gemini)."""
+    return get_turn_recorder().set_enabled(enabled)
+
+
+@router.get("/history-buffer")
+def history_buffer_stats():
+    """Bộ đệm write-behind của lịch sử hội thoại: số message chờ ghi, độ trễ flush và kích thước batch."""
+    return {path: buffer.get_stats() for path, buffer in get_history_buffers().items()}
+
+
+@router.get("/retention")
+def retention_stats():
+    """Lưu trữ lịch sử hội thoại: TTL, số session/message đang nằm trong file lưu trữ, số lần khôi phục."""
+    return {path: archiver.get_stats() for path, archiver in get_conversation_archivers().items()}
+
+
+@router.post("/retention/run")
+def run_retention(max_sessions: Optional[int] = None):
+    """Lưu trữ ngay các session không hoạt động quá HISTORY_RETENTION_DAYS ngày."""
+    archiver = get_conversation_archiver()
+    if archiver.ttl_days <= 0:
+        raise HTTPException(status_code=409, detail="HISTORY_RETENTION_DAYS = 0: lưu trữ đang tắt")
+    return archiver.archive_inactive(max_sessions)
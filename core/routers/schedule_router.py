@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, Request, Header, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Any, Dict, Optional
 from pydantic import BaseModel
 
 import os, sqlite3
 from core.ai_agent import AIAgent
-from core.dependencies import get_ai_agent
+from core.dependencies import get_ai_agent, promote_ai_agent
 from core.models.schema import Prompt
 from core.notification import get_notification_manager
 from core.services.google_calendar_service import GoogleCalendarService
+from core.services.conversation_service import ConversationService
 from core.config import Config
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 router = APIRouter(
     prefix="/schedules",
     tags=["schedules"]
@@ -18,10 +23,10 @@ class EmailSetupRequest(BaseModel):
     email: str
 
 @router.post("/prompt", response_model=Dict[str, Any])
-async def consultant_schedules(body: Prompt, session_id: str = "default"):
-    """Xử lý yêu cầu từ người dùng với session support."""
+async def consultant_schedules(body: Prompt, session_id: str = "default", ephemeral: bool = False):
+    """Xử lý yêu cầu từ người dùng với session support (ephemeral: session tạm chỉ giữ trong bộ nhớ)."""
     try:
-        agent = get_ai_agent(session_id)
+        agent = get_ai_agent(session_id, ephemeral)
         response = await agent.process_user_input(body.content)
         return {
             "result": response,
@@ -61,9 +66,9 @@ def manual_google_sync(background_tasks: BackgroundTasks):
         try:
             svc = GoogleCalendarService()
             result = svc.sync_from_google()
-            print(f"[Manual] {result}")
+            logger.info("[Manual] %s", result)
         except Exception as e:
-            print(f"[Manual] Lỗi: {e}")
+            logger.error("[Manual] Lỗi: %s", e)
     
     background_tasks.add_task(_do_manual_sync)
     return {"message": "Sync queued"}
@@ -90,17 +95,17 @@ def google_webhook(
             if not x_goog_channel_id and not x_goog_resource_id:
                 pass  # Google test ping, cho phép sync
             elif stored_channel and stored_channel != x_goog_channel_id:
-                print(f"[Webhook] Ignored: channel mismatch")
+                logger.info("[Webhook] Ignored: channel mismatch")
                 return
             elif stored_resource and stored_resource != x_goog_resource_id:
-                print(f"[Webhook] Ignored: resource mismatch")
+                logger.info("[Webhook] Ignored: resource mismatch")
                 return
 
             result = svc.sync_from_google()
             if result.get('synced', 0) > 0:
-                print(f"[Webhook] Synced {result['synced']} changes")
+                logger.info("[Webhook] Synced %s changes", result['synced'])
         except Exception as e:
-            print(f"[Webhook] Error: {e}")
+            logger.error("[Webhook] Error: %s", e)
 
     background_tasks.add_task(_do_webhook_sync)
     return {"status": "ok"}
@@ -159,36 +164,86 @@ class SessionRequest(BaseModel):
 class ConversationSearchRequest(BaseModel):
     query: str
     limit: int = 10
+    offset: int = 0
 
 @router.get("/conversation/history")
-def get_conversation_history(session_id: str = "default", limit: Optional[int] = None):
-    """Lấy lịch sử conversation."""
+def get_conversation_history(session_id: str = "default", limit: Optional[int] = None,
+                             after: Optional[str] = None, before: Optional[str] = None,
+                             newest: bool = False, ephemeral: bool = False):
+    """
+    Lấy lịch sử conversation theo trang (cũ trước).
+    Truyền next_cursor vào after để lấy trang mới hơn, prev_cursor vào before để lấy trang cũ hơn.
+    """
     try:
-        agent = AIAgent(session_id=session_id)
-        history = agent.get_conversation_history(limit)
+        agent = AIAgent(session_id=session_id, ephemeral=ephemeral)
+        page = agent.get_conversation_page(limit, after, before, newest)
         return {
             "session_id": session_id,
-            "history": history,
-            "total": len(history)
+            "history": page["messages"],
+            "total": len(page["messages"]),
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/conversation/export")
+def export_conversation(session_id: str = "default", format: str = "text", ephemeral: bool = False):
+    """Stream toàn bộ lịch sử conversation dạng text hoặc NDJSON."""
+    try:
+        agent = AIAgent(session_id=session_id, ephemeral=ephemeral)
+        chunks = agent.iter_export(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/plain; charset=utf-8"
+    extension = "ndjson" if format == "ndjson" else "txt"
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="conversation-{session_id}.{extension}"'
+    })
 
 @router.get("/conversation/stats")
-def get_conversation_stats(session_id: str = "default"):
+def get_conversation_stats(session_id: str = "default", ephemeral: bool = False):
     """Lấy thống kê conversation."""
     try:
-        agent = AIAgent(session_id=session_id)
+        agent = AIAgent(session_id=session_id, ephemeral=ephemeral)
         stats = agent.get_conversation_stats()
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/conversation/sessions")
+def list_conversation_sessions(limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Danh sách session theo hoạt động gần nhất, phân trang bằng next_cursor."""
+    try:
+        return ConversationService().list_sessions(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/conversation/promote")
+def promote_conversation(session_id: str, target_session_id: Optional[str] = None):
+    """Chuyển session tạm (ephemeral) sang lưu bền, có thể đổi sang target_session_id."""
+    try:
+        promoted = promote_ai_agent(session_id, target_session_id)
+        return {
+            "session_id": target_session_id or session_id,
+            "promoted_messages": promoted
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/conversation/clear")
-def clear_conversation(session_id: str = "default"):
+def clear_conversation(session_id: str = "default", ephemeral: bool = False):
     """Xóa toàn bộ lịch sử conversation."""
     try:
-        agent = AIAgent(session_id=session_id)
+        agent = AIAgent(session_id=session_id, ephemeral=ephemeral)
         deleted_count = agent.clear_conversation_history()
         return {
             "message": f"Đã xóa {deleted_count} tin nhắn",
@@ -199,14 +254,15 @@ def clear_conversation(session_id: str = "default"):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/conversation/search")
-def search_conversation(request: ConversationSearchRequest, session_id: str = "default"):
+def search_conversation(request: ConversationSearchRequest, session_id: str = "default", ephemeral: bool = False):
     """Tìm kiếm trong lịch sử conversation."""
     try:
-        agent = AIAgent(session_id=session_id)
-        results = agent.search_conversation(request.query, request.limit)
+        agent = AIAgent(session_id=session_id, ephemeral=ephemeral)
+        results = agent.search_conversation(request.query, request.limit, request.offset)
         return {
             "session_id": session_id,
             "query": request.query,
+            "offset": request.offset,
             "results": results,
             "total": len(results)
         }
@@ -5,6 +5,9 @@ from email.message import EmailMessage
 import os
 from dotenv import load_dotenv
 from core.services.google_calendar_service import GoogleCalendarService
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 class ExecuteSchedule:
     def __init__(self, db_path='database/schedule.db', smtp_config=None, enable_google_calendar=True):
@@ -79,7 +82,7 @@ class ExecuteSchedule:
                     cursor.execute('UPDATE schedules SET google_event_id = ? WHERE id = ?', (event_id, new_id))
                     self.conn.commit()
             else:
-                print("📋 Google Calendar sync đã bị tắt - chỉ lưu vào database local")
+                logger.debug("Google Calendar sync đã bị tắt - chỉ lưu vào database local")
             return "✅ Đã thêm lịch thành công."
         except Exception as e:
             return f"❌ Lỗi khi thêm lịch: {e}"
@@ -151,26 +154,32 @@ class ExecuteSchedule:
         cursor.execute('SELECT * FROM schedules WHERE COALESCE(deleted, 0) = 0 ORDER BY start_time')
         return cursor.fetchall()
 
-    def get_schedules_by_date(self, date_str):
-        """Lấy lịch theo ngày (YYYY-MM-DD)"""
+    def _get_schedules_starting_between(self, start_str, end_str):
+        """Lịch có start_time trong [start_str, end_str); so sánh khoảng để dùng index theo start_time."""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM schedules WHERE COALESCE(deleted, 0) = 0 AND start_time LIKE ? ORDER BY start_time', (f'{date_str}%',))
+        cursor.execute(
+            'SELECT * FROM schedules WHERE COALESCE(deleted, 0) = 0 AND start_time >= ? AND start_time < ? ORDER BY start_time',
+            (start_str, end_str)
+        )
         return cursor.fetchall()
 
+    def get_schedules_by_date(self, date_str):
+        """Lấy lịch theo ngày (YYYY-MM-DD)"""
+        try:
+            day = datetime.date.fromisoformat(date_str)
+        except ValueError:
+            return []
+        return self._get_schedules_starting_between(day.isoformat(), (day + datetime.timedelta(days=1)).isoformat())
+
     def get_schedules_by_month(self, year, month):
         """Lấy lịch theo tháng"""
-        cursor = self.conn.cursor()
-        month_str = f'{int(month):02d}'
-        query_string = f'{int(year)}-{month_str}%'
-        cursor.execute('SELECT * FROM schedules WHERE COALESCE(deleted, 0) = 0 AND start_time LIKE ? ORDER BY start_time', (query_string,))
-        return cursor.fetchall()
+        year, month = int(year), int(month)
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return self._get_schedules_starting_between(f'{year}-{month:02d}', f'{next_year}-{next_month:02d}')
 
     def get_schedules_by_year(self, year):
         """Lấy lịch theo năm"""
-        cursor = self.conn.cursor()
-        query_string = f'{int(year)}%'
-        cursor.execute('SELECT * FROM schedules WHERE COALESCE(deleted, 0) = 0 AND start_time LIKE ? ORDER BY start_time', (query_string,))
-        return cursor.fetchall()
+        return self._get_schedules_starting_between(f'{int(year)}', f'{int(year) + 1}')
 
     def validate_time(self, start_time, end_time, exclude_id=None):
         try:
@@ -181,12 +190,19 @@ class ExecuteSchedule:
             if start_dt >= end_dt:
                 return False
         except Exception as e:
-            print(f"[Debug] validate_time parse error: {e}")
+            logger.debug("validate_time parse error: %s", e)
             return False
 
         cursor = self.conn.cursor()
-        query = 'SELECT id, start_time, end_time FROM schedules WHERE COALESCE(deleted, 0) = 0'
-        cursor.execute(query)
+        # Lọc sơ bộ bằng index theo khoảng ngày, sau đó so sánh chính xác sau khi chuẩn hóa timezone.
+        # Lịch cũ có thể lưu lẫn định dạng ('YYYY-MM-DD HH:MM:SS', '...Z', '+07:00') nên không so chuỗi
+        # đến từng giờ: chỉ so phần ngày, nới thêm 1 ngày mỗi phía (lệch múi giờ luôn dưới 1 ngày).
+        query = '''
+            SELECT id, start_time, end_time FROM schedules
+            WHERE COALESCE(deleted, 0) = 0 AND start_time < ? AND end_time >= ?
+        '''
+        cursor.execute(query, ((end_dt.date() + datetime.timedelta(days=2)).isoformat(),
+                               (start_dt.date() - datetime.timedelta(days=1)).isoformat()))
         for row in cursor.fetchall():
             if exclude_id and row[0] == exclude_id:
                 continue
@@ -196,10 +212,10 @@ class ExecuteSchedule:
                 exist_end = parse_time_to_vietnam(row[2])
                 # Kiểm tra trùng thời gian
                 if (start_dt < exist_end and end_dt > exist_start):
-                    print(f"[Debug] Time conflict: {start_time} conflicts with {row[1]} - {row[2]}")
+                    logger.debug("Time conflict: %s conflicts with %s - %s", start_time, row[1], row[2])
                     return False
             except Exception as e:
-                print(f"[Debug] validate_time existing schedule error: {e}")
+                logger.debug("validate_time existing schedule error: %s", e)
                 continue
         return True
 
@@ -209,7 +225,7 @@ class ExecuteSchedule:
         return get_vietnam_timestamp()
 
     def send_notification(self, message):
-        print(f"[Thông báo] {message}")
+        logger.info("[Thông báo] %s", message)
         # Gửi email nếu cấu hình đủ
         if self.smtp_config['user'] and self.smtp_config['password'] and self.smtp_config['to']:
             try:
@@ -223,7 +239,7 @@ class ExecuteSchedule:
                     smtp.login(self.smtp_config['user'], self.smtp_config['password'])
                     smtp.send_message(email)
             except Exception as e:
-                print(f"Gửi email thất bại: {e}")
+                logger.warning("Gửi email thất bại: %s", e)
 
     # --- NEW FUNCTIONS ---
 
@@ -311,7 +327,7 @@ class ExecuteSchedule:
                     if sch_start < range_end and sch_end > range_start:
                         schedules_to_delete.append(schedule)
                 except Exception as e:
-                    print(f"[Debug] Could not parse schedule ID {schedule[0]} for deletion: {e}")
+                    logger.debug("Could not parse schedule ID %s for deletion: %s", schedule[0], e)
                     continue
 
             if not schedules_to_delete:
@@ -1,18 +1,28 @@
 import re
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from typing import Dict, List, Optional, Tuple, Union
 import sqlite3
 import pytz
 
 # Import các hàm kiểm tra lịch độc lập và các hàm tiện ích khác
 from utils.time_patterns import (
-    get_time_patterns,
+    get_time_patterns, WEEKDAY_ATOMS, PERIOD_ATOMS,
     parse_weekday, parse_weekday_this_week, parse_weekday_next_week,
     parse_time_period_day, parse_time_period_weekday, parse_time_period_weekday_with_hour,
     parse_after_days, parse_after_weeks, parse_after_months,
     parse_weekday_time, parse_time_weekday_this_week, parse_time_weekday_next_week, parse_time_weekday
 )
 from utils.task_categories import task_categories
+from utils.time_matcher import DIGIT, get_time_matcher
+from core.services.schedule_index import get_schedule_index
+from core.services.free_slots import FreeSlotFinder
+from core.services.availability import get_availability_engine
+from core.services.group_availability import GroupAvailability
+from utils.clock import get_clock
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 def check_schedule_overlap(conn: sqlite3.Connection, start_time: datetime, end_time: datetime) -> bool:
     """
@@ -24,11 +34,13 @@ def check_schedule_overlap(conn: sqlite3.Connection, start_time: datetime, end_t
     start_str = start_time.isoformat()
     end_str = end_time.isoformat()
     
-    # Tìm kiếm các lịch trình có overlap với khoảng thời gian đầu vào
-    # Overlap xảy ra khi: NOT (new_end <= existing_start OR new_start >= existing_end)
+    # Tìm kiếm các lịch trình (chưa xóa) có overlap với khoảng thời gian đầu vào
+    # Overlap xảy ra khi: existing_start < new_end AND existing_end > new_start
+    # (viết dạng AND để dùng được index idx_schedules_start_end)
     query = """
         SELECT COUNT(*) FROM schedules
-        WHERE NOT (? <= start_time OR ? >= end_time)
+        WHERE COALESCE(deleted, 0) = 0
+        AND start_time < ? AND end_time > ?
     """
     cursor.execute(query, (end_str, start_str))
     # Nếu số lượng lịch trình trùng lặp > 0, trả về False
@@ -42,10 +54,12 @@ class ScheduleAdvisor:
     - Kiểm tra lịch trống, đề xuất thời gian
     - Nếu thông tin chưa đủ (đặc biệt là thời gian), sinh câu hỏi làm rõ (ưu tiên dùng LLM nếu có)
     """
-    def __init__(self, db_path='database/schedule.db', llm=None):
+    def __init__(self, db_path='database/schedule.db', llm=None, clock=None):
         # Lấy múi giờ Việt Nam
         self.vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
-        self.current_time = datetime.now(self.vietnam_tz)
+        # Thời điểm tham chiếu lấy từ đồng hồ ở mỗi lần gọi (None: đồng hồ toàn cục get_clock()),
+        # nên một advisor sống lâu vẫn hiểu "ngày mai" theo ngày hiện tại
+        self.clock = clock
         # Thiết lập giờ làm việc và giờ nghỉ trưa
         self.business_hours = (8, 17)
         self.lunch_time = (12, 13)
@@ -59,31 +73,34 @@ class ScheduleAdvisor:
             'thứ sáu': 4, 't6': 4, 'thứ 6': 4, 'thứsáu': 4, 'thứ6': 4,
             'thứ bảy': 5, 't7': 5, 'thứ 7': 5, 'thứbảy': 5, 'thứ7': 5
         }
-        # Danh sách các pattern regex để trích xuất thời gian
+        # Danh sách các pattern regex để trích xuất thời gian; parser nhận (match, thời điểm tham chiếu),
+        # kèm các chuỗi con bắt buộc của regex để lọc nhanh pattern không thể khớp (xem time_matcher.Requires)
         self.time_patterns = [
             (r"(\d{1,2})(?:h|:)?(\d{2})?\s*(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*tuần\s*này",
-            lambda m: parse_time_weekday_this_week(m, self.current_time, self.weekday_map)),
+            partial(parse_time_weekday_this_week, weekday_map=self.weekday_map), (DIGIT, WEEKDAY_ATOMS, 'tuần', 'này')),
             (r"(\d{1,2})(?:h|:)?(\d{2})?\s*(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*tuần\s*sau",
-            lambda m: parse_time_weekday_next_week(m, self.current_time, self.weekday_map)),
+            partial(parse_time_weekday_next_week, weekday_map=self.weekday_map), (DIGIT, WEEKDAY_ATOMS, 'tuần', 'sau')),
             (r"(sáng|chiều|tối)\s*(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*(?:lúc|vào)?\s*(\d{1,2})(?:h|:)?(\d{2})?",
-            lambda m: parse_time_period_weekday_with_hour(m, self.current_time, self.weekday_map)),
+            partial(parse_time_period_weekday_with_hour, weekday_map=self.weekday_map), (PERIOD_ATOMS, WEEKDAY_ATOMS, DIGIT)),
             (r"(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*(?:tuần\s*này|tuần\s*sau)?\s*(?:lúc|vào)?\s*(\d{1,2})(?:h|:)?(\d{2})?",
-            lambda m: parse_weekday_time(m, self.current_time, self.weekday_map)),
+            partial(parse_weekday_time, weekday_map=self.weekday_map), (WEEKDAY_ATOMS, DIGIT)),
             (r"(\d{1,2})(?:h|:)?(\d{2})?\s*(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])",
-            lambda m: parse_time_weekday(m, self.current_time, self.weekday_map)),
+            partial(parse_time_weekday, weekday_map=self.weekday_map), (DIGIT, WEEKDAY_ATOMS)),
             (r"(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*tuần\s*này",
-            lambda m: parse_weekday_this_week(m, self.current_time, self.weekday_map)),
+            partial(parse_weekday_this_week, weekday_map=self.weekday_map), (WEEKDAY_ATOMS, 'tuần', 'này')),
             (r"(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])\s*tuần\s*sau",
-            lambda m: parse_weekday_next_week(m, self.current_time, self.weekday_map)),
+            partial(parse_weekday_next_week, weekday_map=self.weekday_map), (WEEKDAY_ATOMS, 'tuần', 'sau')),
             (r"(thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7])",
-            lambda m: parse_weekday(m, self.current_time, self.weekday_map)),
-            (r"(sáng|chiều|tối)\s*(hôm\s*nay|mai|ngày\s*kia)", lambda m: parse_time_period_day(m, self.current_time)),
+            partial(parse_weekday, weekday_map=self.weekday_map), (WEEKDAY_ATOMS,)),
+            (r"(sáng|chiều|tối)\s*(hôm\s*nay|mai|ngày\s*kia)", parse_time_period_day, (PERIOD_ATOMS, ('nay', 'mai', 'kia'))),
             (r"(sáng|chiều|tối)\s*(thứ\s*[2-7]|chủ\s*nhật)",
-            lambda m: parse_time_period_weekday(m, self.current_time, self.weekday_map)),
-            (r"sau\s*(\d+)\s*ngày", lambda m: parse_after_days(m, self.current_time)),
-            (r"sau\s*(\d+)\s*tuần", lambda m: parse_after_weeks(m, self.current_time)),
-            (r"sau\s*(\d+)\s*tháng", lambda m: parse_after_months(m, self.current_time)),
-        ] + get_time_patterns(self.current_time)
+            partial(parse_time_period_weekday, weekday_map=self.weekday_map), (PERIOD_ATOMS, ('thứ', 'chủ'))),
+            (r"sau\s*(\d+)\s*ngày", parse_after_days, ('sau', DIGIT, 'ngày')),
+            (r"sau\s*(\d+)\s*tuần", parse_after_weeks, ('sau', DIGIT, 'tuần')),
+            (r"sau\s*(\d+)\s*tháng", parse_after_months, ('sau', DIGIT, 'tháng')),
+        ] + get_time_patterns()
+        # Pattern biên dịch sẵn + cache theo câu, dùng chung giữa các advisor
+        self._time_matcher = get_time_matcher([(pattern, requires) for pattern, _, requires in self.time_patterns])
         # Danh mục công việc và từ khóa ưu tiên
         self.task_categories = task_categories
         self.high_priority_keywords = ['gấp', 'urgent', 'quan trọng', 'important', 'khẩn cấp', 'deadline', 'hạn chót']
@@ -96,13 +113,18 @@ class ScheduleAdvisor:
             self.calendar_service = GoogleCalendarService()
         except Exception:
             self.calendar_service = None
-        # Tạo kết nối DB
-        self.conn = sqlite3.connect(db_path)
-        self._create_table()
-
-    def _create_table(self):
-        """Tạo bảng schedules nếu chưa tồn tại."""
-        cursor = self.conn.cursor()
+        self._create_table(db_path)
+        # Kiểm tra trùng lịch / lấy lịch theo ngày qua chỉ mục trong bộ nhớ (tự nạp lại khi DB đổi)
+        self.schedule_index = get_schedule_index(db_path)
+        # Câu hỏi lịch trống nhiều ngày trên mảng phút trống theo ngày (cache dùng chung)
+        self.availability = get_availability_engine(db_path, self.business_hours, self.lunch_time)
+        self.free_slot_finder = FreeSlotFinder(self.schedule_index, self.vietnam_tz,
+                                               business_hours=self.business_hours, lunch_time=self.lunch_time)
+
+    def _create_table(self, db_path: str):
+        """Tạo bảng schedules nếu chưa tồn tại (kết nối ngắn hạn; các truy vấn sau đó đi qua chỉ mục lịch)."""
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS schedules (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -110,54 +132,70 @@ class ScheduleAdvisor:
                 description TEXT,
                 start_time TEXT,
                 end_time TEXT,
-                created_at TEXT
+                created_at TEXT,
+                deleted INTEGER DEFAULT 0
             )
         ''')
-        self.conn.commit()
-
-    def _extract_time(self, text: str) -> Optional[datetime]:
-        """Trích xuất thời gian từ văn bản người dùng."""
-        text_lower = text.lower()
-        for pattern, parser in self.time_patterns:
-            match = re.search(pattern, text_lower)
-            if match:
-                try:
-                    result = parser(match)
-                    if result:
-                        # Gán múi giờ nếu chưa có
-                        if result.tzinfo is None or result.tzinfo.utcoffset(result) is None:
-                            result = self.vietnam_tz.localize(result)
-                        
-                        if result > self.current_time:
-                            return result
-                except (ValueError, TypeError):
-                    continue
+        # Bảng cũ có thể chưa có cột deleted (check_schedule_overlap lọc theo cột này)
+        cursor.execute("PRAGMA table_info(schedules)")
+        if 'deleted' not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE schedules ADD COLUMN deleted INTEGER DEFAULT 0")
+        conn.commit()
+        conn.close()
+
+    def _now(self) -> datetime:
+        return (self.clock or get_clock()).now(self.vietnam_tz)
+
+    @property
+    def current_time(self) -> datetime:
+        """Thời điểm hiện tại theo đồng hồ của advisor (đọc lại mỗi lần truy cập)."""
+        return self._now()
+
+    def _extract_time(self, text: str, now: datetime = None) -> Optional[datetime]:
+        """Trích xuất thời gian từ văn bản người dùng (so với now, mặc định là thời điểm hiện tại)."""
+        now = now or self._now()
+        # Các pattern khớp theo thứ tự ưu tiên; pattern đầu tiên cho thời điểm tương lai được chọn
+        for index, match in self._time_matcher.matches(text):
+            parser = self.time_patterns[index][1]
+            try:
+                result = parser(match, now)
+                if result:
+                    # Gán múi giờ nếu chưa có
+                    if result.tzinfo is None or result.tzinfo.utcoffset(result) is None:
+                        result = self.vietnam_tz.localize(result)
+                    
+                    if result > now:
+                        return result
+            except (ValueError, TypeError):
+                continue
         return None
 
-    def _resolve_preferred_date(self, preferred_date: Optional[str], preferred_weekday: Optional[str]) -> Optional[datetime]:
+    def _resolve_preferred_date(self, preferred_date: Optional[str], preferred_weekday: Optional[str],
+                                now: datetime = None) -> Optional[datetime]:
         """Ưu tiên preferred_date, nếu không có thì dùng preferred_weekday."""
+        now = now or self._now()
         if preferred_date:
             try:
                 dt = datetime.strptime(preferred_date, "%Y-%m-%d").replace(tzinfo=self.vietnam_tz)
-                if dt >= self.current_time:
+                if dt >= now:
                     return dt
             except ValueError:
                 pass
         if preferred_weekday:
             wd = self.weekday_map.get(preferred_weekday.lower())
             if wd is not None:
-                days_ahead = (wd - self.current_time.weekday() + 7) % 7
+                days_ahead = (wd - now.weekday() + 7) % 7
                 if days_ahead == 0:
                     days_ahead = 7
-                return (self.current_time + timedelta(days=days_ahead)).replace(hour=9, minute=0, second=0, microsecond=0)
+                return (now + timedelta(days=days_ahead)).replace(hour=9, minute=0, second=0, microsecond=0)
         return None
         
-    def _default_time_from_tod(self, preferred_time_of_day: str) -> Optional[datetime]:
+    def _default_time_from_tod(self, preferred_time_of_day: str, now: datetime = None) -> Optional[datetime]:
         """
         Tạo đối tượng datetime mặc định dựa trên khung giờ ưa thích (sáng/chiều/tối).
         Nếu thời gian gợi ý trong quá khứ, đẩy nó sang ngày hôm sau.
         """
-        base = self.current_time
+        base = now or self._now()
         suggested_time = None
         
         if preferred_time_of_day.lower() == 'sáng':
@@ -168,7 +206,7 @@ class ScheduleAdvisor:
             suggested_time = base.replace(hour=19, minute=0, second=0, microsecond=0)
         
         # Nếu thời gian gợi ý đã qua, chuyển sang ngày hôm sau
-        if suggested_time and suggested_time <= self.current_time:
+        if suggested_time and suggested_time <= base:
             suggested_time += timedelta(days=1)
             
         return suggested_time
@@ -181,20 +219,22 @@ class ScheduleAdvisor:
                         priority: Optional[str] = None) -> Dict[str, Union[str, List[str]]]:
 
         try:
+            # Một thời điểm tham chiếu cho cả lượt phân tích
+            now = self._now()
             task_info = self._categorize_task_and_priority(user_request)
             duration_minutes, duration_provided = self._normalize_duration(duration, user_request, task_info['duration'])
             priority_norm, priority_provided = self._normalize_priority(priority, user_request)
             priority = priority_norm
 
             # 1. Ưu tiên parse từ text trước (có thời gian cụ thể)
-            suggested_time = self._extract_time(user_request)
+            suggested_time = self._extract_time(user_request, now)
 
             # 2. Nếu chưa có, dùng preferred_date/weekday nhưng cần có thời gian cụ thể
             if suggested_time is None:
-                date_time = self._resolve_preferred_date(preferred_date, preferred_weekday)
+                date_time = self._resolve_preferred_date(preferred_date, preferred_weekday, now)
                 if date_time and preferred_time_of_day:
                     # Combine date with time of day
-                    suggested_time = self._default_time_from_tod(preferred_time_of_day)
+                    suggested_time = self._default_time_from_tod(preferred_time_of_day, now)
                     if suggested_time and date_time:
                         suggested_time = suggested_time.replace(
                             year=date_time.year, 
@@ -206,7 +246,7 @@ class ScheduleAdvisor:
 
             # 3. Nếu vẫn chưa có, fallback dựa trên preferred_time_of_day
             if suggested_time is None and preferred_time_of_day:
-                suggested_time = self._default_time_from_tod(preferred_time_of_day)
+                suggested_time = self._default_time_from_tod(preferred_time_of_day, now)
 
             # 4. Nếu vẫn không có, yêu cầu thêm thông tin
             if suggested_time is None:
@@ -218,7 +258,7 @@ class ScheduleAdvisor:
                 original_time = self.vietnam_tz.localize(original_time)
             
             original_end_time = original_time + timedelta(minutes=duration_minutes)
-            has_conflict = not check_schedule_overlap(self.conn, original_time, original_end_time)
+            has_conflict = not self.schedule_index.is_free(original_time, original_end_time)
             
             # Lấy lịch hiện có để hiển thị
             existing_schedules = self._get_schedules_for_day(original_time)
@@ -226,24 +266,21 @@ class ScheduleAdvisor:
             
             if has_conflict:
                 # Tìm lịch trùng cụ thể để thông báo
-                for schedule in existing_schedules:
+                for schedule in self.schedule_index.conflicts(original_time, original_end_time):
                     schedule_start = datetime.fromisoformat(schedule['start_time'])
                     schedule_end = datetime.fromisoformat(schedule['end_time'])
                     if schedule_start.tzinfo is None:
                         schedule_start = self.vietnam_tz.localize(schedule_start)
                     if schedule_end.tzinfo is None:
                         schedule_end = self.vietnam_tz.localize(schedule_end)
-                    
-                    # Kiểm tra overlap
-                    if not (original_end_time <= schedule_start or original_time >= schedule_end):
-                        # Convert to Vietnam time for display
-                        display_start = schedule_start.astimezone(self.vietnam_tz)
-                        display_end = schedule_end.astimezone(self.vietnam_tz)
-                        conflict_details.append(f"**{schedule['title']}** ({display_start.strftime('%H:%M')}-{display_end.strftime('%H:%M')})")
+                    # Convert to Vietnam time for display
+                    display_start = schedule_start.astimezone(self.vietnam_tz)
+                    display_end = schedule_end.astimezone(self.vietnam_tz)
+                    conflict_details.append(f"**{schedule['title']}** ({display_start.strftime('%H:%M')}-{display_end.strftime('%H:%M')})")
 
             # 6. Validate và tìm thời gian thay thế
-            adjusted_time, warnings = self._validate_business_time(suggested_time, duration_minutes, priority)
-            alternatives = self._generate_alternative_times(adjusted_time, task_info)
+            adjusted_time, warnings = self._validate_business_time(suggested_time, duration_minutes, priority, now)
+            alternatives = self._generate_alternative_times(adjusted_time, task_info, now)
 
             # 7. Tạo response với thông báo trùng lịch rõ ràng
             if has_conflict:
@@ -393,7 +430,7 @@ class ScheduleAdvisor:
                 elif hasattr(self.llm, "chat"):
                     out = self.llm.chat(prompt)
                 elif hasattr(self.llm, "generate_with_timeout"):
-                    out = self.llm.generate_with_timeout(prompt, functions=None)
+                    out = self.llm.generate_with_timeout(prompt, functions=None, feature='followup_question')
                 else:
                     out = None
                 if isinstance(out, str) and out.strip():
@@ -423,7 +460,8 @@ class ScheduleAdvisor:
             'best_time': (9, 17)
         }
 
-    def _validate_business_time(self, suggested_time: datetime, duration: int, priority: str) -> Tuple[datetime, List[str]]:
+    def _validate_business_time(self, suggested_time: datetime, duration: int, priority: str,
+                                now: datetime = None) -> Tuple[datetime, List[str]]:
         """
         Kiểm tra và điều chỉnh thời gian đề xuất để phù hợp với giờ làm việc và lịch trống.
         Thêm tham số 'priority' để xét mức độ ưu tiên.
@@ -460,10 +498,10 @@ class ScheduleAdvisor:
         max_attempts = 5  # Giới hạn số lần thử để tránh vòng lặp vô hạn
         attempts = 0
         
-        while not check_schedule_overlap(self.conn, adjusted_time, end_time) and attempts < max_attempts:
+        while not self.schedule_index.is_free(adjusted_time, end_time) and attempts < max_attempts:
             warnings.append(f"Thời gian {adjusted_time.strftime('%H:%M')} đã có lịch, đang tìm thời gian khác...")
             try:
-                adjusted_time = self._find_next_available_slot(adjusted_time, duration, priority)
+                adjusted_time = self._find_next_available_slot(adjusted_time, duration, priority, now)
                 end_time = adjusted_time + timedelta(minutes=duration)
                 attempts += 1
             except Exception as e:
@@ -472,106 +510,33 @@ class ScheduleAdvisor:
 
         return adjusted_time, warnings
 
-    def _find_next_available_slot(self, start_time: datetime, duration: int, priority: str) -> datetime:
+    def _find_next_available_slot(self, start_time: datetime, duration: int, priority: str,
+                                  now: datetime = None) -> datetime:
         """
-        Tìm kiếm khung giờ trống gần nhất trong vòng 7 ngày tới.
-        Đã tích hợp logic dựa trên mức độ ưu tiên.
+        Tìm kiếm khung giờ trống gần nhất trong vòng 7 ngày tới (2 ngày nếu ưu tiên cao), bỏ qua cuối tuần.
+        Ưu tiên giờ tròn / rưỡi; nếu không có thì lấy khoảng trống bất kỳ đủ dài.
         """
+        now = now or self._now()
         # Đảm bảo start_time có múi giờ
         if start_time.tzinfo is None or start_time.tzinfo.utcoffset(start_time) is None:
             start_time = self.vietnam_tz.localize(start_time)
-        
-        # Bắt đầu tìm từ ngày hiện tại
-        search_date = start_time.date()
         max_search_days = 2 if priority == 'Cao' else 7
-        
-        # Tạo danh sách các khung giờ ưu tiên trong ngày (tránh giờ ăn trưa)
-        preferred_hours = []
-        business_start, business_end = self.business_hours
-        lunch_start, lunch_end = self.lunch_time
-        
-        for hour in range(business_start, business_end):
-            if hour < lunch_start or hour >= lunch_end:
-                preferred_hours.append(hour)
-        
-        for i in range(max_search_days):
-            current_date = search_date + timedelta(days=i)
-            
-            # Bỏ qua cuối tuần
-            if current_date.weekday() >= 5:
-                continue
-            
-            # Nếu là ngày hiện tại, chỉ tìm từ giờ hiện tại trở đi
-            if current_date == self.current_time.date():
-                current_hour = max(self.current_time.hour, business_start)
-                preferred_hours = [h for h in preferred_hours if h >= current_hour]
-            
-            # Thử từng khung giờ ưu tiên
-            for hour in preferred_hours:
-                for minute in [0, 30]:  # Thử cả giờ tròn và 30 phút
-                    candidate_time = datetime.combine(current_date, datetime.min.time()).replace(
-                        hour=hour, minute=minute, tzinfo=self.vietnam_tz
-                    )
-                    candidate_end = candidate_time + timedelta(minutes=duration)
-                    
-                    # Kiểm tra không vượt quá giờ làm việc
-                    if candidate_end.hour > business_end:
-                        continue
-                    
-                    # Kiểm tra không trùng với lịch hiện có
-                    if check_schedule_overlap(self.conn, candidate_time, candidate_end):
-                        return candidate_time
-            
-            # Nếu không tìm được trong các khung giờ ưu tiên, tìm bất kỳ khoảng trống nào
-            schedules_on_day = self._get_schedules_for_day(datetime.combine(current_date, datetime.min.time()).replace(tzinfo=self.vietnam_tz))
-            
-            if not schedules_on_day:
-                # Không có lịch nào trong ngày, trả về giờ bắt đầu làm việc
-                return datetime.combine(current_date, datetime.min.time()).replace(
-                    hour=business_start, minute=0, tzinfo=self.vietnam_tz
-                )
-            
-            # Sắp xếp lịch theo thời gian bắt đầu
-            sorted_schedules = sorted(schedules_on_day, key=lambda x: datetime.fromisoformat(x['start_time']))
-            
-            # Tìm khoảng trống giữa các lịch
-            last_end_time = datetime.combine(current_date, datetime.min.time()).replace(
-                hour=business_start, minute=0, tzinfo=self.vietnam_tz
-            )
-            
-            for schedule in sorted_schedules:
-                current_start = datetime.fromisoformat(schedule['start_time'])
-                if current_start.tzinfo is None:
-                    current_start = self.vietnam_tz.localize(current_start)
-                
-                # Kiểm tra khoảng trống trước lịch này
-                if (current_start - last_end_time).total_seconds() >= duration * 60:
-                    # Kiểm tra không trùng giờ ăn trưa
-                    if not (lunch_start <= last_end_time.hour < lunch_end):
-                        return last_end_time
-                
-                # Cập nhật thời gian kết thúc cuối cùng
-                last_end_time = datetime.fromisoformat(schedule['end_time'])
-                if last_end_time.tzinfo is None:
-                    last_end_time = self.vietnam_tz.localize(last_end_time)
-                
-                # Nếu kết thúc trong giờ ăn trưa, chuyển đến sau giờ ăn trưa
-                if lunch_start <= last_end_time.hour < lunch_end:
-                    last_end_time = last_end_time.replace(hour=lunch_end, minute=0)
-            
-            # Kiểm tra khoảng trống cuối ngày
-            end_of_business_day = datetime.combine(current_date, datetime.min.time()).replace(
-                hour=business_end, minute=0, tzinfo=self.vietnam_tz
-            )
-            
-            if (end_of_business_day - last_end_time).total_seconds() >= duration * 60:
-                return last_end_time
-        
+
+        # Tìm từ đầu ngày của start_time, nhưng không sớm hơn hiện tại
+        day_start = self.vietnam_tz.localize(datetime.combine(start_time.date(), datetime.min.time()))
+        search_from = max(day_start, now)
+        for step_minutes in (30, 1):
+            slot = self.availability.first_free(search_from, duration, horizon_days=max_search_days,
+                                                step_minutes=step_minutes, skip_weekends=True)
+            if slot is not None:
+                return slot.astimezone(self.vietnam_tz)
+
         # Nếu không tìm thấy trong khoảng thời gian cho phép, ném exception
         raise Exception(f"Không tìm thấy khung giờ trống phù hợp trong vòng {max_search_days} ngày tới.")
 
-    def _generate_alternative_times(self, base_time: datetime, task_info: Dict) -> List[str]:
+    def _generate_alternative_times(self, base_time: datetime, task_info: Dict, now: datetime = None) -> List[str]:
         """Tạo các gợi ý thời gian thay thế không trùng với lịch hiện có."""
+        now = now or self._now()
         alternatives = []
         duration = task_info.get('duration', 60)
         best_start, best_end = task_info.get('best_time', self.business_hours)
@@ -593,9 +558,9 @@ class ScheduleAdvisor:
         # Thử các khung giờ trong cùng ngày
         for hour in suggestion_hours:
             alt_time = base_time.replace(hour=hour, minute=0)
-            if alt_time > self.current_time:
+            if alt_time > now:
                 alt_end = alt_time + timedelta(minutes=duration)
-                if check_schedule_overlap(self.conn, alt_time, alt_end):
+                if self.schedule_index.is_free(alt_time, alt_end):
                     alternatives.append(alt_time.strftime('%H:%M %A, %d/%m/%Y'))
         
         # Thử ngày hôm sau và các ngày tiếp theo
@@ -612,7 +577,7 @@ class ScheduleAdvisor:
                     alt_time = next_day.replace(hour=hour, minute=0)
                     alt_end = alt_time + timedelta(minutes=duration)
                     
-                    if check_schedule_overlap(self.conn, alt_time, alt_end):
+                    if self.schedule_index.is_free(alt_time, alt_end):
                         alternatives.append(alt_time.strftime('%H:%M %A, %d/%m/%Y'))
                         break  # Chỉ lấy 1 thời gian mỗi ngày
         
@@ -621,21 +586,13 @@ class ScheduleAdvisor:
         return unique_alternatives[:3]
 
     def _get_schedules_for_day(self, target_date: datetime) -> List[Dict[str, str]]:
-        """Lấy tất cả các lịch hẹn trong một ngày cụ thể."""
-        cursor = self.conn.cursor()
-        date_str = target_date.strftime('%Y-%m-%d')
-        cursor.execute(
-            'SELECT title, start_time, end_time FROM schedules WHERE strftime("%Y-%m-%d", start_time) = ?',
-            (date_str,)
-        )
-        schedules = []
-        for row in cursor.fetchall():
-            schedules.append({
-                'title': row[0],
-                'start_time': row[1],
-                'end_time': row[2]
-            })
-        return schedules
+        """Lấy tất cả các lịch hẹn bắt đầu trong ngày (giờ Việt Nam) của target_date."""
+        day_start = self.vietnam_tz.localize(datetime.combine(target_date.date(), datetime.min.time()))
+        day_end = self.vietnam_tz.localize(datetime.combine(target_date.date() + timedelta(days=1), datetime.min.time()))
+        return [
+            {'title': row['title'], 'start_time': row['start_time'], 'end_time': row['end_time']}
+            for row in self.schedule_index.starting_between(day_start, day_end)
+        ]
 
     def format_response(self, response: Dict) -> str:
         if response['status'] == 'success':
@@ -735,43 +692,41 @@ class ScheduleAdvisor:
             result += f"Chi tiết lỗi: {response.get('error', 'Không xác định')}"
         return result
 
-    def find_available_slots(self, target_date: datetime, duration_minutes: int, preferred_start_hour: int = None, preferred_end_hour: int = None) -> List[str]:
+    def find_available_slots(self, target_date: datetime, duration_minutes: int, preferred_start_hour: int = None,
+                             preferred_end_hour: int = None, step_minutes: int = 15, days: int = 1,
+                             limit: int = 10) -> List[str]:
         """
-        Tìm các khung giờ trống trong ngày cụ thể
+        Tìm các khung giờ trống từ ngày target_date (days ngày liên tiếp), tránh giờ nghỉ trưa.
+        Nhiều ngày thì mỗi slot kèm ngày: "dd/mm HH:MM - HH:MM".
+        preferred_start_hour / preferred_end_hour bằng None hoặc 0 (không có ưu tiên) dùng giờ làm việc.
         """
-        available_slots = []
-        
-        # Thiết lập khung giờ tìm kiếm
-        start_hour = preferred_start_hour or self.business_hours[0]  # 8h
-        end_hour = preferred_end_hour or self.business_hours[1]      # 17h
-        
-        # Tạo các slot 30 phút
-        current_time = target_date.replace(hour=start_hour, minute=0, second=0, microsecond=0)
-        end_time = target_date.replace(hour=end_hour, minute=0, second=0, microsecond=0)
-        
-        while current_time + timedelta(minutes=duration_minutes) <= end_time:
-            slot_end = current_time + timedelta(minutes=duration_minutes)
-            
-            # Bỏ qua giờ ăn trưa
-            if not (current_time.hour == 12 and current_time.minute == 0):
-                # Kiểm tra xung đột với database
-                if self.calendar_service:
-                    is_free = self.calendar_service.is_time_slot_free(current_time, slot_end)
-                else:
-                    # Fallback kiểm tra với database trực tiếp
-                    is_free = check_schedule_overlap(self.conn, current_time, slot_end)
-                
-                if is_free:
-                    available_slots.append(f"{current_time.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}")
-                    
-            # Chuyển sang slot tiếp theo (15 phút)
-            current_time += timedelta(minutes=15)
-            
-            # Giới hạn tối đa 10 slots để không quá nhiều
-            if len(available_slots) >= 10:
-                break
-                
-        return available_slots
+        start = self.vietnam_tz.localize(datetime.combine(target_date.date(), datetime.min.time()))
+        slots = self.free_slot_finder.slots(
+            start, start + timedelta(days=days), duration_minutes,
+            step_minutes=step_minutes, limit=limit,
+            start_hour=preferred_start_hour or self.business_hours[0],
+            end_hour=preferred_end_hour or self.business_hours[1]
+        )
+        prefix = '%d/%m ' if days > 1 else ''
+        return [f"{slot_start.strftime(prefix + '%H:%M')} - {slot_end.strftime('%H:%M')}" for slot_start, slot_end in slots]
+
+    def find_common_slots(self, target_date: datetime, duration_minutes: int, participant_db_paths: List[str] = (),
+                          google_calendar_ids: List[str] = (), step_minutes: int = 15, days: int = 1,
+                          limit: int = 10) -> List[str]:
+        """
+        Khung giờ trống chung của lịch này và lịch của những người / tài nguyên khác
+        (file DB cục bộ, calendar Google qua freebusy), cùng định dạng với find_available_slots.
+        Calendar Google không lấy được freebusy: raise FreeBusyUnavailableError.
+        """
+        group = GroupAvailability([self.schedule_index.db_path, *participant_db_paths], google_calendar_ids,
+                                  calendar_service=self.calendar_service,
+                                  business_hours=self.business_hours, lunch_time=self.lunch_time)
+        start = self.vietnam_tz.localize(datetime.combine(target_date.date(), datetime.min.time()))
+        slots = group.free_slots(start, start + timedelta(days=days), duration_minutes,
+                                 step_minutes=step_minutes, limit=limit)
+        prefix = '%d/%m ' if days > 1 else ''
+        return [f"{slot_start.astimezone(self.vietnam_tz).strftime(prefix + '%H:%M')} - "
+                f"{slot_end.astimezone(self.vietnam_tz).strftime('%H:%M')}" for slot_start, slot_end in slots]
 
     async def intelligent_schedule_advice(self, user_input: str, context: Dict = None) -> str:
         """
@@ -784,7 +739,8 @@ class ScheduleAdvisor:
         
         try:
             # Trích xuất thông tin từ yêu cầu người dùng
-            extracted_time = self._extract_time(user_input)
+            now = self._now()
+            extracted_time = self._extract_time(user_input, now)
             duration_minutes = self._extract_duration_from_text(user_input)
             
             if extracted_time and duration_minutes:
@@ -814,7 +770,7 @@ class ScheduleAdvisor:
 TƯ VẤN LỊCH TRÌNH NGẮN GỌN
 
 Yêu cầu: {user_input}
-Thời gian hiện tại: {self.current_time.strftime('%Y-%m-%d %H:%M')} (Việt Nam)
+Thời gian hiện tại: {now.strftime('%Y-%m-%d %H:%M')} (Việt Nam)
 
 Hãy phân tích yêu cầu và hỏi NGẮN GỌN những thông tin còn thiếu:
 - Ngày cụ thể (nếu chưa rõ)
@@ -825,11 +781,11 @@ Chỉ hỏi tối đa 2 câu, không dài dòng.
 Ví dụ: "Bạn muốn khám vào ngày nào? Thời lượng khoảng bao lâu?"
 """
             
-            gemini_response = await self.llm.process_message(gemini_prompt)
+            gemini_response = await self.llm.process_message(gemini_prompt, feature='smart_advice')
             return gemini_response
             
         except Exception as e:
-            print(f"Lỗi khi sử dụng tư vấn thông minh: {e}")
+            logger.warning("Lỗi khi sử dụng tư vấn thông minh: %s", e)
             # Fallback về phương thức truyền thống
             response = self.analyze_schedule_request(user_input)
             return self.format_response(response)
@@ -877,8 +833,4 @@ Ví dụ: "Bạn muốn khám vào ngày nào? Thời lượng khoảng bao lâu
             except Exception:
                 continue
         
-        return "\n".join(formatted) if formatted else "Không có lịch trình nào."
-
-    def __del__(self):
-        if getattr(self, 'conn', None):
-            self.conn.close()
\ No newline at end of file
+        return "\n".join(formatted) if formatted else "Không có lịch trình nào."
\ No newline at end of file
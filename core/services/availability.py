@@ -0,0 +1,183 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import Config
+from core.services.schedule_index import ScheduleIntervalIndex, get_schedule_index, to_epoch
+from utils.timezone_utils import VIETNAM_TZ
+
+MINUTES_PER_DAY = 24 * 60
+# Mỗi hàng ngày thêm một cột False làm vách ngăn giữa các ngày
+_WIDTH = MINUTES_PER_DAY + 1
+_FIRST_CHUNK_DAYS = 7
+
+
+def free_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(vị trí bắt đầu, vị trí kết thúc) của các đoạn True liên tiếp trong mảng bool một chiều."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _slot_positions(flat: np.ndarray, duration: int, step: int, limit: Optional[int]) -> np.ndarray:
+    """Vị trí (trong mảng phẳng các hàng _WIDTH) của các slot trống dài duration, trên lưới step phút mỗi ngày."""
+    starts, ends = free_runs(flat)
+    # Điểm lưới đầu tiên trong mỗi đoạn và số slot đoạn đó chứa
+    first = starts + (-(starts % _WIDTH)) % step
+    counts = np.maximum((ends - duration - first) // step + 1, 0)
+    first, counts = first[counts > 0], counts[counts > 0]
+    if limit is not None:
+        keep = int(np.searchsorted(np.cumsum(counts), limit)) + 1
+        first, counts = first[:keep], counts[:keep]
+    offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.repeat(first, counts) + offsets * step
+    return positions if limit is None else positions[:limit]
+
+
+class AvailabilityEngine:
+    """
+    Trả lời câu hỏi lịch trống trên nhiều ngày bằng mảng chiếm chỗ theo phút: mỗi ngày (giờ Việt Nam)
+    là mảng bool 1440 phần tử, True là phút trống trong giờ làm việc, ngoài giờ nghỉ trưa và không có lịch.
+    Mảng của từng ngày được cache (LRU) và bỏ hết khi chỉ mục lịch nạp lại dữ liệu mới. Một truy vấn
+    ghép các ngày thành ma trận, cắt theo khung giờ rồi tìm các đoạn trống bằng phép toán vector.
+    """
+
+    def __init__(self, index: ScheduleIntervalIndex, business_hours: Tuple[int, int] = None,
+                 lunch_time: Optional[Tuple[int, int]] = None, cache_days: int = None):
+        self.index = index
+        self.business_hours = business_hours or Config.WORK_TIME
+        self.lunch_time = Config.LUNCH_TIME if lunch_time is None else lunch_time
+        self.cache_days = cache_days or Config.AVAILABILITY_CACHE_DAYS
+        # Mặt nạ giờ làm việc trừ giờ trưa, dùng chung cho mọi ngày
+        self._template = np.zeros(MINUTES_PER_DAY, dtype=bool)
+        self._template[self.business_hours[0] * 60:self.business_hours[1] * 60] = True
+        if self.lunch_time:
+            self._template[self.lunch_time[0] * 60:self.lunch_time[1] * 60] = False
+        self._days: "OrderedDict[date, np.ndarray]" = OrderedDict()
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _day_start(day: date) -> datetime:
+        return datetime.combine(day, datetime.min.time()).replace(tzinfo=VIETNAM_TZ)
+
+    def _build_day(self, day: date) -> np.ndarray:
+        mask = self._template.copy()
+        origin = to_epoch(self._day_start(day))
+        for start, end in self.index.busy_between(origin, origin + MINUTES_PER_DAY * 60):
+            # Phút có lịch chiếm một phần cũng tính là bận
+            mask[int((start - origin) // 60):int(-(-(end - origin) // 60))] = False
+        mask.flags.writeable = False
+        return mask
+
+    def day_masks(self, days: List[date]) -> List[np.ndarray]:
+        """Mảng phút trống (chỉ đọc) của các ngày; kiểm tra phiên bản dữ liệu một lần cho cả lượt."""
+        snapshot = self.index.snapshot()
+        with self._lock:
+            if snapshot is not self._snapshot:
+                # Chỉ mục vừa nạp lại: mọi ngày đã cache có thể đã đổi
+                self._days.clear()
+                self._snapshot = snapshot
+            masks = []
+            for day in days:
+                mask = self._days.get(day)
+                if mask is not None:
+                    self._days.move_to_end(day)
+                    self.hits += 1
+                masks.append(mask)
+        missing = [i for i, mask in enumerate(masks) if mask is None]
+        if missing:
+            for i in missing:
+                masks[i] = self._build_day(days[i])
+            with self._lock:
+                self.misses += len(missing)
+                if self._snapshot is snapshot:
+                    for i in missing:
+                        self._days[days[i]] = masks[i]
+                    while len(self._days) > self.cache_days:
+                        self._days.popitem(last=False)
+        return masks
+
+    def day_mask(self, day: date) -> np.ndarray:
+        """Mảng phút trống (chỉ đọc) của một ngày."""
+        return self.day_masks([day])[0]
+
+    def find_slots(self, start: datetime, duration_minutes: int, horizon_days: int = 14,
+                   window: Optional[Tuple[float, float]] = None, step_minutes: int = 1,
+                   limit: Optional[int] = 1, skip_weekends: bool = False) -> List[datetime]:
+        """
+        Giờ bắt đầu của các slot trống dài duration_minutes, từ start trong horizon_days ngày,
+        nằm trọn trong khung giờ window (giờ, vd: (8, 12) là buổi sáng), bắt đầu ở phút chia hết
+        cho step_minutes; theo thứ tự thời gian, tối đa limit slot (None: tất cả).
+        """
+        local = start.astimezone(VIETNAM_TZ)
+        first_day = local.date()
+        allowed = None
+        if window is not None:
+            allowed = np.zeros(MINUTES_PER_DAY, dtype=bool)
+            allowed[int(round(window[0] * 60)):int(round(window[1] * 60))] = True
+        # Phút đang diễn ra không còn dùng được
+        elapsed = local.hour * 60 + local.minute + (1 if local.second or local.microsecond else 0)
+
+        found: List[datetime] = []
+        offset, chunk = 0, _FIRST_CHUNK_DAYS if limit is not None else horizon_days
+        # Có limit thì quét từng khối ngày (khối sau gấp đôi) và dừng khi đủ slot
+        while offset < horizon_days and (limit is None or len(found) < limit):
+            count = min(chunk, horizon_days - offset)
+            days = [first_day + timedelta(days=offset + i) for i in range(count)]
+            # Cột False cuối mỗi hàng để đoạn trống không nối qua nửa đêm
+            matrix = np.zeros((count, _WIDTH), dtype=bool)
+            matrix[:, :MINUTES_PER_DAY] = self.day_masks(days)
+            if allowed is not None:
+                matrix[:, :MINUTES_PER_DAY] &= allowed
+            if skip_weekends:
+                matrix[[day.weekday() >= 5 for day in days]] = False
+            if offset == 0:
+                matrix[0, :elapsed] = False
+            remaining = None if limit is None else limit - len(found)
+            origin = self._day_start(days[0])
+            found += [origin + timedelta(days=int(p // _WIDTH), minutes=int(p % _WIDTH))
+                      for p in _slot_positions(matrix.ravel(), duration_minutes, step_minutes, remaining)]
+            offset += count
+            chunk *= 2
+        return found
+
+    def first_free(self, start: datetime, duration_minutes: int, horizon_days: int = 14,
+                   window: Optional[Tuple[float, float]] = None, step_minutes: int = 1,
+                   skip_weekends: bool = False) -> Optional[datetime]:
+        """Slot trống sớm nhất (xem find_slots); None nếu không có."""
+        found = self.find_slots(start, duration_minutes, horizon_days, window, step_minutes, 1, skip_weekends)
+        return found[0] if found else None
+
+    def free_intervals(self, day: date) -> List[Tuple[datetime, datetime]]:
+        """Các khoảng trống liên tục trong ngày."""
+        starts, ends = free_runs(self.day_mask(day))
+        origin = self._day_start(day)
+        return [(origin + timedelta(minutes=int(s)), origin + timedelta(minutes=int(e))) for s, e in zip(starts, ends)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'cached_days': len(self._days), 'hits': self.hits, 'misses': self.misses}
+
+
+_engines: Dict[Tuple[str, Tuple[int, int], Optional[Tuple[int, int]]], AvailabilityEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_availability_engine(db_path: Optional[str] = None, business_hours: Tuple[int, int] = None,
+                            lunch_time: Optional[Tuple[int, int]] = None) -> AvailabilityEngine:
+    """Engine dùng chung trong process cho mỗi file DB và cấu hình giờ làm việc."""
+    business_hours = tuple(business_hours or Config.WORK_TIME)
+    lunch_time = tuple(Config.LUNCH_TIME if lunch_time is None else lunch_time)
+    key = (os.path.abspath(db_path or Config.DATABASE_PATH), business_hours, lunch_time)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = _engines[key] = AvailabilityEngine(get_schedule_index(key[0]), business_hours, lunch_time)
+    return engine
@@ -0,0 +1,145 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from core.config import Config
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Pragma áp dụng cho mọi kết nối trong pool
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # an toàn với WAL, bỏ fsync ở mỗi commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",  # ~8MB page cache cho mỗi kết nối
+)
+
+
+class SQLitePool:
+    """
+    Pool kết nối SQLite dùng chung giữa các thread.
+    Kết nối sống lâu nên cache prepared statement của sqlite3 (cached_statements)
+    được tái sử dụng giữa các lượt thay vì biên dịch lại SQL mỗi lần connect.
+    """
+
+    def __init__(self, db_path: str, size: int = None, timeout: float = None):
+        self.db_path = db_path
+        self.size = size or Config.DB_POOL_SIZE
+        self.timeout = timeout or Config.CONNECTION_TIMEOUT
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=Config.DB_CACHED_STATEMENTS
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Hết kết nối trong pool sau {self.timeout}s: {self.db_path}")
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Mượn một kết nối; commit khi khối with kết thúc bình thường,
+        rollback nếu có exception, rồi trả kết nối về pool.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Đóng các kết nối đang rảnh; kết nối đang được mượn sẽ bị đóng khi trả về."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'size': self.size,
+            'created': self._created,
+            'idle': self._idle.qsize(),
+            'in_use': self._created - self._idle.qsize()
+        }
+
+
+def db_key(db_path: Optional[str] = None) -> str:
+    """
+    Khóa của các singleton theo DB: đường dẫn tuyệt đối của file; tên đặc biệt dạng ':...:'
+    (DB trong bộ nhớ, vd: ':memory:', ':ephemeral:') giữ nguyên thay vì thành một file trong cwd.
+    """
+    db_path = db_path or Config.DATABASE_PATH
+    if len(db_path) > 1 and db_path.startswith(':') and db_path.endswith(':'):
+        return db_path
+    return os.path.abspath(db_path)
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: Optional[str] = None) -> SQLitePool:
+    """Pool dùng chung trong process cho mỗi file DB (theo db_key)."""
+    key = db_key(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = SQLitePool(key)
+    return pool
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from core.config import Config
+from core.services.connection_pool import db_key
+
+CONTEXT_HEADER = "💭 LỊCH SỬ CUỘC TRÒ CHUYỆN GẦN ĐÂY:"
+CONTEXT_FOOTER = "🎯 HÃY SỬ DỤNG THÔNG TIN TRÊN để hiểu bối cảnh và trả lời phù hợp.\n---"
+
+
+def render_message(role: str, content: str, function_call: Optional[Dict[str, Any]]) -> str:
+    """Khối văn bản của một message trong context gửi cho AI model."""
+    role_label = "👤 Người dùng" if role == 'user' else "🤖 Trợ lý"
+    lines = [f"{role_label}: {content}"]
+    if function_call:
+        func_name = function_call.get('name', 'Unknown')
+        func_args = function_call.get('args', {})
+        lines.append(f"   ⚙️ Đã thực hiện: {func_name}")
+        # Thêm thông tin quan trọng từ args
+        if 'title' in func_args:
+            lines.append(f"   📝 Tiêu đề: {func_args['title']}")
+        if 'start_time' in func_args:
+            lines.append(f"   🕐 Thời gian: {func_args['start_time']}")
+    return "\n".join(lines)
+
+
+def render_context(blocks: List[str]) -> str:
+    """Ghép các khối message (cũ trước) thành context hoàn chỉnh."""
+    if not blocks:
+        return ""
+    return f"{CONTEXT_HEADER}\n\n" + "\n\n".join(blocks) + f"\n\n{CONTEXT_FOOTER}"
+
+
+class RenderedContextCache:
+    """
+    Ring các khối message đã render cho CONTEXT_WINDOW_SIZE message gần nhất của mỗi session,
+    dùng chung giữa mọi ConversationService/AIAgent trong process.
+    Ring được nạp từ DB khi đọc lần đầu, sau đó cập nhật khi thêm message và bị xóa khi clear_session.
+    Mỗi session có version tăng ở mọi lần ghi; kết quả nạp từ DB chỉ được lưu nếu version không đổi
+    trong lúc đọc, nên không ghi đè message vừa được thêm bởi agent khác.
+    """
+
+    def __init__(self, capacity: int = None, max_sessions: int = None):
+        self.capacity = capacity or Config.CONTEXT_WINDOW_SIZE
+        self.max_sessions = max_sessions or Config.CONTEXT_CACHE_SESSIONS
+        self._rings: "OrderedDict[str, deque]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str, last_n: int) -> Optional[str]:
+        """Context đã render, hoặc None nếu chưa nạp (hoặc last_n vượt sức chứa ring)."""
+        if last_n > self.capacity:
+            return None
+        with self._lock:
+            ring = self._rings.get(session_id)
+            if ring is None:
+                self.misses += 1
+                return None
+            self._rings.move_to_end(session_id)
+            blocks = list(ring)[-last_n:] if last_n > 0 else []
+            self.hits += 1
+        return render_context(blocks)
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self._versions.get(session_id, 0)
+
+    def fill(self, session_id: str, version: int, blocks: List[str]) -> bool:
+        """Lưu ring nạp từ DB (cũ trước); bỏ qua nếu session đã bị ghi sau khi đọc version."""
+        with self._lock:
+            if self._versions.get(session_id, 0) != version:
+                return False
+            self._rings[session_id] = deque(blocks[-self.capacity:], maxlen=self.capacity)
+            self._rings.move_to_end(session_id)
+            while len(self._rings) > self.max_sessions:
+                self._rings.popitem(last=False)
+        return True
+
+    def append(self, session_id: str, block: str):
+        with self._lock:
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+            ring = self._rings.get(session_id)
+            if ring is not None:
+                ring.append(block)
+
+    def invalidate(self, session_id: Optional[str] = None):
+        """Bỏ ring của session (None: mọi session) để lần đọc sau nạp lại từ DB."""
+        with self._lock:
+            if session_id is None:
+                self._rings.clear()
+                for key in self._versions:
+                    self._versions[key] += 1
+                return
+            self._rings.pop(session_id, None)
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'sessions': len(self._rings),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+_caches: Dict[str, RenderedContextCache] = {}
+_caches_lock = threading.Lock()
+
+def get_context_cache(db_path: Optional[str] = None) -> RenderedContextCache:
+    """Cache context dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = _caches[key] = RenderedContextCache()
+    return cache
+
+def invalidate_context_caches():
+    """Xóa mọi ring, dùng khi DB bị ghi trực tiếp ngoài ConversationService (vd: seed khi replay)."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.invalidate()
@@ -0,0 +1,204 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import Config
+from core.services.connection_pool import db_key
+from utils.text_utils import fold_text
+
+RELEVANT_HEADER = "🔎 CÁC TIN NHẮN CŨ CÓ LIÊN QUAN:"
+
+# Trọng số của từng loại đặc trưng: từ, cặp từ liền nhau, trigram ký tự (bắt lỗi gõ / biến thể)
+_WORD_WEIGHT = 1.0
+_BIGRAM_WEIGHT = 1.0
+_TRIGRAM_WEIGHT = 0.5
+
+
+def embed_text(text: str, dim: int = None) -> np.ndarray:
+    """
+    Vector n-gram băm (feature hashing có dấu) của văn bản đã bỏ dấu, chuẩn hóa L2.
+    Văn bản không có từ nào cho vector 0.
+    """
+    dim = dim or Config.RETRIEVAL_DIM
+    words = re.findall(r'\w+', fold_text(text))
+    features: List[Tuple[str, float]] = [(word, _WORD_WEIGHT) for word in words]
+    features += [(f'{a} {b}', _BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f'#{word}#'
+        features += [(padded[i:i + 3], _TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f, _ in features), dtype=np.uint64, count=len(features))
+    weights = np.fromiter((w for _, w in features), dtype=np.float32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % dim).astype(np.intp), signs * weights)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SessionVectorIndex:
+    """Ma trận vector các message của một session (theo thứ tự thêm vào) kèm khối đã render."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.zeros((16, dim), dtype=np.float32)
+        # Số message có đặc trưng ở mỗi bucket, để giảm trọng số các từ phổ biến trong truy vấn
+        self._df = np.zeros(dim, dtype=np.int32)
+        self.ids: List[int] = []
+        self.blocks: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, message_id: int, vector: np.ndarray, block: str):
+        n = len(self.ids)
+        if n == self._vectors.shape[0]:
+            grown = np.zeros((n * 2, self.dim), dtype=np.float32)
+            grown[:n] = self._vectors
+            self._vectors = grown
+        self._vectors[n] = vector
+        self._df += vector != 0
+        self.ids.append(message_id)
+        self.blocks.append(block)
+
+    def search(self, query: np.ndarray, top_k: int, exclude_last: int = 0,
+               min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """(vị trí, điểm) của tối đa top_k message giống truy vấn nhất, bỏ exclude_last message cuối; theo thứ tự thời gian."""
+        n = len(self.ids) - max(0, exclude_last)
+        if n <= 0 or top_k <= 0 or not query.any():
+            return []
+        idf = np.log((len(self.ids) + 1) / (self._df + 1), dtype=np.float32) + 1.0
+        weighted = query * idf
+        weighted /= np.linalg.norm(weighted)
+        scores = self._vectors[:n] @ weighted
+        if n > top_k:
+            candidates = np.argpartition(scores, n - top_k)[n - top_k:]
+        else:
+            candidates = np.arange(n)
+        return [(int(i), float(scores[i])) for i in sorted(candidates) if scores[i] >= min_score]
+
+
+def render_relevant(blocks: Sequence[str]) -> str:
+    """Khối các message cũ liên quan chèn vào prompt (rỗng nếu không có)."""
+    if not blocks:
+        return ""
+    return f"{RELEVANT_HEADER}\n\n" + "\n\n".join(blocks)
+
+
+class ContextRetriever:
+    """
+    Chỉ mục vector theo session cho các message đang lưu trong conversation_history, dùng chung
+    trong process. Chỉ mục được nạp từ DB ở lần truy vấn đầu rồi cập nhật khi thêm message;
+    cắt lịch sử hoặc clear_session làm chỉ mục của session bị bỏ để nạp lại.
+    Cơ chế version giống RenderedContextCache: kết quả nạp chỉ được lưu nếu session không bị ghi trong lúc đọc.
+    """
+
+    def __init__(self, dim: int = None, max_sessions: int = None):
+        self.dim = dim or Config.RETRIEVAL_DIM
+        self.max_sessions = max_sessions or Config.RETRIEVAL_SESSIONS
+        self._indexes: "OrderedDict[str, SessionVectorIndex]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.loads = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        return embed_text(text, self.dim)
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self._versions.get(session_id, 0)
+
+    def get(self, session_id: str) -> Optional[SessionVectorIndex]:
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is not None:
+                self._indexes.move_to_end(session_id)
+            return index
+
+    def fill(self, session_id: str, version: int, messages: List[Tuple[int, str, str]]) -> SessionVectorIndex:
+        """Dựng chỉ mục từ [(id, content, block)] (cũ trước); chỉ lưu nếu session chưa bị ghi sau khi đọc version."""
+        index = SessionVectorIndex(self.dim)
+        for message_id, content, block in messages:
+            index.add(message_id, self.embed(content), block)
+        with self._lock:
+            self.loads += 1
+            if self._versions.get(session_id, 0) == version:
+                self._indexes[session_id] = index
+                self._indexes.move_to_end(session_id)
+                while len(self._indexes) > self.max_sessions:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def add(self, session_id: str, message_id: int, content: str, block: str):
+        """Thêm message mới vào chỉ mục của session nếu chỉ mục đã được nạp."""
+        with self._lock:
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+            index = self._indexes.get(session_id)
+        if index is not None:
+            vector = self.embed(content)
+            with self._lock:
+                if self._indexes.get(session_id) is index:
+                    index.add(message_id, vector, block)
+
+    def search(self, index: SessionVectorIndex, query: str, top_k: int = None,
+               exclude_last: int = None) -> List[str]:
+        """Các khối message liên quan nhất tới truy vấn, theo thứ tự thời gian."""
+        top_k = Config.RETRIEVAL_TOP_K if top_k is None else top_k
+        exclude_last = Config.CONTEXT_WINDOW_SIZE if exclude_last is None else exclude_last
+        vector = self.embed(query)
+        with self._lock:
+            self.queries += 1
+            hits = index.search(vector, top_k, exclude_last, Config.RETRIEVAL_MIN_SCORE)
+            return [index.blocks[i] for i, _ in hits]
+
+    def invalidate(self, session_id: Optional[str] = None):
+        """Bỏ chỉ mục của session (None: mọi session) để lần truy vấn sau nạp lại từ DB."""
+        with self._lock:
+            if session_id is None:
+                self._indexes.clear()
+                for key in self._versions:
+                    self._versions[key] += 1
+                return
+            self._indexes.pop(session_id, None)
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._indexes),
+                'messages': sum(len(index) for index in self._indexes.values()),
+                'dim': self.dim,
+                'queries': self.queries,
+                'loads': self.loads
+            }
+
+
+_retrievers: Dict[str, ContextRetriever] = {}
+_retrievers_lock = threading.Lock()
+
+def get_context_retriever(db_path: Optional[str] = None) -> ContextRetriever:
+    """Chỉ mục truy hồi dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    retriever = _retrievers.get(key)
+    if retriever is None:
+        with _retrievers_lock:
+            retriever = _retrievers.get(key)
+            if retriever is None:
+                retriever = _retrievers[key] = ContextRetriever()
+    return retriever
+
+def invalidate_context_retrievers():
+    """Bỏ mọi chỉ mục, dùng khi DB bị ghi trực tiếp ngoài ConversationService (vd: seed khi replay)."""
+    with _retrievers_lock:
+        retrievers = list(_retrievers.values())
+    for retriever in retrievers:
+        retriever.invalidate()
@@ -0,0 +1,343 @@
+import functools
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from core.config import Config
+from core.logger import get_logger
+from core.services.connection_pool import SQLitePool, db_key, get_pool
+from core.services.user_profile import apply_message
+from utils.clock import get_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+logger = get_logger(__name__)
+
+_MESSAGE_COLUMNS = ('id', 'role', 'content', 'function_call', 'function_response', 'timestamp', 'created_at')
+_SUMMARY_COLUMNS = ('summary', 'facts', 'folded_messages', 'last_message_id', 'updated_at')
+_PROFILE_COLUMNS = ('profile', 'updated_at')
+
+
+def _fetch_profile(conn: sqlite3.Connection, session_id: str) -> Optional[tuple]:
+    try:
+        return conn.execute(f'''
+            SELECT {', '.join(_PROFILE_COLUMNS)} FROM user_profiles WHERE session_id = ?
+        ''', (session_id,)).fetchone()
+    except sqlite3.OperationalError as e:
+        if 'no such table' not in str(e):
+            raise
+        # Bảng hồ sơ chưa được tạo (chưa có ConversationService nào dùng DB này)
+        return None
+
+
+class ConversationArchiver:
+    """
+    Lưu trữ các session không hoạt động quá HISTORY_RETENTION_DAYS ngày: message, bản tóm tắt và
+    hồ sơ người dùng (user_profiles: tên, email...) được ghi nối (append-only) vào file JSONL nén gzip theo ngày lưu trữ, rồi xóa khỏi bảng nóng
+    theo từng batch transaction. Bảng conversation_archive ghi file và vị trí (offset của gzip member)
+    của mỗi session để khôi phục khi session được dùng lại mà không phải đọc cả file.
+    """
+
+    def __init__(self, pool: SQLitePool, directory: str = None, ttl_days: int = None, batch_size: int = None):
+        self.pool = pool
+        self.directory = directory or Config.HISTORY_ARCHIVE_DIR
+        self.ttl_days = Config.HISTORY_RETENTION_DAYS if ttl_days is None else ttl_days
+        self.batch_size = batch_size or Config.HISTORY_ARCHIVE_BATCH
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._after_change: List[Callable[[str], None]] = []
+        self.archived_sessions = 0
+        self.archived_messages = 0
+        self.restored_sessions = 0
+        self.restored_messages = 0
+        self.last_run: Optional[str] = None
+        self._create_table()
+
+    def _create_table(self):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_archive (
+                    session_id TEXT PRIMARY KEY,
+                    archive_key TEXT NOT NULL,  -- khóa của lần lưu trữ, có trong mọi dòng của session
+                    archive_file TEXT NOT NULL,
+                    archive_offset INTEGER NOT NULL,  -- byte bắt đầu gzip member của session trong file
+                    messages INTEGER NOT NULL,
+                    last_activity TEXT,
+                    archived_at TEXT NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def add_after_change(self, callback: Callable[[str], None]) -> None:
+        """callback(session_id) sau khi session bị lưu trữ hoặc khôi phục (vd: bỏ cache trong bộ nhớ)."""
+        if callback not in self._after_change:
+            self._after_change.append(callback)
+
+    def _changed(self, session_id: str):
+        for callback in self._after_change:
+            try:
+                callback(session_id)
+            except Exception as e:
+                logger.error("[Retention] Lỗi callback cho session %s: %s", session_id, e)
+
+    def is_archived(self, session_id: str) -> bool:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT 1 FROM conversation_archive WHERE session_id = ?', (session_id,)
+            ).fetchone() is not None
+
+    def archive_inactive(self, max_sessions: int = None) -> Dict[str, int]:
+        """Lưu trữ các session có hoạt động cuối trước mốc TTL, cũ nhất trước."""
+        now = get_clock().now(VIETNAM_TZ)
+        cutoff = (now - timedelta(days=self.ttl_days)).isoformat()
+        with self.pool.connection() as conn:
+            sessions = [row[0] for row in conn.execute('''
+                SELECT session_id FROM conversation_sessions
+                WHERE last_activity < ?
+                ORDER BY last_activity
+                LIMIT ?
+            ''', (cutoff, max_sessions or -1))]
+        messages = 0
+        for session_id in sessions:
+            messages += self.archive_session(session_id)
+        self.last_run = now.isoformat()
+        return {'sessions': len(sessions), 'messages': messages}
+
+    def _iter_rows(self, session_id: str):
+        """Message của session theo (timestamp, id), đọc từng batch (mỗi batch một lần mượn kết nối)."""
+        after = None
+        while True:
+            condition, params = '', []
+            if after is not None:
+                condition, params = 'AND (timestamp, id) > (?, ?)', list(after)
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {', '.join(_MESSAGE_COLUMNS)} FROM conversation_history
+                    WHERE session_id = ? {condition}
+                    ORDER BY timestamp, id
+                    LIMIT ?
+                ''', (session_id, *params, self.batch_size)).fetchall()
+            yield from rows
+            if len(rows) < self.batch_size:
+                return
+            after = (rows[-1][5], rows[-1][0])
+
+    def archive_session(self, session_id: str) -> int:
+        """Ghi session vào file lưu trữ rồi xóa khỏi bảng nóng. Trả về số message đã lưu trữ."""
+        # Session có message mới sau lần lưu trữ trước: gộp lại để mỗi session chỉ có một bản lưu trữ
+        self.restore(session_id)
+        now = get_clock().now(VIETNAM_TZ)
+        key = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"conversations-{now.strftime('%Y-%m-%d')}.jsonl.gz")
+        with self.pool.connection() as conn:
+            summary = conn.execute(f'''
+                SELECT {', '.join(_SUMMARY_COLUMNS)} FROM conversation_summaries WHERE session_id = ?
+            ''', (session_id,)).fetchone()
+            last_activity = conn.execute(
+                'SELECT last_activity FROM conversation_sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            profile = _fetch_profile(conn, session_id)
+
+        count, max_id = 0, 0
+        os.makedirs(self.directory, exist_ok=True)
+        with self._write_lock:
+            offset = os.path.getsize(path) if os.path.exists(path) else 0
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for row in self._iter_rows(session_id):
+                    record = dict(zip(_MESSAGE_COLUMNS, row))
+                    record.update(archive=key, session_id=session_id, type='message')
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+                    count += 1
+                    max_id = max(max_id, row[0])
+                if summary is not None:
+                    record = dict(zip(_SUMMARY_COLUMNS, summary))
+                    record.update(archive=key, session_id=session_id, type='summary')
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+                if profile is not None:
+                    record = dict(zip(_PROFILE_COLUMNS, profile))
+                    record.update(archive=key, session_id=session_id, type='profile')
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+
+        # Ghi mốc trước rồi mới xóa: dừng giữa chừng thì khôi phục bỏ qua các message còn trong bảng
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                INSERT OR REPLACE INTO conversation_archive
+                (session_id, archive_key, archive_file, archive_offset, messages, last_activity, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (session_id, key, path, offset, count, last_activity[0] if last_activity else None,
+                  now.isoformat()))
+            conn.execute('DELETE FROM conversation_summaries WHERE session_id = ?', (session_id,))
+            if profile is not None:
+                # Hồ sơ có thể đã được cập nhật sau khi đọc: chỉ xóa đúng bản đã ghi vào file
+                conn.execute('DELETE FROM user_profiles WHERE session_id = ? AND updated_at = ?',
+                             (session_id, profile[1]))
+        # Chỉ xóa message đã ghi vào file (id <= max_id); message mới đến trong lúc lưu trữ được giữ lại
+        deleted = self.batch_size
+        while deleted == self.batch_size:
+            with self.pool.connection() as conn:
+                deleted = conn.execute('''
+                    DELETE FROM conversation_history WHERE id IN (
+                        SELECT id FROM conversation_history
+                        WHERE session_id = ? AND id <= ?
+                        LIMIT ?
+                    )
+                ''', (session_id, max_id, self.batch_size)).rowcount
+
+        self.archived_sessions += 1
+        self.archived_messages += count
+        self._changed(session_id)
+        logger.info("[Retention] Đã lưu trữ session %s (%d message) vào %s", session_id, count, path)
+        return count
+
+    def _read_archive(self, path: str, offset: int, key: str):
+        """Các dòng của một lần lưu trữ: đọc từ gzip member bắt đầu ở offset tới khi gặp khóa khác."""
+        with open(path, 'rb') as raw:
+            raw.seek(offset)
+            with gzip.open(raw, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get('archive') != key:
+                        return
+                    yield record
+
+    def restore(self, session_id: str) -> int:
+        """Đưa session đã lưu trữ trở lại bảng nóng. Trả về số message được khôi phục (0 nếu không lưu trữ)."""
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT archive_key, archive_file, archive_offset FROM conversation_archive WHERE session_id = ?
+            ''', (session_id,)).fetchone()
+        if row is None:
+            return 0
+        key, path, offset = row
+
+        restored, archived_max_id, profile = 0, 0, None
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            batch = []
+            for record in self._read_archive(path, offset, key):
+                if record['type'] == 'summary':
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO conversation_summaries (session_id, {', '.join(_SUMMARY_COLUMNS)})
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (session_id, *(record[c] for c in _SUMMARY_COLUMNS)))
+                    continue
+                if record['type'] == 'profile':
+                    profile = record
+                    continue
+                archived_max_id = max(archived_max_id, record['id'])
+                batch.append((session_id, *(record[c] for c in _MESSAGE_COLUMNS)))
+                if len(batch) >= self.batch_size:
+                    restored += self._insert_messages(conn, batch)
+                    batch = []
+            restored += self._insert_messages(conn, batch)
+            if profile is not None:
+                self._restore_profile(conn, session_id, profile, archived_max_id)
+            conn.execute('DELETE FROM conversation_archive WHERE session_id = ?', (session_id,))
+
+        self.restored_sessions += 1
+        self.restored_messages += restored
+        self._changed(session_id)
+        logger.info("[Retention] Đã khôi phục session %s (%d message)", session_id, restored)
+        return restored
+
+    @staticmethod
+    def _restore_profile(conn: sqlite3.Connection, session_id: str, record: Dict[str, Any], archived_max_id: int):
+        # Hồ sơ trong bảng (nếu có) chỉ dựng từ message đến sau khi lưu trữ: lấy bản đã lưu trữ
+        # rồi áp tiếp các message đó để được hồ sơ của toàn bộ lịch sử
+        profile = json.loads(record['profile'])
+        for message in conn.execute('''
+            SELECT role, content, function_call FROM conversation_history
+            WHERE session_id = ? AND id > ?
+            ORDER BY timestamp, id
+        ''', (session_id, archived_max_id)):
+            apply_message(profile, *message)
+        conn.execute('''
+            INSERT OR REPLACE INTO user_profiles (session_id, profile, updated_at) VALUES (?, ?, ?)
+        ''', (session_id, json.dumps(profile, ensure_ascii=False), get_clock().now().isoformat()))
+
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, batch: List[tuple]) -> int:
+        # Giữ id gốc (AUTOINCREMENT không cấp lại id đã dùng); message chưa kịp xóa khi lưu trữ bị bỏ qua
+        if not batch:
+            return 0
+        return conn.executemany(f'''
+            INSERT OR IGNORE INTO conversation_history (session_id, {', '.join(_MESSAGE_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch).rowcount
+
+    def start(self):
+        """Chạy archive_inactive định kỳ mỗi HISTORY_RETENTION_INTERVAL giây ở thread nền."""
+        if self.ttl_days <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ConversationRetention")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(Config.HISTORY_RETENTION_INTERVAL):
+            try:
+                result = self.archive_inactive()
+                if result['sessions']:
+                    logger.info("[Retention] Đã lưu trữ %d session không hoạt động", result['sessions'])
+            except Exception as e:
+                logger.error("[Retention] Lỗi lưu trữ định kỳ: %s", e)
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=Config.CONNECTION_TIMEOUT)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            archived = conn.execute('SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM conversation_archive').fetchone()
+        return {
+            'ttl_days': self.ttl_days,
+            'directory': self.directory,
+            'archived_now': {'sessions': archived[0], 'messages': archived[1]},
+            'archived_sessions': self.archived_sessions,
+            'archived_messages': self.archived_messages,
+            'restored_sessions': self.restored_sessions,
+            'restored_messages': self.restored_messages,
+            'last_run': self.last_run,
+            'running': self._thread is not None and self._thread.is_alive()
+        }
+
+
+def _forget_session_state(db_path: str, pool: SQLitePool, session_id: str):
+    # Import muộn: conversation_service import module này
+    from core.services.conversation_service import forget_session_state
+    forget_session_state(db_path, session_id, pool)
+
+
+_archivers: Dict[str, ConversationArchiver] = {}
+_archivers_lock = threading.Lock()
+
+def get_conversation_archiver(db_path: Optional[str] = None, pool: SQLitePool = None) -> ConversationArchiver:
+    """Bộ lưu trữ dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    archiver = _archivers.get(key)
+    if archiver is None:
+        with _archivers_lock:
+            archiver = _archivers.get(key)
+            if archiver is None:
+                pool = pool or get_pool(key)
+                archiver = _archivers[key] = ConversationArchiver(pool)
+                # Một callback cho mỗi archiver (không đăng ký theo từng ConversationService)
+                archiver.add_after_change(functools.partial(_forget_session_state, key, pool))
+    return archiver
+
+def get_conversation_archivers() -> Dict[str, ConversationArchiver]:
+    return dict(_archivers)
+
+def close_conversation_archivers():
+    with _archivers_lock:
+        archivers = list(_archivers.values())
+        _archivers.clear()
+    for archiver in archivers:
+        archiver.close()
@@ -1,46 +1,269 @@
+import base64
+import re
 import sqlite3
 import json
+import threading
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from core.config import Config
 import pytz
+from utils.clock import get_clock
+from utils.text_utils import fold_text
+from core.logger import get_logger
+from core.services.connection_pool import db_key, get_pool
+from core.services.history_buffer import get_history_buffer
+from core.services.context_cache import get_context_cache, render_context, render_message
+from core.services.conversation_summary import get_conversation_summarizer
+from core.services.context_retrieval import get_context_retriever, render_relevant
+from core.services.conversation_retention import get_conversation_archiver
+from core.services.user_profile import get_profile_store
+
+logger = get_logger(__name__)
+
+# Số message ước tính của mỗi session, theo file DB: {db_path: {session_id: count}}
+_session_counts: Dict[str, Dict[str, int]] = {}
+_session_counts_lock = threading.Lock()
+
+# unicode61 bỏ dấu (remove_diacritics 2) nhưng không coi 'đ' là 'd' có dấu nên phải tự thay
+_FOLD_SQL = "replace(replace({}, 'đ', 'd'), 'Đ', 'D')"
+# Mỗi session là một token duy nhất trong cột session_id của chỉ mục để lọc session ngay trong FTS5
+_SESSION_TOKEN_SQL = "'s' || hex({})"
+
+
+def _fts_query(query: str, session_id: Optional[str] = None) -> str:
+    """
+    Chuyển chuỗi người dùng thành truy vấn FTS5 an toàn: mọi từ (đã bỏ dấu) phải có.
+    Có session_id thì giới hạn bằng token của session.
+    """
+    terms = re.findall(r'\w+', query.replace('đ', 'd').replace('Đ', 'D'))
+    if not terms:
+        return ''
+    match = 'content : (' + ' '.join(f'"{term}"' for term in terms) + ')'
+    if session_id is not None:
+        match = f'session_id : s{session_id.encode("utf-8").hex()} AND {match}'
+    return match
+
+def _encode_cursor(timestamp: str, key) -> str:
+    """Cursor phân trang: vị trí (timestamp, id hoặc session_id) của phần tử cuối trang, mã hóa base64 url-safe."""
+    raw = json.dumps([timestamp, key], separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    """Giải mã cursor; ValueError nếu cursor không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor không hợp lệ: {cursor}") from e
+    if not isinstance(timestamp, str) or not isinstance(key, (int, str)) or isinstance(key, bool):
+        raise ValueError(f"Cursor không hợp lệ: {cursor}")
+    return timestamp, key
+
+
+def forget_session_state(db_path: str, session_id: str, pool=None):
+    """
+    Bỏ state trong bộ nhớ dùng chung theo file DB của một session (bộ đếm message, ring context,
+    chỉ mục truy hồi, hồ sơ) sau khi DB bị xóa/ghi lại hàng loạt ngoài luồng thêm message.
+    """
+    with _session_counts_lock:
+        counts = _session_counts.get(db_key(db_path))
+        if counts is not None:
+            counts.pop(session_id, None)
+    get_context_cache(db_path).invalidate(session_id)
+    if Config.RETRIEVAL_ENABLED:
+        get_context_retriever(db_path).invalidate(session_id)
+    get_profile_store(db_path, pool).invalidate(session_id)
+
+
+def _row_to_message(row: tuple) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'role': row[1],
+        'content': row[2],
+        'function_call': json.loads(row[3]) if row[3] else None,
+        'function_response': json.loads(row[4]) if row[4] else None,
+        'timestamp': row[5],
+        'created_at': row[6]
+    }
 
 class ConversationService:
     """
     Service quản lý lịch sử conversation với AI Agent.
+    Khi bật write_behind (mặc định theo Config.HISTORY_WRITE_BEHIND), message mới nằm trong
+    bộ đệm dùng chung và được ghi theo batch; các hàm đọc gộp bộ đệm nên vẫn thấy ngay.
     """
     
-    def __init__(self, db_path: str = 'database/schedule.db', max_history: int = None):
+    # Lưu trữ session không hoạt động ra file (HISTORY_RETENTION_DAYS); tắt cho kho trong bộ nhớ
+    retention = True
+    
+    def __init__(self, db_path: str = 'database/schedule.db', max_history: int = None, pool=None,
+                 write_behind: bool = None):
         self.db_path = db_path
+        self._pool = pool or get_pool(db_path)
         self.max_history = max_history or Config.MAX_CONVERSATION_HISTORY
         self.vietnam_tz = pytz.timezone(Config.TIMEZONE)
+        # Chỉ cắt lịch sử khi vượt high-water mark, mỗi lần cắt về đúng max_history
+        self.trim_high_water = self.max_history + max(1, int(self.max_history * Config.HISTORY_TRIM_SLACK))
+        with _session_counts_lock:
+            self._counts = _session_counts.setdefault(db_key(db_path), {})
+        self._context_cache = get_context_cache(db_path)
+        self._retriever = get_context_retriever(db_path) if Config.RETRIEVAL_ENABLED else None
         self._create_table()
+        self._summarizer = get_conversation_summarizer(db_path, self._pool) if Config.SUMMARY_ENABLED else None
+        self._profiles = get_profile_store(db_path, self._pool)
+        # Archiver dùng chung đã tự bỏ state dùng chung của session khi lưu trữ / khôi phục
+        self._archiver = get_conversation_archiver(db_path, self._pool) if self.retention else None
+        
+        if write_behind is None:
+            write_behind = Config.HISTORY_WRITE_BEHIND
+        self._buffer = None
+        if write_behind:
+            self._buffer = get_history_buffer(db_path, self._pool)
+            self._buffer.set_after_flush(self._cleanup_sessions)
     
     def _create_table(self):
         """Tạo bảng conversation_history nếu chưa tồn tại."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT DEFAULT 'default',
+                    role TEXT NOT NULL,  -- 'user' hoặc 'assistant'
+                    content TEXT NOT NULL,
+                    function_call TEXT,  -- JSON string của function call (nếu có)
+                    function_response TEXT,  -- JSON string của function response (nếu có)
+                    timestamp TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            
+            # (session_id, timestamp, id): thứ tự toàn phần cho phân trang keyset theo cả hai chiều
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversation_session_timestamp_id
+                ON conversation_history(session_id, timestamp, id)
+            ''')
+            cursor.execute('DROP INDEX IF EXISTS idx_conversation_session_timestamp')
+            
+            self._create_sessions_table(cursor)
+            self._fts = self._create_fts_index(cursor)
+    
+    def _create_sessions_table(self, cursor: sqlite3.Cursor):
+        """
+        Bảng conversation_sessions: thống kê mỗi session, cập nhật bằng trigger khi thêm/xóa message.
+        Session không còn message (clear_session) bị xóa khỏi bảng.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversation_sessions'"
+        ).fetchone()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT DEFAULT 'default',
-                role TEXT NOT NULL,  -- 'user' hoặc 'assistant'
-                content TEXT NOT NULL,
-                function_call TEXT,  -- JSON string của function call (nếu có)
-                function_response TEXT,  -- JSON string của function response (nếu có)
-                timestamp TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
+            CREATE TABLE IF NOT EXISTS conversation_sessions (
+                session_id TEXT PRIMARY KEY,
+                total_messages INTEGER NOT NULL,
+                user_messages INTEGER NOT NULL,
+                assistant_messages INTEGER NOT NULL,
+                first_message TEXT,
+                last_message TEXT,
+                last_activity TEXT NOT NULL  -- timestamp của message mới nhất từng được thêm
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversation_sessions_activity
+            ON conversation_sessions(last_activity, session_id)
         ''')
-        
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_conversation_session_timestamp 
-            ON conversation_history(session_id, timestamp DESC)
+            CREATE TRIGGER IF NOT EXISTS conversation_sessions_ai AFTER INSERT ON conversation_history BEGIN
+                INSERT INTO conversation_sessions
+                (session_id, total_messages, user_messages, assistant_messages, first_message, last_message, last_activity)
+                VALUES (new.session_id, 1, new.role = 'user', new.role = 'assistant',
+                        new.timestamp, new.timestamp, new.timestamp)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    total_messages = total_messages + 1,
+                    user_messages = user_messages + excluded.user_messages,
+                    assistant_messages = assistant_messages + excluded.assistant_messages,
+                    first_message = min(ifnull(first_message, excluded.first_message), excluded.first_message),
+                    last_message = max(ifnull(last_message, excluded.last_message), excluded.last_message),
+                    last_activity = max(last_activity, excluded.last_activity);
+            END
         ''')
+        # Cắt lịch sử chỉ xóa message cũ nhất: mốc đầu/cuối tìm lại bằng một lần seek trên index
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversation_sessions_ad AFTER DELETE ON conversation_history BEGIN
+                UPDATE conversation_sessions SET
+                    total_messages = total_messages - 1,
+                    user_messages = user_messages - (old.role = 'user'),
+                    assistant_messages = assistant_messages - (old.role = 'assistant'),
+                    first_message = (SELECT MIN(timestamp) FROM conversation_history WHERE session_id = old.session_id),
+                    last_message = (SELECT MAX(timestamp) FROM conversation_history WHERE session_id = old.session_id)
+                WHERE session_id = old.session_id;
+                DELETE FROM conversation_sessions WHERE session_id = old.session_id AND total_messages <= 0;
+            END
+        ''')
+        if not exists:
+            # DB cũ: dựng thống kê từ các message đã có
+            cursor.execute('''
+                INSERT INTO conversation_sessions
+                (session_id, total_messages, user_messages, assistant_messages, first_message, last_message, last_activity)
+                SELECT session_id, COUNT(*), SUM(role = 'user'), SUM(role = 'assistant'),
+                       MIN(timestamp), MAX(timestamp), MAX(timestamp)
+                FROM conversation_history
+                GROUP BY session_id
+            ''')
+    
+    def _create_fts_index(self, cursor: sqlite3.Cursor) -> bool:
+        """
+        Chỉ mục FTS5 (external content) cho content, đồng bộ bằng trigger.
+        Trả về False nếu SQLite không có FTS5; khi đó tìm kiếm dùng LIKE.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversation_fts'"
+        ).fetchone()
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversation_fts USING fts5(
+                    content,
+                    session_id,
+                    content='conversation_history',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning("[Conversation] Không tạo được chỉ mục FTS5, tìm kiếm dùng LIKE: %s", e)
+            return False
         
-        conn.commit()
-        conn.close()
+        new_values = f"new.id, {_FOLD_SQL.format('new.content')}, {_SESSION_TOKEN_SQL.format('new.session_id')}"
+        old_values = f"old.id, {_FOLD_SQL.format('old.content')}, {_SESSION_TOKEN_SQL.format('old.session_id')}"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS conversation_fts_ai AFTER INSERT ON conversation_history BEGIN
+                INSERT INTO conversation_fts(rowid, content, session_id) VALUES ({new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS conversation_fts_ad AFTER DELETE ON conversation_history BEGIN
+                INSERT INTO conversation_fts(conversation_fts, rowid, content, session_id)
+                VALUES ('delete', {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS conversation_fts_au AFTER UPDATE OF content, session_id ON conversation_history BEGIN
+                INSERT INTO conversation_fts(conversation_fts, rowid, content, session_id)
+                VALUES ('delete', {old_values});
+                INSERT INTO conversation_fts(rowid, content, session_id) VALUES ({new_values});
+            END
+        ''')
+        if not exists:
+            # Chỉ xếp hạng theo content; token session chỉ dùng để lọc
+            cursor.execute("INSERT INTO conversation_fts(conversation_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+            # DB cũ: đánh chỉ mục các message đã có (không dùng 'rebuild' vì cần thay 'đ')
+            cursor.execute(f'''
+                INSERT INTO conversation_fts(rowid, content, session_id)
+                SELECT id, {_FOLD_SQL.format('content')}, {_SESSION_TOKEN_SQL.format('session_id')}
+                FROM conversation_history
+            ''')
+        return True
     
     def add_user_message(self, content: str, session_id: str = 'default') -> int:
         """Thêm tin nhắn của user vào lịch sử."""
@@ -85,226 +308,483 @@ class ConversationService:
     def _add_message(self, session_id: str, role: str, content: str, 
                     function_call: Dict = None, function_response: Dict = None) -> int:
         """Thêm message vào database."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        now = datetime.now(self.vietnam_tz)
+        now = get_clock().now(self.vietnam_tz)
         timestamp = now.isoformat()
         created_at = now.strftime('%Y-%m-%d %H:%M:%S')
         
         function_call_json = self._safe_json_serialize(function_call)
         function_response_json = self._safe_json_serialize(function_response)
         
-        cursor.execute('''
-            INSERT INTO conversation_history 
-            (session_id, role, content, function_call, function_response, timestamp, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (session_id, role, content, function_call_json, function_response_json, timestamp, created_at))
-        
-        message_id = cursor.lastrowid
-        conn.commit()
-        
-        self._cleanup_old_messages(session_id, conn)
-        
-        conn.close()
-        return message_id
-    
-    def _cleanup_old_messages(self, session_id: str, conn: sqlite3.Connection):
-        """Xóa các message cũ để giữ trong giới hạn max_history."""
-        cursor = conn.cursor()
-        
-        # Đếm số lượng message hiện tại
-        cursor.execute('''
-            SELECT COUNT(*) FROM conversation_history WHERE session_id = ?
-        ''', (session_id,))
-        
-        count = cursor.fetchone()[0]
-        
-        if count > self.max_history:
+        block = render_message(role, content, json.loads(function_call_json) if function_call_json else None)
+        if self._buffer is not None:
+            self._profiles.observe(session_id, role, content, function_call_json)
+            message_id = self._buffer.append(
+                (session_id, role, content, function_call_json, function_response_json, timestamp, created_at)
+            )
+            self._context_cache.append(session_id, block)
+            if self._retriever is not None:
+                self._retriever.add(session_id, message_id, content, block)
+            return message_id
+        
+        with self._pool.connection() as conn:
+            self._profiles.observe(session_id, role, content, function_call_json, conn)
+            cursor = conn.cursor()
             cursor.execute('''
-                DELETE FROM conversation_history 
-                WHERE session_id = ? AND id NOT IN (
-                    SELECT id FROM conversation_history 
-                    WHERE session_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                )
-            ''', (session_id, session_id, self.max_history))
+                INSERT INTO conversation_history 
+                (session_id, role, content, function_call, function_response, timestamp, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (session_id, role, content, function_call_json, function_response_json, timestamp, created_at))
+            
+            message_id = cursor.lastrowid
             
-            deleted_count = cursor.rowcount
+            self._cleanup_old_messages(session_id, conn)
+        # Sau commit: agent khác đọc ring sẽ thấy message đã có trong DB
+        self._context_cache.append(session_id, block)
+        if self._retriever is not None:
+            self._retriever.add(session_id, message_id, content, block)
+        return message_id
+    
+    def _cleanup_sessions(self, conn: sqlite3.Connection, added: Dict[str, int]):
+        """Cắt lịch sử cho các session vừa được flush từ bộ đệm write-behind."""
+        for session_id, count in added.items():
+            self._cleanup_old_messages(session_id, conn, count)
+    
+    def _reading(self):
+        """Khối đọc DB + bộ đệm nhất quán (không trùng message đang flush)."""
+        return self._buffer.reading() if self._buffer is not None else nullcontext()
+    
+    def _pending_rows(self, session_id: str) -> List[tuple]:
+        """Message chưa ghi của session, cùng dạng row với SELECT id, role, content, ... created_at."""
+        if self._buffer is None:
+            return []
+        return [(msg_id, *message[1:]) for msg_id, message in self._buffer.pending(session_id)]
+    
+    def _cleanup_old_messages(self, session_id: str, conn: sqlite3.Connection, added: int = 1):
+        """
+        Giữ lịch sử trong giới hạn max_history theo kiểu khấu hao: chỉ tăng bộ đếm của session,
+        khi vượt trim_high_water mới xóa một lần bằng range delete trên index (session_id, timestamp).
+        """
+        with _session_counts_lock:
+            count = self._counts.get(session_id)
+            if count is not None:
+                count = self._counts[session_id] = count + added
+        
+        if count is None:
+            # Lần đầu gặp session trong process: đếm một lần từ DB (đã gồm message vừa chèn)
+            count = conn.execute('''
+                SELECT COUNT(*) FROM conversation_history WHERE session_id = ?
+            ''', (session_id,)).fetchone()[0]
+            with _session_counts_lock:
+                self._counts[session_id] = count
+        
+        if self._summarizer is not None:
+            self._summarizer.notify(session_id, added)
+        if count > self.trim_high_water:
+            self._trim_session(session_id, conn)
+    
+    def _trim_session(self, session_id: str, conn: sqlite3.Connection) -> int:
+        """Xóa các message cũ hơn message thứ max_history (mới nhất trước) của session."""
+        if self._summarizer is not None:
+            # Gộp phần sắp bị xóa vào bản tóm tắt trong cùng transaction
+            self._summarizer.compact(session_id, conn)
+        cutoff = conn.execute('''
+            SELECT timestamp FROM conversation_history
+            WHERE session_id = ?
+            ORDER BY timestamp DESC
+            LIMIT 1 OFFSET ?
+        ''', (session_id, self.max_history - 1)).fetchone()
+        
+        deleted_count = 0
+        if cutoff is not None:
+            # Message trùng timestamp với mốc cắt được giữ lại
+            deleted_count = conn.execute('''
+                DELETE FROM conversation_history
+                WHERE session_id = ? AND timestamp < ?
+            ''', (session_id, cutoff[0])).rowcount
+        
+        with _session_counts_lock:
+            self._counts[session_id] = max(0, self._counts.get(session_id, 0) - deleted_count)
+        if deleted_count and self.max_history < self._context_cache.capacity:
+            self._context_cache.invalidate(session_id)
+        if deleted_count and self._retriever is not None:
+            self._retriever.invalidate(session_id)
+        return deleted_count
     
     def get_conversation_history(self, session_id: str = 'default', limit: int = None) -> List[Dict[str, Any]]:
-        """Lấy lịch sử conversation cho session."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        limit_clause = f"LIMIT {limit}" if limit else ""
-        
-        cursor.execute(f'''
+        """Lấy lịch sử conversation cho session (limit message đầu tiên, cũ trước)."""
+        with self._reading(), self._pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, role, content, function_call, function_response, timestamp, created_at
+                FROM conversation_history 
+                WHERE session_id = ?
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ?
+            ''', (session_id, limit or -1)).fetchall()
+            rows += self._pending_rows(session_id)
+        if limit:
+            rows = rows[:limit]
+        
+        return [_row_to_message(row) for row in rows]
+    
+    def _fetch_page(self, conn: sqlite3.Connection, session_id: str, limit: int,
+                    after: Optional[tuple] = None, before: Optional[tuple] = None,
+                    descending: bool = False) -> List[tuple]:
+        """Tối đa limit message sau after / trước before, theo (timestamp, id) tăng dần hoặc giảm dần."""
+        conditions, params = ['session_id = ?'], [session_id]
+        if after is not None:
+            conditions.append('(timestamp, id) > (?, ?)')
+            params += after
+        if before is not None:
+            conditions.append('(timestamp, id) < (?, ?)')
+            params += before
+        order = 'DESC' if descending else 'ASC'
+        return conn.execute(f'''
             SELECT id, role, content, function_call, function_response, timestamp, created_at
-            FROM conversation_history 
-            WHERE session_id = ?
-            ORDER BY timestamp ASC
-            {limit_clause}
-        ''', (session_id,))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        history = []
-        for row in rows:
-            message = {
-                'id': row[0],
-                'role': row[1],
-                'content': row[2],
-                'function_call': json.loads(row[3]) if row[3] else None,
-                'function_response': json.loads(row[4]) if row[4] else None,
-                'timestamp': row[5],
-                'created_at': row[6]
-            }
-            history.append(message)
+            FROM conversation_history
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ?
+        ''', (*params, limit)).fetchall()
+    
+    def get_history_page(self, session_id: str = 'default', limit: int = None, after: str = None,
+                         before: str = None, newest: bool = False) -> Dict[str, Any]:
+        """
+        Một trang lịch sử theo cursor (keyset trên index (session_id, timestamp, id)), cũ trước.
+        after: các message mới hơn cursor; before: các message cũ hơn cursor;
+        không có cursor: trang đầu tiên, hoặc trang mới nhất nếu newest.
+        next_cursor / prev_cursor là None khi không còn message theo chiều đó.
+        """
+        if after is not None and before is not None:
+            raise ValueError("Chỉ dùng một trong after hoặc before")
+        limit = max(1, min(limit or Config.HISTORY_PAGE_SIZE, Config.HISTORY_PAGE_MAX))
+        after_key = _decode_cursor(after) if after is not None else None
+        before_key = _decode_cursor(before) if before is not None else None
+        backward = before_key is not None or (newest and after_key is None)
+        if self._buffer is not None:
+            # Cursor cần id thật nên ghi nốt bộ đệm trước khi đọc
+            self._buffer.flush()
+        
+        with self._pool.connection() as conn:
+            rows = self._fetch_page(conn, session_id, limit + 1, after=after_key, before=before_key,
+                                    descending=backward)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+            has_prev, has_next = more, before_key is not None
+        else:
+            has_prev, has_next = after_key is not None, more
         
-        return history
+        return {
+            'messages': [_row_to_message(row) for row in rows],
+            'next_cursor': _encode_cursor(rows[-1][5], rows[-1][0]) if rows and has_next else None,
+            'prev_cursor': _encode_cursor(rows[0][5], rows[0][0]) if rows and has_prev else None,
+        }
+    
+    def iter_conversation(self, session_id: str = 'default', batch_size: int = None) -> Iterator[Dict[str, Any]]:
+        """
+        Duyệt toàn bộ lịch sử session (cũ trước) theo từng batch keyset; mỗi batch mượn kết nối
+        trong thời gian ngắn nên bộ nhớ không phụ thuộc độ dài session.
+        """
+        batch_size = batch_size or Config.HISTORY_EXPORT_BATCH
+        if self._buffer is not None:
+            self._buffer.flush()
+        after = None
+        while True:
+            with self._pool.connection() as conn:
+                rows = self._fetch_page(conn, session_id, batch_size, after=after)
+            for row in rows:
+                yield _row_to_message(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][5], rows[-1][0])
     
     def get_recent_context(self, session_id: str = 'default', last_n_messages: int = 10) -> str:
         """
         Lấy context gần nhất để gửi cho AI model.
-        Trả về formatted string phù hợp cho system prompt.
+        Trả về formatted string phù hợp cho system prompt; đọc từ ring trong bộ nhớ nếu đã nạp.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT id, role, content, function_call, function_response, timestamp, created_at
-            FROM conversation_history 
-            WHERE session_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (session_id, last_n_messages))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        if not rows:
+        cached = self._context_cache.get(session_id, last_n_messages)
+        if cached is not None:
+            return cached
+        
+        version = self._context_cache.version(session_id)
+        fetch = max(last_n_messages, self._context_cache.capacity)
+        with self._reading(), self._pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, role, content, function_call, function_response, timestamp, created_at
+                FROM conversation_history 
+                WHERE session_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ''', (session_id, fetch)).fetchall()
+            pending = self._pending_rows(session_id)
+        if pending:
+            rows = (pending[::-1] + rows)[:fetch]
+        
+        blocks = [
+            render_message(row[1], row[2], json.loads(row[3]) if row[3] else None)
+            for row in reversed(rows)
+        ]
+        if last_n_messages <= self._context_cache.capacity:
+            self._context_cache.fill(session_id, version, blocks)
+        return render_context(blocks[-last_n_messages:] if last_n_messages > 0 else [])
+    
+    def get_relevant_context(self, session_id: str = 'default', query: str = '', top_k: int = None,
+                             exclude_last: int = None) -> str:
+        """
+        Các message cũ (trước exclude_last message gần nhất, mặc định CONTEXT_WINDOW_SIZE) giống
+        câu hỏi nhất theo vector n-gram, đã render cho prompt. Rỗng nếu tắt hoặc không có gì liên quan.
+        """
+        if self._retriever is None or not query.strip():
             return ""
-
-        history = []
-        for row in reversed(rows):
-            message = {
-                'id': row[0],
-                'role': row[1],
-                'content': row[2],
-                'function_call': json.loads(row[3]) if row[3] else None,
-                'function_response': json.loads(row[4]) if row[4] else None,
-                'timestamp': row[5],
-                'created_at': row[6]
-            }
-            history.append(message)
-        
-        context_lines = []
-        context_lines.append("💭 LỊCH SỬ CUỘC TRÒ CHUYỆN GẦN ĐÂY:")
-        context_lines.append("")
-        
-        for i, msg in enumerate(history):
-            role_label = "👤 Người dùng" if msg['role'] == 'user' else "🤖 Trợ lý"
-            context_lines.append(f"{role_label}: {msg['content']}")
-
-            if msg['function_call']:
-                func_name = msg['function_call'].get('name', 'Unknown')
-                func_args = msg['function_call'].get('args', {})
-                context_lines.append(f"   ⚙️ Đã thực hiện: {func_name}")
-                # Thêm thông tin quan trọng từ args
-                if 'title' in func_args:
-                    context_lines.append(f"   📝 Tiêu đề: {func_args['title']}")
-                if 'start_time' in func_args:
-                    context_lines.append(f"   🕐 Thời gian: {func_args['start_time']}")
-            
-            # Thêm khoảng cách giữa các tin nhắn
-            if i < len(history) - 1:
-                context_lines.append("")
-        
-        context_lines.append("")
-        context_lines.append("🎯 HÃY SỬ DỤNG THÔNG TIN TRÊN để hiểu bối cảnh và trả lời phù hợp.")
-        context_lines.append("---")
-        return "\n".join(context_lines)
+        index = self._retriever.get(session_id)
+        if index is None:
+            version = self._retriever.version(session_id)
+            with self._reading(), self._pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, role, content, function_call FROM conversation_history
+                    WHERE session_id = ?
+                    ORDER BY timestamp ASC, id ASC
+                ''', (session_id,)).fetchall()
+                rows += [row[:4] for row in self._pending_rows(session_id)]
+            index = self._retriever.fill(session_id, version, [
+                (row[0], row[2], render_message(row[1], row[2], json.loads(row[3]) if row[3] else None))
+                for row in rows
+            ])
+        return render_relevant(self._retriever.search(index, query, top_k, exclude_last))
+    
+    def get_profile(self, session_id: str = 'default') -> Dict[str, Any]:
+        """Hồ sơ người dùng của session: name, email, preferred_times, typical_durations."""
+        return self._profiles.get(session_id)
+    
+    def get_profile_context(self, session_id: str = 'default') -> str:
+        """Khối hồ sơ người dùng một dòng cho prompt (rỗng nếu chưa biết gì)."""
+        return self._profiles.render(session_id)
+    
+    def get_summary_context(self, session_id: str = 'default') -> str:
+        """Bản tóm tắt các lượt đã trượt khỏi cửa sổ context (rỗng nếu chưa có hoặc tắt)."""
+        if self._summarizer is None:
+            return ""
+        return self._summarizer.render(session_id)
+    
+    def get_session_snapshot(self, session_id: str = 'default', limit: int = None) -> Dict[str, Any]:
+        """
+        Trạng thái hội thoại một lượt đọc được (cho TurnRecorder): limit message mới nhất
+        (mặc định trim_high_water, gồm cả message còn trong bộ đệm write-behind, cũ trước),
+        bản tóm tắt và hồ sơ (JSON) của session.
+        """
+        limit = limit or self.trim_high_water
+        columns = ('id', 'role', 'content', 'function_call', 'function_response', 'timestamp', 'created_at')
+        summary = None
+        with self._reading(), self._pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, role, content, function_call, function_response, timestamp, created_at
+                FROM conversation_history
+                WHERE session_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ''', (session_id, limit)).fetchall()
+            pending = self._pending_rows(session_id)
+            if self._summarizer is not None:
+                summary = conn.execute('''
+                    SELECT summary, facts, folded_messages, last_message_id, updated_at
+                    FROM conversation_summaries WHERE session_id = ?
+                ''', (session_id,)).fetchone()
+            profile = conn.execute(
+                'SELECT profile FROM user_profiles WHERE session_id = ?', (session_id,)
+            ).fetchone()
+        if pending:
+            rows = (pending[::-1] + rows)[:limit]
+        return {
+            'conversation': [dict(zip(columns[1:], row[1:])) for row in reversed(rows)],
+            'summary': dict(zip(('summary', 'facts', 'folded_messages', 'last_message_id', 'updated_at'), summary))
+            if summary else None,
+            'profile': profile[0] if profile else None
+        }
     
     def clear_session(self, session_id: str = 'default') -> int:
         """Xóa toàn bộ lịch sử của một session."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM conversation_history WHERE session_id = ?
-        ''', (session_id,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        deleted_count = self._buffer.discard(session_id) if self._buffer is not None else 0
+        with self._pool.connection() as conn:
+            cursor = conn.execute('''
+                DELETE FROM conversation_history WHERE session_id = ?
+            ''', (session_id,))
+            deleted_count += cursor.rowcount
+            if self._summarizer is not None:
+                self._summarizer.forget(session_id, conn)
+            self._profiles.forget(session_id, conn)
+        
+        self._forget_session_state(session_id)
+        with _session_counts_lock:
+            self._counts[session_id] = 0
         
         return deleted_count
     
+    def _forget_session_state(self, session_id: str):
+        """Bỏ bộ đếm và cache trong bộ nhớ của session sau khi DB bị xóa/ghi lại hàng loạt."""
+        forget_session_state(self.db_path, session_id, self._pool)
+        # Cache riêng của instance (nếu được thay, vd: trong test) cũng phải bỏ
+        self._context_cache.invalidate(session_id)
+        if self._retriever is not None:
+            self._retriever.invalidate(session_id)
+    
+    def restore_session(self, session_id: str = 'default') -> int:
+        """Khôi phục session đã bị lưu trữ do không hoạt động (không làm gì nếu session đang ở bảng nóng)."""
+        if self._archiver is None:
+            return 0
+        return self._archiver.restore(session_id)
+    
     def get_session_stats(self, session_id: str = 'default') -> Dict[str, Any]:
-        """Lấy thống kê của session."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tổng số messages
-        cursor.execute('''
-            SELECT COUNT(*) FROM conversation_history WHERE session_id = ?
-        ''', (session_id,))
-        total_messages = cursor.fetchone()[0]
-        
-        # Message đầu tiên và cuối cùng
-        cursor.execute('''
-            SELECT MIN(timestamp), MAX(timestamp) 
-            FROM conversation_history WHERE session_id = ?
-        ''', (session_id,))
-        min_time, max_time = cursor.fetchone()
-        
-        # Đếm theo role
-        cursor.execute('''
-            SELECT role, COUNT(*) 
-            FROM conversation_history 
-            WHERE session_id = ? 
-            GROUP BY role
-        ''', (session_id,))
-        role_counts = dict(cursor.fetchall())
-        
-        conn.close()
+        """Lấy thống kê của session (một lần đọc theo khóa trên conversation_sessions)."""
+        with self._reading(), self._pool.connection() as conn:
+            row = conn.execute('''
+                SELECT total_messages, user_messages, assistant_messages, first_message, last_message
+                FROM conversation_sessions WHERE session_id = ?
+            ''', (session_id,)).fetchone()
+            pending = self._pending_rows(session_id)
+        
+        total_messages, user_messages, assistant_messages, min_time, max_time = row or (0, 0, 0, None, None)
+        if pending:
+            total_messages += len(pending)
+            min_time = min_time or pending[0][5]
+            max_time = pending[-1][5]
+            user_messages += sum(1 for row in pending if row[1] == 'user')
+            assistant_messages += sum(1 for row in pending if row[1] == 'assistant')
         
         return {
             'session_id': session_id,
             'total_messages': total_messages,
             'first_message': min_time,
             'last_message': max_time,
-            'user_messages': role_counts.get('user', 0),
-            'assistant_messages': role_counts.get('assistant', 0)
+            'user_messages': user_messages,
+            'assistant_messages': assistant_messages
         }
     
-    def search_conversations(self, query: str, session_id: str = 'default', limit: int = 10) -> List[Dict[str, Any]]:
-        """Tìm kiếm trong lịch sử conversation."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, role, content, timestamp, created_at
-            FROM conversation_history 
-            WHERE session_id = ? AND content LIKE ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (session_id, f'%{query}%', limit))
-        
-        rows = cursor.fetchall()
-        conn.close()
+    def list_sessions(self, limit: int = None, cursor: str = None) -> Dict[str, Any]:
+        """
+        Danh bạ session, hoạt động gần nhất trước, phân trang keyset theo (last_activity, session_id).
+        Truyền next_cursor của trang trước vào cursor để lấy trang tiếp theo.
+        """
+        limit = max(1, min(limit or Config.HISTORY_PAGE_SIZE, Config.HISTORY_PAGE_MAX))
+        after = _decode_cursor(cursor) if cursor is not None else None
+        if self._buffer is not None:
+            self._buffer.flush()
+        
+        condition, params = '', []
+        if after is not None:
+            condition, params = 'WHERE (last_activity, session_id) < (?, ?)', list(after)
+        with self._pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT session_id, total_messages, user_messages, assistant_messages,
+                       first_message, last_message, last_activity
+                FROM conversation_sessions
+                {condition}
+                ORDER BY last_activity DESC, session_id DESC
+                LIMIT ?
+            ''', (*params, limit + 1)).fetchall()
+        
+        more = len(rows) > limit
+        rows = rows[:limit]
+        sessions = [
+            {
+                'session_id': row[0],
+                'total_messages': row[1],
+                'user_messages': row[2],
+                'assistant_messages': row[3],
+                'first_message': row[4],
+                'last_message': row[5],
+                'last_activity': row[6]
+            }
+            for row in rows
+        ]
+        return {
+            'sessions': sessions,
+            'next_cursor': _encode_cursor(rows[-1][6], rows[-1][0]) if more else None
+        }
+    
+    def search_conversations(self, query: str, session_id: Optional[str] = 'default', limit: int = 10,
+                             offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm trong lịch sử conversation bằng FTS5, xếp hạng BM25, kèm snippet.
+        Không phân biệt hoa thường và dấu tiếng Việt; session_id=None để tìm trên mọi session.
+        """
+        match = _fts_query(query, session_id)
+        if not match:
+            return []
+        if not self._fts:
+            return self._search_like(query, session_id, limit, offset)
+        
+        with self._reading(), self._pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT h.id, h.role, h.content, h.timestamp, h.created_at,
+                       snippet(conversation_fts, 0, '[', ']', '…', {Config.HISTORY_SEARCH_SNIPPET_TOKENS}),
+                       conversation_fts.rank
+                FROM conversation_fts
+                JOIN conversation_history h ON h.id = conversation_fts.rowid
+                WHERE conversation_fts MATCH ?
+                ORDER BY conversation_fts.rank
+                LIMIT ? OFFSET ?
+            ''', (match, limit, offset)).fetchall()
+            pending = self._pending_matches(query, session_id) if offset == 0 else []
+        
+        # Message chưa ghi (write-behind) chưa có trong chỉ mục: đưa lên đầu trang đầu tiên
+        results = [dict(message, snippet=message['content'], score=None) for message in pending]
+        for row in rows:
+            results.append({
+                'id': row[0],
+                'role': row[1],
+                'content': row[2],
+                'timestamp': row[3],
+                'created_at': row[4],
+                'snippet': row[5],
+                'score': round(-row[6], 6)
+            })
         
-        results = []
+        return results[:limit]
+    
+    def _search_like(self, query: str, session_id: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+        """Dự phòng khi SQLite không có FTS5: LIKE, mới nhất trước."""
+        session_filter = "session_id = ? AND" if session_id is not None else ""
+        params = ([session_id] if session_id is not None else []) + [f'%{query}%', limit, offset]
+        with self._reading(), self._pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, role, content, timestamp, created_at
+                FROM conversation_history 
+                WHERE {session_filter} content LIKE ?
+                ORDER BY timestamp DESC
+                LIMIT ? OFFSET ?
+            ''', params).fetchall()
+            pending = self._pending_matches(query, session_id) if offset == 0 else []
+        
+        results = [dict(message, snippet=message['content'], score=None) for message in pending]
         for row in rows:
             results.append({
                 'id': row[0],
                 'role': row[1],
                 'content': row[2],
                 'timestamp': row[3],
-                'created_at': row[4]
+                'created_at': row[4],
+                'snippet': row[2],
+                'score': None
             })
         
-        return results
+        return results[:limit]
+    
+    def _pending_matches(self, query: str, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Message trong bộ đệm write-behind chứa mọi từ của query (bỏ dấu), mới nhất trước."""
+        if self._buffer is None:
+            return []
+        terms = fold_text(query).split()
+        matches = []
+        for msg_id, message in reversed(self._buffer.pending(session_id)):
+            folded = fold_text(message[2])
+            if all(term in folded for term in terms):
+                matches.append({
+                    'id': msg_id,
+                    'role': message[1],
+                    'content': message[2],
+                    'timestamp': message[5],
+                    'created_at': message[6]
+                })
+        return matches
@@ -0,0 +1,290 @@
+import json
+import queue
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from core.config import Config
+from core.logger import get_logger
+from core.services.connection_pool import SQLitePool, db_key, get_pool
+from utils.clock import get_clock
+
+logger = get_logger(__name__)
+
+# Giống các mẫu _answer_from_context dùng để nhận ra tên người dùng
+NAME_PATTERNS = (
+    re.compile(r"tên (?:là|tôi là) (\w+)", re.IGNORECASE),
+    re.compile(r"chào (?:tôi tên là|mình là) (\w+)", re.IGNORECASE),
+    re.compile(r"nhớ (?:kĩ )?tên (?:tôi là|là) (\w+)", re.IGNORECASE),
+)
+_PREFERENCE_PATTERN = re.compile(r"(?:tôi|mình) (?:thích|hay|thường|không thích|ghét) ([^.,!?\n]{3,60})", re.IGNORECASE)
+_SCHEDULE_FUNCTIONS = ('smart_add_schedule', 'update_schedule', 'advise_schedule')
+
+_SUMMARY_PROMPT = """Bạn đang rút gọn lịch sử trò chuyện của một trợ lý lập lịch.
+Tóm tắt cũ (có thể trống):
+{previous}
+
+Các tin nhắn mới cần gộp vào:
+{transcript}
+
+Viết lại bản tóm tắt mới bằng tiếng Việt, tối đa 5 gạch đầu dòng, chỉ giữ thông tin hữu ích
+cho các lượt sau: tên, sở thích, thói quen, lịch đã tạo/đổi/xóa, yêu cầu còn dang dở."""
+
+
+def _empty_facts() -> Dict[str, Any]:
+    return {'name': None, 'preferences': [], 'schedules': []}
+
+
+def _remember(items: List[str], value: str):
+    """Thêm vào cuối danh sách (mới nhất cuối), bỏ trùng, giữ tối đa SUMMARY_MAX_ITEMS."""
+    value = value.strip()
+    if value in items:
+        items.remove(value)
+    items.append(value)
+    del items[:-Config.SUMMARY_MAX_ITEMS]
+
+
+def extract_facts(messages: List[tuple], facts: Dict[str, Any]) -> Dict[str, Any]:
+    """Trích thông tin cần nhớ từ các message (role, content, function_call JSON), cũ trước."""
+    for role, content, function_call in messages:
+        if role == 'user':
+            for pattern in NAME_PATTERNS:
+                match = pattern.search(content)
+                if match:
+                    facts['name'] = match.group(1)
+                    break
+            for match in _PREFERENCE_PATTERN.finditer(content):
+                _remember(facts['preferences'], match.group(0))
+        elif function_call:
+            try:
+                call = json.loads(function_call)
+            except ValueError:
+                continue
+            if not isinstance(call, dict):
+                continue
+            args = call.get('args') or {}
+            if call.get('name') in _SCHEDULE_FUNCTIONS and args.get('title'):
+                when = args.get('start_time') or args.get('preferred_date') or ''
+                _remember(facts['schedules'], f"{args['title']} ({when})" if when else str(args['title']))
+    return facts
+
+
+class ConversationSummarizer:
+    """
+    Gộp các message đã trượt khỏi cửa sổ context (CONTEXT_WINDOW_SIZE) vào một bản tóm tắt
+    lưu theo session, để thông tin như tên người dùng không mất khi lịch sử cũ bị cắt.
+    Trích xuất cục bộ (regex) chạy ở thread nền sau mỗi SUMMARY_EVERY message và chạy đồng bộ
+    ngay trước khi cắt lịch sử; nếu bật SUMMARY_USE_LLM, thread nền nhờ Gemini viết lại đoạn tóm tắt.
+    """
+
+    def __init__(self, pool: SQLitePool, window: int = None, every: int = None, use_llm: bool = None):
+        self.pool = pool
+        self.window = window or Config.CONTEXT_WINDOW_SIZE
+        self.every = every or Config.SUMMARY_EVERY
+        self.use_llm = Config.SUMMARY_USE_LLM if use_llm is None else use_llm
+        self._llm = None
+        self._unsummarized: Dict[str, int] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.compactions = 0
+        self.folded_messages = 0
+        self._create_table()
+
+    def _create_table(self):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT,  -- đoạn tóm tắt do LLM viết (nếu bật)
+                    facts TEXT NOT NULL,  -- JSON: tên, sở thích, lịch đã nhắc tới
+                    folded_messages INTEGER NOT NULL DEFAULT 0,
+                    last_message_id INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def notify(self, session_id: str, added: int = 1):
+        """Gọi sau khi message đã nằm trong DB; đủ SUMMARY_EVERY message mới thì xếp lịch gộp ở nền."""
+        with self._lock:
+            pending = self._unsummarized[session_id] = self._unsummarized.get(session_id, 0) + added
+            if pending < self.every or session_id in self._queued:
+                return
+            self._unsummarized[session_id] = 0
+            self._queued.add(session_id)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True, name="ConversationSummarizer")
+            self._thread.start()
+        self._queue.put(session_id)
+
+    def _run(self):
+        while True:
+            session_id = self._queue.get()
+            if session_id is None:
+                return
+            with self._lock:
+                self._queued.discard(session_id)
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    folded = self._fold(session_id, conn)
+                # Gọi Gemini sau khi đã trả kết nối: không giữ transaction trong lúc chờ mạng
+                if folded and self.use_llm:
+                    self._update_llm_summary(session_id, folded)
+            except Exception as e:
+                logger.error("[Summary] Lỗi gộp lịch sử session %s: %s", session_id, e)
+
+    def get_summary(self, session_id: str, conn: sqlite3.Connection = None) -> Optional[Dict[str, Any]]:
+        if conn is None:
+            with self.pool.connection() as own:
+                return self.get_summary(session_id, own)
+        row = conn.execute('''
+            SELECT summary, facts, folded_messages, last_message_id, updated_at
+            FROM conversation_summaries WHERE session_id = ?
+        ''', (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'summary': row[0],
+            'facts': json.loads(row[1]),
+            'folded_messages': row[2],
+            'last_message_id': row[3],
+            'updated_at': row[4]
+        }
+
+    def compact(self, session_id: str, conn: sqlite3.Connection = None) -> int:
+        """
+        Gộp (trích xuất cục bộ) các message nằm ngoài cửa sổ context và chưa được gộp.
+        conn: kết nối của transaction đang mở (vd: ngay trước khi cắt lịch sử). Trả về số message đã gộp.
+        """
+        if conn is None:
+            with self.pool.connection() as own:
+                own.execute('BEGIN IMMEDIATE')
+                return len(self._fold(session_id, own))
+        return len(self._fold(session_id, conn))
+
+    def _fold(self, session_id: str, conn: sqlite3.Connection) -> List[tuple]:
+        """
+        Phải chạy trong transaction đang giữ khóa ghi (BEGIN IMMEDIATE hoặc sau INSERT):
+        khóa ghi của SQLite tuần tự hóa các lần gộp, không cần thêm lock trong process.
+        """
+        current = self.get_summary(session_id, conn)
+        last_id = current['last_message_id'] if current else 0
+        rows = conn.execute('''
+            SELECT id, role, content, function_call
+            FROM conversation_history
+            WHERE session_id = ?
+            ORDER BY timestamp DESC
+        ''', (session_id,)).fetchall()
+        # Mới nhất trước: bỏ cửa sổ context, giữ các message chưa gộp, rồi đảo lại cũ trước
+        outside = [row for row in rows[self.window:] if row[0] > last_id][::-1]
+        if not outside:
+            return []
+
+        facts = extract_facts([row[1:] for row in outside], current['facts'] if current else _empty_facts())
+        summary = current['summary'] if current else None
+        folded = (current['folded_messages'] if current else 0) + len(outside)
+        conn.execute('''
+            INSERT INTO conversation_summaries
+            (session_id, summary, facts, folded_messages, last_message_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                summary = excluded.summary,
+                facts = excluded.facts,
+                folded_messages = excluded.folded_messages,
+                last_message_id = excluded.last_message_id,
+                updated_at = excluded.updated_at
+        ''', (session_id, summary, json.dumps(facts, ensure_ascii=False), folded,
+              max(row[0] for row in outside), get_clock().now().isoformat()))
+        self.compactions += 1
+        self.folded_messages += len(outside)
+        return outside
+
+    def _update_llm_summary(self, session_id: str, rows: List[tuple]):
+        current = self.get_summary(session_id)
+        if current is None:
+            return
+        summary = self._summarize_with_llm(current['summary'], rows)
+        if summary:
+            with self.pool.connection() as conn:
+                conn.execute('UPDATE conversation_summaries SET summary = ? WHERE session_id = ?',
+                             (summary, session_id))
+
+    def _summarize_with_llm(self, previous: Optional[str], rows: List[tuple]) -> Optional[str]:
+        from core.services.gemini_service import GeminiService
+        if self._llm is None:
+            self._llm = GeminiService()
+        transcript = "\n".join(
+            f"{'Người dùng' if row[1] == 'user' else 'Trợ lý'}: {row[2][:300]}" for row in rows
+        )
+        try:
+            response = self._llm.get_ai_response(
+                _SUMMARY_PROMPT.format(previous=previous or "(trống)", transcript=transcript),
+                feature='conversation_summary'
+            )
+            text = self._llm.format_response(response).strip()
+        except Exception as e:
+            logger.warning("[Summary] Gemini không tóm tắt được, giữ trích xuất cục bộ: %s", e)
+            return None
+        return text[:Config.SUMMARY_MAX_CHARS] or None
+
+    def render(self, session_id: str) -> str:
+        """Khối tóm tắt ngắn chèn vào prompt trước các lượt gần đây; rỗng nếu chưa có."""
+        current = self.get_summary(session_id)
+        if current is None:
+            return ""
+        facts = current['facts']
+        lines = [f"📌 TÓM TẮT CÁC LƯỢT TRƯỚC (đã rút gọn {current['folded_messages']} tin nhắn):"]
+        if facts.get('name'):
+            lines.append(f"- Tên người dùng: {facts['name']}")
+        if facts.get('preferences'):
+            lines.append(f"- Sở thích/thói quen: {'; '.join(facts['preferences'])}")
+        if facts.get('schedules'):
+            lines.append(f"- Lịch đã nhắc tới: {'; '.join(facts['schedules'])}")
+        if current['summary']:
+            lines.append(current['summary'])
+        return "\n".join(lines) if len(lines) > 1 else ""
+
+    def forget(self, session_id: str, conn: sqlite3.Connection):
+        """Xóa bản tóm tắt khi xóa session."""
+        conn.execute('DELETE FROM conversation_summaries WHERE session_id = ?', (session_id,))
+        with self._lock:
+            self._unsummarized.pop(session_id, None)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=Config.CONNECTION_TIMEOUT)
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'compactions': self.compactions,
+            'folded_messages': self.folded_messages,
+            'queued_sessions': self._queue.qsize(),
+            'use_llm': self.use_llm
+        }
+
+
+_summarizers: Dict[str, ConversationSummarizer] = {}
+_summarizers_lock = threading.Lock()
+
+def get_conversation_summarizer(db_path: Optional[str] = None, pool: SQLitePool = None) -> ConversationSummarizer:
+    """Bộ tóm tắt dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    summarizer = _summarizers.get(key)
+    if summarizer is None:
+        with _summarizers_lock:
+            summarizer = _summarizers.get(key)
+            if summarizer is None:
+                summarizer = _summarizers[key] = ConversationSummarizer(pool or get_pool(key))
+    return summarizer
+
+def close_conversation_summarizers():
+    with _summarizers_lock:
+        summarizers = list(_summarizers.values())
+        _summarizers.clear()
+    for summarizer in summarizers:
+        summarizer.close()
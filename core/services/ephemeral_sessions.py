@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from core.config import Config
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+
+# Khóa thay cho đường dẫn DB của các singleton (context cache, summarizer, hồ sơ...) dùng cho session tạm;
+# db_key giữ nguyên tên dạng ':...:' nên không bị đổi thành đường dẫn file trong thư mục hiện tại
+EPHEMERAL_DB_KEY = ':ephemeral:'
+
+
+def is_ephemeral_session(session_id: str) -> bool:
+    """Session tạm theo tiền tố tên (Config.EPHEMERAL_SESSION_PREFIXES), vd: guest-..., anon-..."""
+    return bool(Config.EPHEMERAL_SESSION_PREFIXES) and session_id.startswith(Config.EPHEMERAL_SESSION_PREFIXES)
+
+
+class EphemeralSessionStore:
+    """
+    Kho session tạm dùng chung trong process: một DB SQLite :memory: (cùng schema, trigger, FTS với DB thật)
+    sau một pool đúng 1 kết nối, nên không ghi gì xuống đĩa và mất khi process dừng.
+    Giới hạn số session theo LRU; session ít hoạt động nhất bị xóa khi vượt max_sessions.
+    """
+
+    def __init__(self, max_sessions: int = None):
+        self.max_sessions = max_sessions or Config.EPHEMERAL_MAX_SESSIONS
+        # :memory: sống cùng kết nối, nên pool chỉ có một kết nối và mọi thao tác đi tuần tự qua nó
+        self.pool = SQLitePool(':memory:', size=1)
+        self._sessions: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.promotions = 0
+
+    def touch(self, session_id: str) -> Optional[str]:
+        """Đánh dấu session vừa hoạt động; trả về session cần bỏ nếu vượt giới hạn."""
+        with self._lock:
+            self._sessions[session_id] = None
+            self._sessions.move_to_end(session_id)
+            if len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                self.evictions += 1
+                return evicted
+        return None
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'evictions': self.evictions,
+                'promotions': self.promotions
+            }
+
+
+class EphemeralConversationService(ConversationService):
+    """
+    ConversationService cho session tạm (khách, ẩn danh, thử nghiệm): cùng API nhưng lưu trong
+    EphemeralSessionStore thay vì file DB. promote_session chuyển session sang DB lưu bền.
+    """
+
+    # Session tạm không được lưu trữ ra đĩa
+    retention = False
+
+    def __init__(self, max_history: int = None):
+        self._store = get_ephemeral_store()
+        super().__init__(db_path=EPHEMERAL_DB_KEY, max_history=max_history, pool=self._store.pool,
+                         write_behind=False)
+
+    def _add_message(self, session_id: str, role: str, content: str,
+                     function_call: Dict = None, function_response: Dict = None) -> int:
+        message_id = super()._add_message(session_id, role, content, function_call, function_response)
+        evicted = self._store.touch(session_id)
+        if evicted is not None:
+            self.clear_session(evicted)
+        return message_id
+
+    def clear_session(self, session_id: str = 'default') -> int:
+        self._store.discard(session_id)
+        return super().clear_session(session_id)
+
+    def promote_session(self, session_id: str, target: ConversationService = None,
+                        target_session_id: str = None) -> int:
+        """
+        Chép session tạm (message, bản tóm tắt, hồ sơ) sang DB lưu bền rồi xóa bản tạm.
+        Trả về số message đã chép. target_session_id mặc định trùng session_id và không được là tên session tạm.
+        Nếu session đích đã có lịch sử, message được nối thêm và hồ sơ của nó được dựng lại từ lịch sử.
+        """
+        target_session_id = target_session_id or session_id
+        if is_ephemeral_session(target_session_id):
+            raise ValueError(f"Session đích '{target_session_id}' trùng tiền tố session tạm")
+        target = target or ConversationService()
+
+        with self._pool.connection() as conn:
+            messages = conn.execute('''
+                SELECT id, role, content, function_call, function_response, timestamp, created_at
+                FROM conversation_history
+                WHERE session_id = ?
+                ORDER BY timestamp, id
+            ''', (session_id,)).fetchall()
+            summary = None
+            if self._summarizer is not None:
+                summary = conn.execute('''
+                    SELECT summary, facts, folded_messages, last_message_id, updated_at
+                    FROM conversation_summaries WHERE session_id = ?
+                ''', (session_id,)).fetchone()
+            profile = conn.execute('''
+                SELECT profile, updated_at FROM user_profiles WHERE session_id = ?
+            ''', (session_id,)).fetchone()
+        if not messages:
+            return 0
+
+        with target._pool.connection() as conn:
+            existing = conn.execute('''
+                SELECT total_messages FROM conversation_sessions WHERE session_id = ?
+            ''', (target_session_id,)).fetchone()
+            # id mới theo thứ tự chèn, để last_message_id của bản tóm tắt vẫn trỏ đúng ranh giới đã gộp
+            new_ids = {}
+            for message_id, *row in messages:
+                cursor = conn.execute('''
+                    INSERT INTO conversation_history
+                    (session_id, role, content, function_call, function_response, timestamp, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (target_session_id, *row))
+                new_ids[message_id] = cursor.lastrowid
+            if summary is not None and target._summarizer is not None:
+                folded_until = max((new for old, new in new_ids.items() if old <= summary[3]), default=0)
+                conn.execute('''
+                    INSERT OR IGNORE INTO conversation_summaries
+                    (session_id, summary, facts, folded_messages, last_message_id, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (target_session_id, summary[0], summary[1], summary[2], folded_until, summary[4]))
+            if existing is None and profile is not None:
+                conn.execute('''
+                    INSERT OR REPLACE INTO user_profiles (session_id, profile, updated_at) VALUES (?, ?, ?)
+                ''', (target_session_id, *profile))
+            else:
+                conn.execute('DELETE FROM user_profiles WHERE session_id = ?', (target_session_id,))
+            target._forget_session_state(target_session_id)
+            target._cleanup_old_messages(target_session_id, conn, len(messages))
+        target._forget_session_state(target_session_id)
+        target._profiles.invalidate(target_session_id)
+
+        self.clear_session(session_id)
+        with self._store._lock:
+            self._store.promotions += 1
+        return len(messages)
+
+    def get_store_stats(self) -> Dict[str, Any]:
+        return self._store.get_stats()
+
+
+_store: Optional[EphemeralSessionStore] = None
+_store_lock = threading.Lock()
+
+def get_ephemeral_store() -> EphemeralSessionStore:
+    """Kho session tạm dùng chung trong process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EphemeralSessionStore()
+    return _store
@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Iterable, List, Optional, Tuple
+
+from core.config import Config
+from core.services.schedule_index import ScheduleIntervalIndex, to_epoch
+
+Interval = Tuple[float, float]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Gộp các khoảng (epoch) chồng hoặc chạm nhau thành các khoảng rời nhau, tăng dần."""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_gaps(window_start: float, window_end: float, busy: List[Interval]) -> List[Interval]:
+    """Quét một lượt: phần bù của các khoảng bận (đã gộp, tăng dần) trong [window_start, window_end)."""
+    gaps = []
+    cursor = window_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            gaps.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < window_end:
+        gaps.append((cursor, window_end))
+    return gaps
+
+
+def _at(day: date, hour: int, tz: tzinfo) -> datetime:
+    naive = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+    # pytz cần localize; timezone cố định (VIETNAM_TZ) gắn trực tiếp
+    return tz.localize(naive) if hasattr(tz, 'localize') else naive.replace(tzinfo=tz)
+
+
+class FreeSlotFinder:
+    """
+    Tìm khung giờ trống trên chỉ mục lịch: mỗi ngày chỉ lấy các khối bận một lần, gộp với giờ nghỉ
+    trưa, rồi quét một lượt trong giờ làm việc để ra mọi khoảng trống. Các slot (mọi thời lượng,
+    bước nhảy) được sinh trực tiếp từ khoảng trống, nên chi phí không phụ thuộc độ mịn của bước.
+    """
+
+    def __init__(self, index: ScheduleIntervalIndex, tz: tzinfo,
+                 business_hours: Tuple[int, int] = None, lunch_time: Optional[Tuple[int, int]] = None,
+                 skip_weekends: bool = False):
+        self.index = index
+        self.tz = tz
+        self.business_hours = business_hours or Config.WORK_TIME
+        self.lunch_time = Config.LUNCH_TIME if lunch_time is None else lunch_time
+        self.skip_weekends = skip_weekends
+
+    def _days(self, start: datetime, end: datetime):
+        day = start.astimezone(self.tz).date()
+        # end không thuộc khoảng: nửa đêm của ngày cuối không kéo thêm một ngày
+        last = (end - timedelta(microseconds=1)).astimezone(self.tz).date()
+        while day <= last:
+            if not (self.skip_weekends and day.weekday() >= 5):
+                yield day
+            day += timedelta(days=1)
+
+    def free_intervals(self, start: datetime, end: datetime,
+                       start_hour: int = None, end_hour: int = None) -> List[Tuple[datetime, datetime]]:
+        """Mọi khoảng trống trong [start, end) nằm trong giờ làm việc (hoặc [start_hour, end_hour)) mỗi ngày."""
+        return [(self._to_datetime(s), self._to_datetime(e))
+                for _, (s, e) in self._free_epochs(start, end, start_hour, end_hour)]
+
+    def _free_epochs(self, start: datetime, end: datetime, start_hour: int = None, end_hour: int = None):
+        """(epoch giờ bắt đầu làm việc của ngày, khoảng trống) theo thứ tự thời gian."""
+        start_hour = self.business_hours[0] if start_hour is None else start_hour
+        end_hour = self.business_hours[1] if end_hour is None else end_hour
+        lower, upper = to_epoch(start), to_epoch(end)
+        for day in self._days(start, end):
+            day_start = to_epoch(_at(day, start_hour, self.tz))
+            window = (max(day_start, lower), min(to_epoch(_at(day, end_hour, self.tz)), upper))
+            if window[0] >= window[1]:
+                continue
+            busy = self.index.busy_between(*window)
+            if self.lunch_time:
+                lunch = (to_epoch(_at(day, self.lunch_time[0], self.tz)), to_epoch(_at(day, self.lunch_time[1], self.tz)))
+                busy = merge_intervals(busy + [lunch])
+            for gap in free_gaps(window[0], window[1], busy):
+                yield day_start, gap
+
+    def slots(self, start: datetime, end: datetime, duration_minutes: int, step_minutes: int = 15,
+              limit: int = None, start_hour: int = None, end_hour: int = None) -> List[Tuple[datetime, datetime]]:
+        """
+        Các slot [s, s + duration) trống, s nằm trên lưới bước step_minutes tính từ giờ bắt đầu
+        làm việc của mỗi ngày, theo thứ tự thời gian; dừng sau limit slot nếu có.
+        """
+        length, step = duration_minutes * 60, step_minutes * 60
+        found = []
+        for anchor, (gap_start, gap_end) in self._free_epochs(start, end, start_hour, end_hour):
+            # Điểm lưới đầu tiên không sớm hơn đầu khoảng trống
+            slot = anchor + -(-(gap_start - anchor) // step) * step
+            while slot + length <= gap_end:
+                found.append((self._to_datetime(slot), self._to_datetime(slot + length)))
+                if limit is not None and len(found) >= limit:
+                    return found
+                slot += step
+        return found
+
+    def _to_datetime(self, epoch: float) -> datetime:
+        return datetime.fromtimestamp(epoch, self.tz)
@@ -2,10 +2,12 @@
 import google.generativeai as genai
 import threading
 import queue
+import time
 from typing import Any
 from google.generativeai.types import GenerateContentResponse
 from core.config import Config
 from core.exceptions import GeminiAPIError
+from core.monitoring.usage import get_usage_tracker
 
 
 class GeminiService:
@@ -34,8 +36,14 @@ class GeminiService:
         except Exception as e:
             q.put(e)
     
-    def generate_with_timeout(self, system_prompt: str, functions: list) -> Any:
+    def _record_usage(self, feature: str, started: float, response: Any = None, error: bool = False):
+        """Ghi nhận token, độ trễ và feature gọi cho thống kê usage theo session."""
+        get_usage_tracker().record(feature, Config.GEMINI_MODEL, time.perf_counter() - started,
+                                   response=response, error=error)
+
+    def generate_with_timeout(self, system_prompt: str, functions: list, feature: str = 'function_calling') -> Any:
         """Tạo nội dung với xử lý timeout"""
+        started = time.perf_counter()
         q = queue.Queue()
         thread = threading.Thread(
             target=self._call_gemini_api, 
@@ -46,12 +54,15 @@ class GeminiService:
         thread.join(timeout=Config.GEMINI_TIMEOUT)
         
         if thread.is_alive():
+            self._record_usage(feature, started, error=True)
             raise GeminiAPIError("Gemini API quá chậm hoặc không phản hồi")
         
         response = q.get()
         if isinstance(response, Exception):
+            self._record_usage(feature, started, error=True)
             raise GeminiAPIError(f"Lỗi Gemini API: {response}")
         
+        self._record_usage(feature, started, response)
         return response
     
     def extract_function_call(self, response):
@@ -63,11 +74,17 @@ class GeminiService:
         except (IndexError, AttributeError):
             return None
 
-    def get_ai_response(self, prompt: str) -> GenerateContentResponse:
+    def get_ai_response(self, prompt: str, feature: str = 'ai_response') -> GenerateContentResponse:
         """
         Receives a user prompt, processes it with the AIAgent, and returns the raw response.
         """
-        response = self.model.generate_content(prompt)
+        started = time.perf_counter()
+        try:
+            response = self.model.generate_content(prompt)
+        except Exception:
+            self._record_usage(feature, started, error=True)
+            raise
+        self._record_usage(feature, started, response)
         return response
 
     def format_response(self, response: GenerateContentResponse | str | dict) -> str:
@@ -89,10 +106,11 @@ class GeminiService:
         # 4. Fallback for any other unexpected data types
         return "Không thể định dạng loại phản hồi không xác định."
 
-    async def process_message(self, message: str) -> str:
+    async def process_message(self, message: str, feature: str = 'schedule_advice') -> str:
         """
         Xử lý tin nhắn bằng Gemini AI cho tư vấn lịch trình
         """
+        started = time.perf_counter()
         try:
             response = self.model.generate_content(
                 message,
@@ -101,6 +119,8 @@ class GeminiService:
                     max_output_tokens=500  # Tăng độ dài cho phản hồi chi tiết
                 )
             )
+            self._record_usage(feature, started, response)
             return response.text
         except Exception as e:
+            self._record_usage(feature, started, error=True)
             raise GeminiAPIError(f"Lỗi khi xử lý tin nhắn: {str(e)}")
\ No newline at end of file
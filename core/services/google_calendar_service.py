@@ -11,6 +11,21 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 import time
 import socket
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Số calendar tối đa trong một request freebusy (giới hạn calendarExpansionMax của Google)
+FREEBUSY_MAX_CALENDARS = 50
+
+
+class FreeBusyUnavailableError(RuntimeError):
+    """Không lấy được freebusy của một số calendar; calendars: {calendar_id: lý do}, busy: phần lấy được."""
+
+    def __init__(self, calendars: Dict[str, str], busy: Dict[str, List[Dict[str, str]]]):
+        super().__init__("Không lấy được freebusy của: " + ", ".join(f"{k} ({v})" for k, v in calendars.items()))
+        self.calendars = calendars
+        self.busy = busy
 
 
 class GoogleCalendarService:
@@ -150,7 +165,7 @@ class GoogleCalendarService:
             event = service.events().insert(calendarId=calendar_id, body=event_body).execute()
             return event.get('id')
         except HttpError as e:
-            print(f"[GoogleCalendar] Lỗi tạo event: {e}")
+            logger.error("[GoogleCalendar] Lỗi tạo event: %s", e)
             return None
 
     def update_event(self, event_id: str, summary: str, description: str, start_iso: str, end_iso: str, calendar_id: str = 'primary') -> bool:
@@ -164,7 +179,7 @@ class GoogleCalendarService:
             service.events().update(calendarId=calendar_id, eventId=event_id, body=event).execute()
             return True
         except HttpError as e:
-            print(f"[GoogleCalendar] Lỗi cập nhật event: {e}")
+            logger.error("[GoogleCalendar] Lỗi cập nhật event: %s", e)
             return False
 
     def delete_event(self, event_id: str, calendar_id: str = 'primary') -> bool:
@@ -175,7 +190,7 @@ class GoogleCalendarService:
         except HttpError as e:
             if e.resp is not None and e.resp.status in (404, 410):
                 return True
-            print(f"[GoogleCalendar] Lỗi xóa event: {e}")
+            logger.error("[GoogleCalendar] Lỗi xóa event: %s", e)
             return False
 
     # ------------- Incremental Sync -------------
@@ -198,7 +213,7 @@ class GoogleCalendarService:
                     wait_time = 2 ** attempt
                     time.sleep(wait_time)
                 else:
-                    print(f"[Sync] Network timeout after {self._max_retries} attempts")
+                    logger.warning("[Sync] Network timeout after %s attempts", self._max_retries)
                     return {'synced': 0, 'changes': [], 'error': 'network_timeout'}
                     
             except HttpError as e:
@@ -206,11 +221,11 @@ class GoogleCalendarService:
                     self._update_sync_state(next_sync_token=None)
                     return self.sync_from_google(calendar_id=calendar_id)
                 else:
-                    print(f"[Sync] HTTP Error: {e}")
+                    logger.error("[Sync] HTTP Error: %s", e)
                     return {'synced': 0, 'changes': [], 'error': str(e)}
                     
             except Exception as e:
-                print(f"[Sync] Error: {e}")
+                logger.error("[Sync] Error: %s", e)
                 return {'synced': 0, 'changes': [], 'error': str(e)}
 
     def _do_sync_from_google(self, calendar_id: str = 'primary') -> Dict[str, Any]:
@@ -250,7 +265,7 @@ class GoogleCalendarService:
                         'summary': ev.get('summary', '')[:30]
                     })
                 except Exception as ev_error:
-                    print(f"[Sync] Event error {ev.get('id')}: {ev_error}")
+                    logger.warning("[Sync] Event error %s: %s", ev.get('id'), ev_error)
 
             page_token = resp.get('nextPageToken')
             if not page_token:
@@ -296,7 +311,7 @@ class GoogleCalendarService:
             self._update_sync_state(channel_id=None, resource_id=None, resource_uri=None, channel_expiration=None)
             return True
         except HttpError as e:
-            print(f"[GoogleCalendar] Lỗi stop watch: {e}")
+            logger.error("[GoogleCalendar] Lỗi stop watch: %s", e)
             return False
 
     # ------------- Local Upsert from Google Event -------------
@@ -360,6 +375,46 @@ class GoogleCalendarService:
         finally:
             conn.close()
 
+    # ------------- Free/Busy -------------
+    def query_freebusy(self, calendar_ids: List[str], time_min_iso: str, time_max_iso: str,
+                       service=None) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Khoảng bận của nhiều calendar qua endpoint freebusy (mỗi request tối đa FREEBUSY_MAX_CALENDARS calendar).
+        Trả về {calendar_id: [{'start', 'end'}, ...]}. Calendar lỗi (không có quyền, không tồn tại,
+        request lỗi) không được coi là trống: raise FreeBusyUnavailableError liệt kê các calendar đó.
+        service: client calendar v3 (mặc định tạo từ credentials), hoặc bản thay thế có cùng giao diện.
+        """
+        service = service or self._build_service()
+        result: Dict[str, List[Dict[str, str]]] = {}
+        unavailable: Dict[str, str] = {}
+        for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+            batch = calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+            body = {
+                'timeMin': time_min_iso,
+                'timeMax': time_max_iso,
+                'timeZone': 'Asia/Ho_Chi_Minh',
+                'items': [{'id': calendar_id} for calendar_id in batch],
+            }
+            try:
+                resp = service.freebusy().query(body=body).execute()
+            except HttpError as e:
+                logger.error("[GoogleCalendar] Lỗi truy vấn freebusy: %s", e)
+                unavailable.update((calendar_id, f"HTTP {e.status_code}") for calendar_id in batch)
+                continue
+            calendars = resp.get('calendars', {})
+            for calendar_id in batch:
+                info = calendars.get(calendar_id)
+                if info is None:
+                    unavailable[calendar_id] = 'missing'
+                elif info.get('errors'):
+                    unavailable[calendar_id] = ','.join(err.get('reason', 'unknown') for err in info['errors'])
+                else:
+                    result[calendar_id] = info.get('busy', [])
+        if unavailable:
+            logger.warning("[GoogleCalendar] Không lấy được freebusy của %s", unavailable)
+            raise FreeBusyUnavailableError(unavailable, result)
+        return result
+
     # ------------- Backfill & Sync Control -------------
     def backfill_range(self, time_min_iso: str, time_max_iso: str, calendar_id: str = 'primary') -> Dict[str, Any]:
         service = self._build_service()
@@ -410,12 +465,12 @@ class GoogleCalendarService:
             query = '''
                 SELECT 1 FROM schedules
                 WHERE deleted = 0
-                AND NOT (end_time <= ? OR start_time >= ?)
+                AND start_time < ? AND end_time > ?
             '''
-            params = (start_iso, end_iso)
+            params = (end_iso, start_iso)
             if exclude_google_id:
                 query += ' AND (google_event_id IS NULL OR google_event_id != ?)'
-                params = (start_iso, end_iso, exclude_google_id)
+                params = (end_iso, start_iso, exclude_google_id)
             cur.execute(query, params)
             return cur.fetchone() is None
         finally:
@@ -431,9 +486,9 @@ class GoogleCalendarService:
             cur.execute('''
                 SELECT id, title, start_time, end_time, google_event_id FROM schedules
                 WHERE deleted = 0
-                AND NOT (end_time <= ? OR start_time >= ?)
+                AND start_time < ? AND end_time > ?
                 ORDER BY start_time
-            ''', (start_iso, end_iso))
+            ''', (end_iso, start_iso))
             rows = cur.fetchall()
             return [dict(row) for row in rows]
         finally:
@@ -0,0 +1,149 @@
+import bisect
+import heapq
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.services.free_slots import FreeSlotFinder, Interval
+from core.services.schedule_index import get_schedule_index, to_epoch
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def merge_busy(calendars: Iterable[List[Interval]]) -> List[Interval]:
+    """Hợp khoảng bận của nhiều calendar (mỗi danh sách đã tăng dần): trộn k đường bằng heapq.merge rồi gộp một lượt."""
+    merged: List[Interval] = []
+    for start, end in heapq.merge(*calendars):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class BusyTimeline:
+    """Các khoảng bận đã gộp, cùng giao diện busy_between với ScheduleIntervalIndex (dùng được cho FreeSlotFinder)."""
+
+    def __init__(self, intervals: List[Interval]):
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+
+    def busy_between(self, start: Any, end: Any) -> List[Interval]:
+        start, end = to_epoch(start), to_epoch(end)
+        blocks = []
+        i = bisect.bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            blocks.append((max(self.starts[i], start), min(self.ends[i], end)))
+            i += 1
+        return blocks
+
+    def is_free(self, start: Any, end: Any) -> bool:
+        return not self.busy_between(start, end)
+
+
+class LocalFreeBusyService:
+    """
+    Bản thay thế endpoint freebusy của Google Calendar chạy cục bộ (test, benchmark):
+    cùng giao diện service.freebusy().query(body=...).execute(), dữ liệu lấy từ
+    {calendar_id: [(start_iso, end_iso), ...]}. Calendar không có trong dữ liệu trả lỗi notFound như Google.
+    """
+
+    def __init__(self, calendars: Dict[str, List[Tuple[str, str]]]):
+        self.calendars = calendars
+        self.requests = 0
+
+    def freebusy(self):
+        return self
+
+    def query(self, body: Dict[str, Any]):
+        self.requests += 1
+        low, high = to_epoch(_rfc3339(body['timeMin'])), to_epoch(_rfc3339(body['timeMax']))
+        calendars = {}
+        for item in body['items']:
+            events = self.calendars.get(item['id'])
+            if events is None:
+                calendars[item['id']] = {'errors': [{'domain': 'global', 'reason': 'notFound'}], 'busy': []}
+                continue
+            busy = merge_busy([sorted((to_epoch(start), to_epoch(end)) for start, end in events)])
+            calendars[item['id']] = {'busy': [
+                {'start': _iso(max(start, low)), 'end': _iso(min(end, high))}
+                for start, end in busy if start < high and end > low
+            ]}
+        return _Response({'kind': 'calendar#freeBusy', 'timeMin': body['timeMin'], 'timeMax': body['timeMax'],
+                          'calendars': calendars})
+
+
+class _Response:
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+
+    def execute(self) -> Dict[str, Any]:
+        return self.payload
+
+
+def _rfc3339(value: str) -> str:
+    # Google trả thời gian UTC dạng ...Z
+    return value[:-1] + '+00:00' if value.endswith('Z') else value
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, VIETNAM_TZ).isoformat()
+
+
+class GroupAvailability:
+    """
+    Tìm khung giờ mà mọi người / tài nguyên cùng trống. Mỗi người tham gia là một calendar:
+    file DB cục bộ (bảng schedules, qua chỉ mục lịch) hoặc calendar Google (endpoint freebusy,
+    gộp nhiều calendar mỗi request). Khoảng bận của N calendar được trộn k đường thành một
+    dòng thời gian bận chung, rồi FreeSlotFinder quét khoảng trống trong giờ làm việc.
+    """
+
+    def __init__(self, local_db_paths: Sequence[str] = (), google_calendar_ids: Sequence[str] = (),
+                 calendar_service=None, freebusy_service=None, business_hours: Tuple[int, int] = None,
+                 lunch_time: Optional[Tuple[int, int]] = None, skip_weekends: bool = False):
+        self.local_db_paths = list(local_db_paths)
+        self.google_calendar_ids = list(google_calendar_ids)
+        self.calendar_service = calendar_service
+        self.freebusy_service = freebusy_service
+        self.business_hours = business_hours
+        self.lunch_time = lunch_time
+        self.skip_weekends = skip_weekends
+
+    def busy_by_calendar(self, start: datetime, end: datetime) -> Dict[str, List[Interval]]:
+        """
+        Khoảng bận (epoch, đã gộp, tăng dần) trong [start, end) theo từng calendar.
+        Calendar Google không lấy được freebusy: raise FreeBusyUnavailableError (không coi là trống).
+        """
+        busy: Dict[str, List[Interval]] = {}
+        for db_path in self.local_db_paths:
+            busy[f'local:{db_path}'] = get_schedule_index(db_path).busy_between(start, end)
+        if self.google_calendar_ids:
+            if self.calendar_service is None:
+                from core.services.google_calendar_service import GoogleCalendarService
+                self.calendar_service = GoogleCalendarService()
+            response = self.calendar_service.query_freebusy(
+                self.google_calendar_ids, start.isoformat(), end.isoformat(), service=self.freebusy_service)
+            for calendar_id in self.google_calendar_ids:
+                intervals = ((to_epoch(_rfc3339(item['start'])), to_epoch(_rfc3339(item['end'])))
+                             for item in response[calendar_id])
+                busy[calendar_id] = merge_busy([sorted(intervals)])
+        return busy
+
+    def common_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        """Hợp khoảng bận của mọi calendar trong [start, end)."""
+        return merge_busy(self.busy_by_calendar(start, end).values())
+
+    def _finder(self, start: datetime, end: datetime) -> FreeSlotFinder:
+        return FreeSlotFinder(BusyTimeline(self.common_busy(start, end)), VIETNAM_TZ,
+                              business_hours=self.business_hours, lunch_time=self.lunch_time,
+                              skip_weekends=self.skip_weekends)
+
+    def free_slots(self, start: datetime, end: datetime, duration_minutes: int, step_minutes: int = 15,
+                   limit: int = None) -> List[Tuple[datetime, datetime]]:
+        """Các slot dài duration_minutes mà mọi calendar đều trống (xem FreeSlotFinder.slots)."""
+        return self._finder(start, end).slots(start, end, duration_minutes, step_minutes=step_minutes, limit=limit)
+
+    def free_intervals(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Các khoảng mà mọi calendar đều trống, trong giờ làm việc."""
+        return self._finder(start, end).free_intervals(start, end)
@@ -0,0 +1,211 @@
+import atexit
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.config import Config
+from core.logger import get_logger
+from core.monitoring.loop_monitor import LagHistogram
+from core.services.connection_pool import SQLitePool, db_key, get_pool
+
+logger = get_logger(__name__)
+
+# Các bucket (giây) cho thời gian một lần flush và (số message) cho kích thước batch
+FLUSH_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# (session_id, role, content, function_call, function_response, timestamp, created_at)
+PendingMessage = Tuple[str, str, str, Optional[str], Optional[str], str, str]
+
+
+class HistoryWriteBuffer:
+    """
+    Write-behind cho conversation_history: message được giữ trong bộ đệm theo session
+    (đọc được ngay) và một thread nền ghi xuống DB theo batch, mỗi batch một transaction.
+    Batch được ghi khi đủ max_batch message hoặc sau flush_interval giây.
+    """
+
+    def __init__(self, pool: SQLitePool, flush_interval: float = None, max_batch: int = None):
+        self.pool = pool
+        self.flush_interval = flush_interval or Config.HISTORY_FLUSH_INTERVAL
+        self.max_batch = max_batch or Config.HISTORY_FLUSH_MAX_BATCH
+        # session_id -> [(seq, message)], seq âm tăng dần làm id tạm cho tới khi được ghi
+        self._pending: "OrderedDict[str, List[Tuple[int, PendingMessage]]]" = OrderedDict()
+        self._pending_count = 0
+        self._oldest_pending: Optional[float] = None
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        # Giữ trong suốt một lần flush để người đọc không thấy message vừa ở DB vừa ở bộ đệm
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._after_flush: Optional[Callable] = None
+
+        self.flush_latency = LagHistogram(FLUSH_LATENCY_BUCKETS)
+        self.batch_size = LagHistogram(BATCH_SIZE_BUCKETS)
+        self.flushed_messages = 0
+        self.failed_flushes = 0
+
+    def set_after_flush(self, callback: Callable) -> None:
+        """callback(conn, {session_id: số message}) chạy trong cùng transaction sau khi chèn batch (vd: cắt lịch sử cũ)."""
+        self._after_flush = callback
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="HistoryWriteBehind")
+        self._thread.start()
+
+    def append(self, message: PendingMessage) -> int:
+        """Đưa message vào bộ đệm, trả về id tạm (số âm)."""
+        seq = next(self._seq)
+        with self._lock:
+            self._pending.setdefault(message[0], []).append((seq, message))
+            self._pending_count += 1
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            full = self._pending_count >= self.max_batch
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if full:
+            self._wakeup.set()
+        return -seq
+
+    @contextmanager
+    def reading(self):
+        """Đọc DB rồi đọc bộ đệm trong khối này để không trùng/mất message đang được flush."""
+        with self._flush_lock:
+            yield
+
+    def pending(self, session_id: Optional[str]) -> List[Tuple[int, PendingMessage]]:
+        """Các message chưa ghi của session (None: mọi session), theo thứ tự thêm vào."""
+        with self._lock:
+            if session_id is None:
+                return sorted((item for items in self._pending.values() for item in items), key=lambda item: item[0])
+            return list(self._pending.get(session_id, ()))
+
+    def discard(self, session_id: str) -> int:
+        """Bỏ các message chưa ghi của session (dùng khi xóa session)."""
+        with self._flush_lock, self._lock:
+            dropped = self._pending.pop(session_id, [])
+            self._pending_count -= len(dropped)
+            if not self._pending_count:
+                self._oldest_pending = None
+        return len(dropped)
+
+    def _take_batch(self) -> Dict[str, List[Tuple[int, PendingMessage]]]:
+        with self._lock:
+            batch = self._pending
+            self._pending = OrderedDict()
+            self._pending_count = 0
+            self._oldest_pending = None
+        return batch
+
+    def _restore(self, batch: Dict[str, List[Tuple[int, PendingMessage]]]):
+        """Trả batch ghi lỗi về đầu bộ đệm để lần flush sau thử lại."""
+        with self._lock:
+            for session_id, items in reversed(list(batch.items())):
+                items.extend(self._pending.pop(session_id, []))
+                self._pending[session_id] = items
+                self._pending.move_to_end(session_id, last=False)
+            self._pending_count = sum(len(items) for items in self._pending.values())
+            if self._pending_count and self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+
+    def flush(self) -> int:
+        """Ghi toàn bộ bộ đệm xuống DB trong một transaction. Trả về số message đã ghi."""
+        with self._flush_lock:
+            batch = self._take_batch()
+            rows = [message for items in batch.values() for _, message in items]
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            try:
+                with self.pool.connection() as conn:
+                    conn.executemany('''
+                        INSERT INTO conversation_history
+                        (session_id, role, content, function_call, function_response, timestamp, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    if self._after_flush is not None:
+                        self._after_flush(conn, {sid: len(items) for sid, items in batch.items()})
+            except Exception as e:
+                self.failed_flushes += 1
+                self._restore(batch)
+                logger.error("[History] Ghi batch %d message thất bại, sẽ thử lại: %s", len(rows), e)
+                return 0
+            self.flush_latency.observe(time.perf_counter() - started)
+            self.batch_size.observe(len(rows))
+            self.flushed_messages += len(rows)
+            return len(rows)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("[History] Lỗi thread write-behind: %s", e)
+
+    def close(self):
+        """Dừng thread nền và ghi nốt phần còn lại (gọi khi tắt ứng dụng)."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=Config.CONNECTION_TIMEOUT)
+            self._thread = None
+        self.flush()
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            pending = self._pending_count
+            sessions = len(self._pending)
+            oldest = self._oldest_pending
+        return {
+            'pending_messages': pending,
+            'pending_sessions': sessions,
+            'oldest_pending_age_ms': round((time.monotonic() - oldest) * 1000, 2) if oldest else 0.0,
+            'flushed_messages': self.flushed_messages,
+            'failed_flushes': self.failed_flushes,
+            'flush_interval': self.flush_interval,
+            'max_batch': self.max_batch,
+            'flush_latency_seconds': self.flush_latency.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+        }
+
+
+_buffers: Dict[str, HistoryWriteBuffer] = {}
+_buffers_lock = threading.Lock()
+
+def get_history_buffer(db_path: Optional[str] = None, pool: SQLitePool = None) -> HistoryWriteBuffer:
+    """Bộ đệm write-behind dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    buffer = _buffers.get(key)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(key)
+            if buffer is None:
+                buffer = _buffers[key] = HistoryWriteBuffer(pool or get_pool(key))
+    return buffer
+
+def get_history_buffers() -> Dict[str, HistoryWriteBuffer]:
+    return dict(_buffers)
+
+def close_history_buffers():
+    """Flush và dừng mọi bộ đệm; phải chạy trước close_all_pools()."""
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+        _buffers.clear()
+    for buffer in buffers:
+        try:
+            buffer.close()
+        except Exception as e:
+            logger.error("[History] Không flush được bộ đệm khi tắt: %s", e)
+
+atexit.register(close_history_buffers)
@@ -0,0 +1,212 @@
+import bisect
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from core.config import Config
+from core.logger import get_logger
+from utils.timezone_utils import VIETNAM_TZ
+
+logger = get_logger(__name__)
+
+
+def to_epoch(value: Any) -> Optional[float]:
+    """Chuỗi ISO, datetime hoặc epoch -> epoch (giây); thời gian không có múi giờ được hiểu là giờ Việt Nam."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None or value.tzinfo.utcoffset(value) is None:
+        value = value.replace(tzinfo=VIETNAM_TZ)
+    return value.timestamp()
+
+
+class _Snapshot(NamedTuple):
+    """Các mảng đã sắp xếp của một phiên bản dữ liệu; thay nguyên khối khi nạp lại nên đọc không cần khóa."""
+    starts: List[float]  # lịch theo start tăng dần
+    ends: List[float]
+    max_ends: List[float]  # max(ends[0..i]) để trả lời "có lịch nào bắt đầu trước t mà chưa kết thúc"
+    rows: List[Dict[str, Any]]  # id, title, start_time, end_time (chuỗi gốc trong DB)
+    busy_starts: List[float]  # hợp các khoảng bận (rời nhau, tăng dần)
+    busy_ends: List[float]
+
+
+_EMPTY = _Snapshot([], [], [], [], [], [])
+
+
+class ScheduleIntervalIndex:
+    """
+    Chỉ mục khoảng thời gian của các lịch chưa xóa trong một file DB, dùng chung trong process.
+    Mỗi truy vấn đọc PRAGMA data_version trên kết nối riêng của chỉ mục: số này đổi khi có
+    connection khác (ExecuteSchedule, đồng bộ Google, process khác) commit, khi đó bảng
+    schedules được nạp lại một lần. Truy vấn trùng lịch / danh sách xung đột / khoảng trống
+    kế tiếp là tìm nhị phân trên mảng epoch đã sắp xếp.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._version: Optional[int] = None
+        self._snapshot = _EMPTY
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.queries = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=Config.CONNECTION_TIMEOUT, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(Config.CONNECTION_TIMEOUT * 1000)}")
+        return conn
+
+    def snapshot(self) -> _Snapshot:
+        """Dữ liệu hiện tại; nạp lại nếu DB đã đổi kể từ lần đọc trước."""
+        with self._lock:
+            self.queries += 1
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+                if version != self._version:
+                    self._snapshot = self._load(self._conn)
+                    self._version = version
+            except sqlite3.Error as e:
+                # Giữ snapshot tốt gần nhất (coi là trống sẽ gợi ý trùng lịch);
+                # _version không đổi nên lần gọi sau thử nạp lại
+                logger.warning("[ScheduleIndex] Không đọc được bảng schedules, dùng dữ liệu cũ: %s", e)
+            return self._snapshot
+
+    def _load(self, conn: sqlite3.Connection) -> _Snapshot:
+        try:
+            fetched = conn.execute('''
+                SELECT id, title, start_time, end_time FROM schedules
+                WHERE COALESCE(deleted, 0) = 0
+            ''').fetchall()
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            # Bảng chưa được tạo
+            fetched = []
+        self.loads += 1
+        items = []
+        for schedule_id, title, start_time, end_time in fetched:
+            start, end = to_epoch(start_time), to_epoch(end_time)
+            if start is None or end is None:
+                continue
+            items.append((start, end, {'id': schedule_id, 'title': title,
+                                       'start_time': start_time, 'end_time': end_time}))
+        items.sort(key=lambda item: (item[0], item[1]))
+
+        starts = [item[0] for item in items]
+        ends = [item[1] for item in items]
+        max_ends, busy_starts, busy_ends = [], [], []
+        running = float('-inf')
+        for start, end in zip(starts, ends):
+            running = max(running, end)
+            max_ends.append(running)
+            if end <= start:
+                continue
+            if busy_ends and start <= busy_ends[-1]:
+                busy_ends[-1] = max(busy_ends[-1], end)
+            else:
+                busy_starts.append(start)
+                busy_ends.append(end)
+        return _Snapshot(starts, ends, max_ends, [item[2] for item in items], busy_starts, busy_ends)
+
+    def is_free(self, start: Any, end: Any) -> bool:
+        """True nếu [start, end) không trùng lịch nào (cùng điều kiện với check_schedule_overlap)."""
+        snap = self.snapshot()
+        start, end = to_epoch(start), to_epoch(end)
+        k = bisect.bisect_left(snap.starts, end)
+        return k == 0 or snap.max_ends[k - 1] <= start
+
+    def conflicts(self, start: Any, end: Any) -> List[Dict[str, Any]]:
+        """Các lịch trùng với [start, end), theo giờ bắt đầu."""
+        snap = self.snapshot()
+        start, end = to_epoch(start), to_epoch(end)
+        found = []
+        i = bisect.bisect_left(snap.starts, end) - 1
+        # Đi lùi tới khi không còn lịch nào bắt đầu sớm hơn mà kết thúc sau start
+        while i >= 0 and snap.max_ends[i] > start:
+            if snap.ends[i] > start:
+                found.append(snap.rows[i])
+            i -= 1
+        found.reverse()
+        return found
+
+    def starting_between(self, start: Any, end: Any) -> List[Dict[str, Any]]:
+        """Các lịch có giờ bắt đầu trong [start, end), theo giờ bắt đầu."""
+        snap = self.snapshot()
+        lo = bisect.bisect_left(snap.starts, to_epoch(start))
+        hi = bisect.bisect_left(snap.starts, to_epoch(end))
+        return snap.rows[lo:hi]
+
+    def busy_between(self, start: Any, end: Any) -> List[Tuple[float, float]]:
+        """Các khối bận (đã gộp, rời nhau) cắt theo [start, end), dạng cặp epoch tăng dần."""
+        snap = self.snapshot()
+        start, end = to_epoch(start), to_epoch(end)
+        blocks = []
+        i = bisect.bisect_right(snap.busy_ends, start)
+        while i < len(snap.busy_starts) and snap.busy_starts[i] < end:
+            blocks.append((max(snap.busy_starts[i], start), min(snap.busy_ends[i], end)))
+            i += 1
+        return blocks
+
+    def next_gap(self, start: Any, duration_minutes: int, until: Any = None) -> Optional[float]:
+        """Epoch sớm nhất t >= start sao cho [t, t + duration) trống (và kết thúc trước until nếu có)."""
+        snap = self.snapshot()
+        t = to_epoch(start)
+        limit = to_epoch(until) if until is not None else None
+        length = duration_minutes * 60
+        i = bisect.bisect_right(snap.busy_ends, t)
+        while i < len(snap.busy_starts) and snap.busy_starts[i] < t + length:
+            t = max(t, snap.busy_ends[i])
+            i += 1
+        if limit is not None and t + length > limit:
+            return None
+        return t
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snap = self._snapshot
+            return {
+                'schedules': len(snap.starts),
+                'busy_blocks': len(snap.busy_starts),
+                'data_version': self._version,
+                'loads': self.loads,
+                'queries': self.queries
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._version = None
+
+
+_indexes: Dict[str, ScheduleIntervalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_schedule_index(db_path: Optional[str] = None) -> ScheduleIntervalIndex:
+    """Chỉ mục lịch dùng chung trong process cho mỗi file DB."""
+    key = os.path.abspath(db_path or Config.DATABASE_PATH)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = ScheduleIntervalIndex(key)
+    return index
+
+def close_schedule_indexes():
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+        _indexes.clear()
+    for index in indexes:
+        index.close()
@@ -0,0 +1,216 @@
+import copy
+import json
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from core.config import Config
+from core.services.connection_pool import SQLitePool, db_key, get_pool
+from core.services.conversation_summary import NAME_PATTERNS
+from utils.clock import get_clock
+
+PROFILE_HEADER = "👤 HỒ SƠ NGƯỜI DÙNG:"
+
+_EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_SCHEDULE_FUNCTIONS = ('smart_add_schedule', 'update_schedule')
+_MAX_DURATION_MINUTES = 24 * 60
+
+
+def _empty_profile() -> Dict[str, Any]:
+    return {'name': None, 'email': None, 'start_hours': {}, 'durations': {}}
+
+
+def apply_message(profile: Dict[str, Any], role: str, content: str, function_call: Optional[str]) -> bool:
+    """Cập nhật hồ sơ từ một message (function_call là JSON). Trả về True nếu hồ sơ thay đổi."""
+    before = json.dumps(profile, sort_keys=True)
+    if role == 'user':
+        for pattern in NAME_PATTERNS:
+            match = pattern.search(content)
+            if match:
+                profile['name'] = match.group(1)
+                break
+        match = _EMAIL_PATTERN.search(content)
+        if match:
+            profile['email'] = match.group(0)
+    elif function_call:
+        try:
+            call = json.loads(function_call)
+        except ValueError:
+            call = None
+        if isinstance(call, dict):
+            args = call.get('args') or {}
+            if call.get('name') == 'setup_notification_email' and args.get('email'):
+                profile['email'] = str(args['email'])
+            elif call.get('name') in _SCHEDULE_FUNCTIONS:
+                _count_schedule(profile, args.get('start_time'), args.get('end_time'))
+    return json.dumps(profile, sort_keys=True) != before
+
+
+def _count_schedule(profile: Dict[str, Any], start_time: Any, end_time: Any):
+    """Đếm giờ bắt đầu và thời lượng (phút) của lịch vừa được tạo/đổi."""
+    try:
+        start = datetime.fromisoformat(str(start_time))
+    except ValueError:
+        return
+    hour = str(start.hour)
+    profile['start_hours'][hour] = profile['start_hours'].get(hour, 0) + 1
+    try:
+        minutes = int((datetime.fromisoformat(str(end_time)) - start).total_seconds() // 60)
+    except (ValueError, TypeError):
+        return
+    if 0 < minutes <= _MAX_DURATION_MINUTES:
+        key = str(minutes)
+        profile['durations'][key] = profile['durations'].get(key, 0) + 1
+
+
+def summarize_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Dạng gọn để hiển thị: tên, email, các giờ hay đặt lịch và thời lượng thường dùng (nhiều nhất trước)."""
+    top = Config.PROFILE_TOP_ITEMS
+    return {
+        'name': profile['name'],
+        'email': profile['email'],
+        'preferred_times': [f"{int(h):02d}:00" for h, _ in Counter(profile['start_hours']).most_common(top)],
+        'typical_durations': [int(m) for m, _ in Counter(profile['durations']).most_common(top)],
+    }
+
+
+class UserProfileStore:
+    """
+    Hồ sơ người dùng theo session (tên, email nhận thông báo, giờ hay đặt lịch, thời lượng thường dùng),
+    cập nhật dần mỗi khi có message mới thay vì quét lại lịch sử. Đọc qua cache LRU trong bộ nhớ;
+    session chưa có hồ sơ (DB cũ) được dựng một lần từ lịch sử đang lưu.
+    """
+
+    def __init__(self, pool: SQLitePool, max_sessions: int = None):
+        self.pool = pool
+        self.max_sessions = max_sessions or Config.CONTEXT_CACHE_SESSIONS
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._create_table()
+
+    def _create_table(self):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    session_id TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,  -- JSON: name, email, start_hours, durations
+                    updated_at TEXT NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def _cached(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            profile = self._cache.get(session_id)
+            if profile is not None:
+                self._cache.move_to_end(session_id)
+            return profile
+
+    def _remember(self, session_id: str, profile: Dict[str, Any]):
+        with self._lock:
+            self._cache[session_id] = profile
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_sessions:
+                self._cache.popitem(last=False)
+
+    def _load(self, session_id: str, conn: sqlite3.Connection) -> Dict[str, Any]:
+        profile = self._cached(session_id)
+        if profile is not None:
+            return profile
+        row = conn.execute('SELECT profile FROM user_profiles WHERE session_id = ?', (session_id,)).fetchone()
+        if row is not None:
+            profile = json.loads(row[0])
+        else:
+            profile = _empty_profile()
+            for message in conn.execute('''
+                SELECT role, content, function_call FROM conversation_history
+                WHERE session_id = ?
+                ORDER BY timestamp, id
+            ''', (session_id,)):
+                apply_message(profile, *message)
+            self._save(session_id, profile, conn)
+        self._remember(session_id, profile)
+        return profile
+
+    def _save(self, session_id: str, profile: Dict[str, Any], conn: sqlite3.Connection):
+        conn.execute('''
+            INSERT INTO user_profiles (session_id, profile, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET profile = excluded.profile, updated_at = excluded.updated_at
+        ''', (session_id, json.dumps(profile, ensure_ascii=False), get_clock().now().isoformat()))
+
+    def observe(self, session_id: str, role: str, content: str, function_call: Optional[str],
+                conn: sqlite3.Connection = None):
+        """
+        Cập nhật hồ sơ từ message sắp được lưu; chỉ ghi DB khi hồ sơ đổi.
+        conn: transaction đang chèn message (gọi trước INSERT để lần dựng từ lịch sử không đếm trùng).
+        """
+        if conn is None:
+            with self.pool.connection() as own:
+                return self.observe(session_id, role, content, function_call, own)
+        profile = self._load(session_id, conn)
+        with self._lock:
+            updated = copy.deepcopy(profile)
+            changed = apply_message(updated, role, content, function_call)
+        if changed:
+            self._save(session_id, updated, conn)
+            self._remember(session_id, updated)
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """Hồ sơ dạng gọn (summarize_profile) của session."""
+        profile = self._cached(session_id)
+        if profile is None:
+            with self.pool.connection() as conn:
+                profile = self._load(session_id, conn)
+        return summarize_profile(profile)
+
+    def render(self, session_id: str) -> str:
+        """Khối hồ sơ một dòng chèn vào đầu context; rỗng nếu chưa biết gì."""
+        profile = self.get(session_id)
+        parts = []
+        if profile['name']:
+            parts.append(f"Tên: {profile['name']}")
+        if profile['email']:
+            parts.append(f"Email nhận thông báo: {profile['email']}")
+        if profile['preferred_times']:
+            parts.append(f"Giờ hay đặt lịch: {', '.join(profile['preferred_times'])}")
+        if profile['typical_durations']:
+            parts.append(f"Thời lượng thường dùng: {', '.join(f'{m} phút' for m in profile['typical_durations'])}")
+        return f"{PROFILE_HEADER} " + " | ".join(parts) if parts else ""
+
+    def forget(self, session_id: str, conn: sqlite3.Connection):
+        """Xóa hồ sơ khi xóa session."""
+        conn.execute('DELETE FROM user_profiles WHERE session_id = ?', (session_id,))
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def invalidate(self, session_id: Optional[str] = None):
+        """Bỏ hồ sơ trong cache (None: mọi session) để đọc lại từ DB."""
+        with self._lock:
+            if session_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(session_id, None)
+
+
+_stores: Dict[str, UserProfileStore] = {}
+_stores_lock = threading.Lock()
+
+def get_profile_store(db_path: Optional[str] = None, pool: SQLitePool = None) -> UserProfileStore:
+    """Kho hồ sơ dùng chung trong process cho mỗi file DB."""
+    key = db_key(db_path)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = UserProfileStore(pool or get_pool(key))
+    return store
+
+def invalidate_profile_stores():
+    """Bỏ cache hồ sơ, dùng khi DB bị ghi trực tiếp ngoài ConversationService (vd: seed khi replay)."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.invalidate()
@@ -6,23 +6,43 @@ from starlette.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from fastapi import Request
 
-from core.routers import schedule_router
+from core.routers import schedule_router, admin_router
 from contextlib import asynccontextmanager
 import threading
 import time
 from core.notification import get_notification_manager
+from core.monitoring import ProfilerMiddleware, get_loop_monitor, close_usage_tracker
+from core.logger import setup_logging, shutdown_logging, get_logger, RequestContextMiddleware
 from core.config import Config
 from core.services.google_calendar_service import GoogleCalendarService
+from core.services.connection_pool import close_all_pools
+from core.services.history_buffer import close_history_buffers
+from core.services.conversation_summary import close_conversation_summarizers
+from core.services.conversation_service import ConversationService
+from core.services.conversation_retention import get_conversation_archiver, close_conversation_archivers
+from core.services.schedule_index import close_schedule_indexes
 from pyngrok import ngrok as _ngrok
 
+setup_logging()
+logger = get_logger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Startup: Theo dõi độ trễ event loop
+    loop_monitor = get_loop_monitor()
+    loop_monitor.start()
+
+    # Startup: Lưu trữ định kỳ các session không hoạt động quá HISTORY_RETENTION_DAYS
+    # (mặc định 0: không chạy; ConversationService tạo các bảng cần thiết)
+    ConversationService(db_path=Config.DATABASE_PATH)
+    get_conversation_archiver().start()
+
     # Startup: Khởi động hệ thống notification
     notification_manager = get_notification_manager()
     init_result = notification_manager.initialize()
     
     if init_result['success']:
-        print("Ứng dụng đã khởi động hoàn tất!")
+        logger.info("Ứng dụng đã khởi động hoàn tất!")
 
         if Config.AUTO_GOOGLE_SYNC:
             try:
@@ -40,26 +60,26 @@ async def lifespan(app: FastAPI):
                         tunnel = _ngrok.connect("http://127.0.0.1:8000", bind_tls=True)
                         public_base_url = tunnel.public_url
                         app.state._ngrok_tunnel = tunnel
-                        print(f"[Dev] ngrok started at: {public_base_url}")
+                        logger.info("[Dev] ngrok started at: %s", public_base_url)
                     except Exception as ngrok_err:
-                        print(f"[Dev] Không thể khởi động ngrok: {ngrok_err}")
+                        logger.warning("[Dev] Không thể khởi động ngrok: %s", ngrok_err)
 
                 def _deferred_start_watch_and_sync(url: str):
                     time.sleep(2)
                     try:
                         cb = url.rstrip('/') + "/schedules/google/webhook"
                         info = svc.start_watch(cb)
-                        print(f"[Google] Watch started")
+                        logger.info("[Google] Watch started")
                     except Exception as e:
-                        print(f"[Google] Watch error: {e}")
+                        logger.error("[Google] Watch error: %s", e)
                     try:
                         backfill = svc.backfill_upcoming_days(days=30)
-                        print(f"[Google] Backfilled {backfill.get('backfilled', 0)} events")
+                        logger.info("[Google] Backfilled %s events", backfill.get('backfilled', 0))
                         sync_info = svc.sync_from_google()
                         if sync_info.get('synced', 0) > 0:
-                            print(f"[Google] Initial sync: {sync_info['synced']} changes")
+                            logger.info("[Google] Initial sync: %s changes", sync_info['synced'])
                     except Exception as e:
-                        print(f"[Google] Initial sync error: {e}")
+                        logger.error("[Google] Initial sync error: %s", e)
 
                     def _periodic_sync():
                         while True:
@@ -67,31 +87,39 @@ async def lifespan(app: FastAPI):
                                 time.sleep(Config.PERIODIC_SYNC_INTERVAL)
                                 res = svc.sync_from_google()
                                 if res.get('synced', 0) > 0:
-                                    print(f"[Google] Periodic: {res['synced']} changes")
+                                    logger.info("[Google] Periodic: %s changes", res['synced'])
                             except Exception as err:
-                                print(f"[Google] Periodic error: {err}")
+                                logger.error("[Google] Periodic error: %s", err)
 
                     threading.Thread(target=_periodic_sync, daemon=True, name="GooglePeriodicSync").start()
 
                 if public_base_url:
                     threading.Thread(target=_deferred_start_watch_and_sync, args=(public_base_url,), daemon=True).start()
                 else:
-                    print("[Google] Bỏ qua watch vì thiếu PUBLIC_BASE_URL")
+                    logger.warning("[Google] Bỏ qua watch vì thiếu PUBLIC_BASE_URL")
             except Exception as e:
-                print(f"[Google] Lỗi khởi động đồng bộ 2 chiều: {e}")
+                logger.error("[Google] Lỗi khởi động đồng bộ 2 chiều: %s", e)
     else:
-        print(f"Lỗi khởi tạo notification: {init_result.get('message', 'Unknown error')}")
+        logger.error("Lỗi khởi tạo notification: %s", init_result.get('message', 'Unknown error'))
     
     yield
+    loop_monitor.stop()
+    close_usage_tracker()
     shutdown_result = notification_manager.shutdown()
     if shutdown_result['success']:
-        print("Ứng dụng đã tắt!")
+        logger.info("Ứng dụng đã tắt!")
     try:
         tunnel = getattr(app.state, '_ngrok_tunnel', None)
         if tunnel is not None and _ngrok is not None:
             _ngrok.disconnect(tunnel.public_url)
     except Exception:
         pass
+    close_history_buffers()
+    close_conversation_summarizers()
+    close_conversation_archivers()
+    close_schedule_indexes()
+    close_all_pools()
+    shutdown_logging()
     
 
 app = FastAPI(lifespan=lifespan)
@@ -104,12 +132,15 @@ app.add_middleware(
     allow_methods=["*"],    # Cho phép tất cả methods (GET, POST, etc.)
     allow_headers=["*"],    # Cho phép tất cả headers
 )
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(RequestContextMiddleware)
 
 # Templates (Mẫu giao diện)
 templates = Jinja2Templates(directory="templates")
 
 # Include API router
 app.include_router(schedule_router.router)
+app.include_router(admin_router.router)
 
 @app.get("/", response_class=HTMLResponse)
 def read_root(request: Request):
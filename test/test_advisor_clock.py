@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+from datetime import datetime
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_long_lived_advisor_follows_the_clock(tmp_path):
+    clock = FixedClock(datetime(2025, 3, 5, 10, 0, tzinfo=VIETNAM_TZ))
+    advisor = ScheduleAdvisor(db_path=str(tmp_path / 'schedule.db'), clock=clock)
+    assert advisor._extract_time('họp sáng mai') == datetime(2025, 3, 6, 8, 0, tzinfo=VIETNAM_TZ)
+
+    # Cùng advisor, hai ngày sau: "ngày mai" và "9h" tính theo ngày mới
+    clock.advance(days=2)
+    assert advisor._extract_time('họp sáng mai') == datetime(2025, 3, 8, 8, 0, tzinfo=VIETNAM_TZ)
+    assert advisor._extract_time('gọi khách lúc 9h') == datetime(2025, 3, 8, 9, 0, tzinfo=VIETNAM_TZ)
+    assert advisor.current_time == clock.now()
+    result = advisor.advise_schedule('họp team sáng mai', duration=30)
+    assert result['status'] == 'success' and result['suggested_time'].day == 8
+
+    # Không truyền clock: đọc đồng hồ toàn cục ở mỗi lần gọi
+    shared = ScheduleAdvisor(db_path=str(tmp_path / 'schedule.db'))
+    with use_clock(FixedClock(datetime(2025, 6, 1, 7, 0, tzinfo=VIETNAM_TZ))):
+        assert shared._extract_time('mai') == datetime(2025, 6, 2, 8, 0, tzinfo=VIETNAM_TZ)
+
+    # Advisor không giữ kết nối sqlite riêng: dùng được từ thread khác (dùng chung giữa các lượt)
+    errors = []
+    thread = threading.Thread(target=lambda: errors.append(advisor.advise_schedule('họp lúc 15h thứ 6', duration=60)['status']))
+    thread.start()
+    thread.join()
+    assert errors == ['success']
+    assert not hasattr(advisor, 'conn')
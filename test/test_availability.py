@@ -0,0 +1,95 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from core.services.availability import AvailabilityEngine, free_runs
+from core.services.free_slots import FreeSlotFinder
+from core.services.schedule_index import ScheduleIntervalIndex
+from utils.timezone_utils import VIETNAM_TZ
+
+DAY = datetime(2025, 3, 3, tzinfo=VIETNAM_TZ)  # thứ 2
+
+
+def _add(conn, start, minutes):
+    conn.execute('INSERT INTO schedules (title, start_time, end_time, created_at) VALUES (?, ?, ?, ?)',
+                 ('Lịch', start.isoformat(), (start + timedelta(minutes=minutes)).isoformat(), start.isoformat()))
+    conn.commit()
+
+
+def _setup(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    return db_path, sqlite3.connect(db_path)
+
+
+def test_free_runs():
+    starts, ends = free_runs(np.array([True, True, False, True, False, False, True]))
+    assert starts.tolist() == [0, 3, 6] and ends.tolist() == [2, 4, 7]
+
+
+def test_horizon_search_with_window(tmp_path):
+    db_path, conn = _setup(tmp_path)
+    # Buổi sáng cả tuần đầu kín từ 8:30, buổi chiều trống
+    for offset in range(7):
+        _add(conn, DAY + timedelta(days=offset, hours=8, minutes=30), 210)
+    _add(conn, DAY + timedelta(days=7, hours=8), 30)
+    engine = AvailabilityEngine(ScheduleIntervalIndex(db_path))
+
+    now = DAY + timedelta(hours=9, seconds=5)
+    assert engine.first_free(now, 90) == DAY + timedelta(hours=13)
+    # "90 phút trống đầu tiên trong hai tuần tới, chỉ buổi sáng"
+    assert engine.first_free(now, 90, horizon_days=14, window=(8, 12)) == DAY + timedelta(days=7, hours=8, minutes=30)
+    assert engine.first_free(now, 90, horizon_days=7, window=(8, 12)) is None
+    # Thời điểm đang giữa phút: bắt đầu từ phút kế tiếp
+    assert engine.first_free(DAY + timedelta(hours=13, seconds=1), 30) == DAY + timedelta(hours=13, minutes=1)
+    slots = engine.find_slots(now, 60, horizon_days=1, step_minutes=60, limit=None)
+    assert [s.hour for s in slots] == [13, 14, 15, 16]
+    weekdays = engine.find_slots(now, 60, horizon_days=7, window=(13, 14), limit=None, skip_weekends=True)
+    assert [s.day for s in weekdays] == [3, 4, 5, 6, 7]
+    assert engine.free_intervals(DAY.date()) == [(DAY + timedelta(hours=8), DAY + timedelta(hours=8, minutes=30)),
+                                                 (DAY + timedelta(hours=13), DAY + timedelta(hours=17))]
+
+    # Mảng ngày được cache; DB đổi thì dựng lại
+    misses = engine.get_stats()['misses']
+    engine.first_free(now, 90, horizon_days=14, window=(8, 12))
+    assert engine.get_stats()['misses'] == misses
+    _add(conn, DAY + timedelta(hours=13), 240)
+    assert engine.first_free(now, 90) == DAY + timedelta(days=1, hours=13)
+    assert engine.get_stats()['misses'] > misses
+    conn.close()
+
+
+def test_matches_sweep_finder(tmp_path):
+    db_path, conn = _setup(tmp_path)
+    rng = random.Random(11)
+    for _ in range(150):
+        _add(conn, DAY + timedelta(minutes=5 * rng.randrange(0, 30 * 288)), 5 * rng.randrange(1, 36))
+    index = ScheduleIntervalIndex(db_path)
+    engine = AvailabilityEngine(index)
+    finder = FreeSlotFinder(index, VIETNAM_TZ)
+    for duration, step in ((30, 15), (45, 5), (120, 60)):
+        expected = [s for s, _ in finder.slots(DAY, DAY + timedelta(days=30), duration, step_minutes=step)]
+        assert engine.find_slots(DAY, duration, horizon_days=30, step_minutes=step, limit=None) == expected
+        assert engine.find_slots(DAY, duration, horizon_days=30, step_minutes=step, limit=7) == expected[:7]
+    conn.close()
+
+
+def test_advisor_next_slot_skips_weekend(tmp_path):
+    db_path, conn = _setup(tmp_path)
+    friday = DAY + timedelta(days=4)
+    _add(conn, friday + timedelta(hours=8), 9 * 60)  # thứ 6 kín cả ngày
+    advisor = ScheduleAdvisor(db_path=db_path)
+    now = friday + timedelta(hours=7)
+    assert advisor._find_next_available_slot(friday + timedelta(hours=10), 60, 'Trung bình', now) == \
+        DAY + timedelta(days=7, hours=8)
+    # Ưu tiên cao chỉ tìm trong 2 ngày (thứ 6, thứ 7)
+    with pytest.raises(Exception, match='2 ngày'):
+        advisor._find_next_available_slot(friday + timedelta(hours=10), 60, 'Cao', now)
+    conn.close()
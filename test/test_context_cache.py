@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.context_cache import RenderedContextCache
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_context_ring_matches_database_across_agents(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    first = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+    second = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+    assert first._context_cache is second._context_cache
+
+    def from_db(n):
+        fresh = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+        fresh._context_cache = RenderedContextCache(capacity=fresh._context_cache.capacity)
+        return fresh.get_recent_context('s1', n)
+
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        first.add_user_message('xin chào tôi tên là Long', 's1')
+        clock.advance(seconds=1)
+        assert first.get_recent_context('s1', 12) == (
+            "💭 LỊCH SỬ CUỘC TRÒ CHUYỆN GẦN ĐÂY:\n\n"
+            "👤 Người dùng: xin chào tôi tên là Long\n\n"
+            "🎯 HÃY SỬ DỤNG THÔNG TIN TRÊN để hiểu bối cảnh và trả lời phù hợp.\n---"
+        )
+        for i in range(15):
+            second.add_assistant_message(f'đã thêm {i}', function_call={
+                'name': 'smart_add_schedule', 'args': {'title': f'Họp {i}', 'start_time': '2025-03-04T10:00'}
+            }, session_id='s1')
+            clock.advance(seconds=1)
+            first.add_user_message(f'tiếp {i}', 's1')
+            clock.advance(seconds=1)
+            # Agent thứ nhất thấy ngay message do agent thứ hai thêm, khớp với dữ liệu trong DB
+            assert first.get_recent_context('s1', 12) == from_db(12)
+            assert second.get_recent_context('s1', 3) == from_db(3)
+
+    assert first._context_cache.hits > 0
+    assert first.clear_session('s1') == 31
+    assert second.get_recent_context('s1', 12) == ""
+    pool.close()
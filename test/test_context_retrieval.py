@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.context_retrieval import ContextRetriever, RELEVANT_HEADER
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_relevant_old_messages_are_retrieved_incrementally(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=200, pool=pool, write_behind=False)
+    svc._retriever = ContextRetriever()
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('Chào bạn, tôi tên là Minh', 's1')
+        svc.add_user_message('Tôi có buổi họp team định kỳ vào thứ 3 hàng tuần lúc 9h sáng', 's1')
+        for i in range(20):
+            clock.advance(seconds=1)
+            svc.add_user_message(f'tin nhắn bình thường số {i} về công việc', 's1')
+
+        # Nạp chỉ mục từ DB ở lần truy vấn đầu; chỉ lấy message ngoài cửa sổ gần đây
+        context = svc.get_relevant_context('s1', 'Họp team tuần này lúc mấy giờ?', exclude_last=12)
+        assert context.startswith(RELEVANT_HEADER)
+        assert 'họp team định kỳ' in context and 'tên là Minh' not in context
+        assert svc.get_relevant_context('s1', 'thời tiết Đà Lạt', exclude_last=12) == ''
+        assert svc._retriever.get_stats()['loads'] == 1
+
+        # Message mới được thêm thẳng vào chỉ mục, không nạp lại
+        svc.add_user_message('Tuần sau tôi đi công tác Đà Nẵng', 's1')
+        assert 'Đà Nẵng' in svc.get_relevant_context('s1', 'tôi đi công tác ở đâu', exclude_last=0)
+        assert svc._retriever.get_stats() == {'sessions': 1, 'messages': 23, 'dim': svc._retriever.dim,
+                                              'queries': 3, 'loads': 1}
+
+        svc.clear_session('s1')
+        assert svc.get_relevant_context('s1', 'họp team', exclude_last=0) == ''
+    pool.close()
@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import functools
+import gzip
+import json
+import sqlite3
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_retention import ConversationArchiver
+from core.services.conversation_service import ConversationService, forget_session_state
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def _hot_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT session_id, COUNT(*) FROM conversation_history GROUP BY session_id').fetchall()
+    finally:
+        conn.close()
+
+
+def _profile_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT session_id FROM user_profiles ORDER BY session_id')]
+    finally:
+        conn.close()
+
+
+def test_inactive_sessions_are_archived_and_restored(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=100, pool=pool, write_behind=False)
+    svc._archiver = ConversationArchiver(pool, directory=str(tmp_path / 'archive'), ttl_days=30, batch_size=4)
+    svc._archiver.add_after_change(functools.partial(forget_session_state, db_path, pool=pool))
+    clock = FixedClock(datetime(2025, 1, 1, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('email của tôi là an@example.com', 'old-1')
+        for i in range(10):
+            svc.add_user_message(f'cũ {i}', 'old-1')
+            svc.add_assistant_message(f'đáp {i}', function_call={'name': 'smart_add_schedule', 'args': {}},
+                                      session_id='old-1')
+            svc.add_user_message(f'cũ {i}', 'old-2')
+            clock.advance(minutes=1)
+        before = svc.get_conversation_history('old-1')
+        stats_before = svc.get_session_stats('old-1')
+        assert 'cũ 9' in svc.get_recent_context('old-1', 12)
+
+        clock.advance(days=20)
+        svc.add_user_message('vẫn dùng', 'active')
+        clock.advance(days=15)
+        assert svc._archiver.archive_inactive() == {'sessions': 2, 'messages': 31}
+
+        assert _hot_rows(db_path) == [('active', 1)]
+        # Hồ sơ (có email) đi cùng lịch sử vào file lưu trữ
+        assert 'old-1' not in _profile_rows(db_path)
+        assert svc.get_profile('old-1')['email'] is None
+        assert svc.get_session_stats('old-1')['total_messages'] == 0
+        assert svc.get_recent_context('old-1', 12) == ''
+        [archive] = os.listdir(tmp_path / 'archive')
+        assert archive == 'conversations-2025-02-05.jsonl.gz'
+        with gzip.open(tmp_path / 'archive' / archive, 'rt', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if '"type":"message"' in line]
+        assert len(records) == 31 and {r['session_id'] for r in records} == {'old-1', 'old-2'}
+
+        # Khôi phục đọc đúng gzip member của session, giữ nguyên id và thứ tự
+        assert svc.restore_session('old-1') == 21
+        assert svc.restore_session('old-1') == 0
+        assert svc.get_conversation_history('old-1') == before
+        assert 'old-1' in _profile_rows(db_path)
+        assert svc.get_profile('old-1')['email'] == 'an@example.com'
+        assert svc.get_session_stats('old-1') == stats_before
+        assert 'cũ 9' in svc.get_recent_context('old-1', 12)
+        assert svc.search_conversations('đáp 3', 'old-1')[0]['content'] == 'đáp 3'
+        assert svc._archiver.get_stats()['archived_now'] == {'sessions': 1, 'messages': 10}
+    pool.close()
+
+
+def test_shared_archiver_registers_one_callback(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    services = [ConversationService(db_path=db_path, write_behind=False) for _ in range(50)]
+    archiver = services[0]._archiver
+    archiver.directory = str(tmp_path / 'archive')
+    # Mỗi request tạo service mới: archiver dùng chung không được giữ tham chiếu tới từng service
+    assert len(archiver._after_change) == 1
+
+    svc = services[-1]
+    svc.add_user_message('xin chào', 's1')
+    assert svc._counts.get('s1') == 1 and svc.get_recent_context('s1', 5)
+    archiver.archive_session('s1')
+    # Callback dùng chung bỏ bộ đếm và ring context của session cho mọi service trên DB này
+    assert 's1' not in services[0]._counts
+    assert svc.get_recent_context('s1', 5) == ''
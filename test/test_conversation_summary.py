@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_facts_survive_trimming_in_summary(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=20, pool=pool, write_behind=False)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('xin chào tôi tên là Long, tôi thích chạy bộ buổi sáng', 's1')
+        clock.advance(seconds=1)
+        svc.add_assistant_message('Đã thêm lịch', function_call={
+            'name': 'smart_add_schedule', 'args': {'title': 'Họp team', 'start_time': '2025-03-06T10:00:00+07:00'}
+        }, session_id='s1')
+        for i in range(30):
+            clock.advance(seconds=1)
+            svc.add_user_message(f'câu hỏi {i}', 's1')
+
+    # Tin nhắn giới thiệu tên đã bị cắt khỏi DB nhưng vẫn còn trong bản tóm tắt
+    assert 'Long' not in svc.get_recent_context('s1', 12)
+    assert all(m['content'].startswith('câu hỏi') for m in svc.get_conversation_history('s1'))
+    summary = svc.get_summary_context('s1')
+    assert '- Tên người dùng: Long' in summary
+    assert 'chạy bộ buổi sáng' in summary
+    assert 'Họp team (2025-03-06T10:00:00+07:00)' in summary
+
+    # Không gộp lại message đã gộp, chỉ phần mới trượt khỏi cửa sổ
+    summarizer = svc._summarizer
+    summarizer.compact('s1')
+    assert summarizer.compact('s1') == 0
+    assert summarizer.get_summary('s1')['folded_messages'] == 32 - 12
+
+    svc.clear_session('s1')
+    assert svc.get_summary_context('s1') == ""
+    summarizer.close()
+    pool.close()
@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from core.services.ephemeral_sessions import (EphemeralConversationService, get_ephemeral_store,
+                                              is_ephemeral_session)
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_ephemeral_sessions_stay_in_memory_and_promote(tmp_path, monkeypatch):
+    assert is_ephemeral_session('guest-42') and not is_ephemeral_session('default')
+    store = get_ephemeral_store()
+    monkeypatch.setattr(store, 'max_sessions', 2)
+    svc = EphemeralConversationService()
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('Chào bạn, tên tôi là Lan', 'guest-a')
+        clock.advance(seconds=1)
+        svc.add_assistant_message('Chào Lan!', session_id='guest-a')
+        clock.advance(seconds=1)
+        svc.add_user_message('họp nhóm lúc 9 giờ', 'guest-b')
+
+        # Cùng API với ConversationService
+        assert [m['content'] for m in svc.get_conversation_history('guest-a')] == ['Chào bạn, tên tôi là Lan', 'Chào Lan!']
+        assert svc.get_session_stats('guest-a')['total_messages'] == 2
+        assert svc.search_conversations('họp', 'guest-b')
+        assert svc.get_profile('guest-a')['name'] == 'Lan'
+        assert not os.path.exists(':memory:') and not os.path.exists(':ephemeral:')
+
+        # Vượt giới hạn: session ít hoạt động nhất bị bỏ
+        clock.advance(seconds=1)
+        svc.add_user_message('còn đó không?', 'guest-a')
+        clock.advance(seconds=1)
+        svc.add_user_message('xin chào', 'guest-c')
+        assert 'guest-a' in store and 'guest-b' not in store
+        assert svc.get_conversation_history('guest-b') == []
+
+        db_path = str(tmp_path / 'schedule.db')
+        target = ConversationService(db_path=db_path, pool=SQLitePool(db_path), write_behind=False)
+        target.add_user_message('tin nhắn cũ', 'user-1')
+        try:
+            svc.promote_session('guest-a', target)
+            assert False, 'session đích trùng tiền tố tạm phải bị từ chối'
+        except ValueError:
+            pass
+        assert svc.promote_session('guest-a', target, 'user-2') == 3
+        assert svc.promote_session('guest-c', target, 'user-1') == 1
+
+    assert [m['content'] for m in target.get_conversation_history('user-2')] == [
+        'Chào bạn, tên tôi là Lan', 'Chào Lan!', 'còn đó không?']
+    assert target.get_profile('user-2')['name'] == 'Lan'
+    assert target.get_session_stats('user-1')['total_messages'] == 2
+    assert svc.get_conversation_history('guest-a') == [] and 'guest-a' not in store
+    assert store.get_stats()['promotions'] == 2
+    svc.clear_session('guest-c')
+
+
+def test_ephemeral_service_has_no_archiver_and_explicit_keys():
+    from core.services.connection_pool import db_key
+    from core.services.context_cache import get_context_cache
+    from core.services.conversation_retention import get_conversation_archivers
+    from core.services.ephemeral_sessions import EPHEMERAL_DB_KEY
+    from core.services.user_profile import get_profile_store
+
+    svc = EphemeralConversationService()
+    assert db_key(EPHEMERAL_DB_KEY) == EPHEMERAL_DB_KEY
+    assert svc._archiver is None and svc.restore_session('guest-x') == 0
+    assert not any(EPHEMERAL_DB_KEY in key for key in get_conversation_archivers())
+    # Singleton theo khóa cố định, không theo đường dẫn <cwd>/:ephemeral:
+    assert svc._context_cache is get_context_cache(EPHEMERAL_DB_KEY)
+    assert svc._profiles is get_profile_store(EPHEMERAL_DB_KEY, svc._pool)
+    assert svc._profiles.pool is svc._pool
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from core.services.free_slots import FreeSlotFinder, free_gaps, merge_intervals
+from core.services.schedule_index import ScheduleIntervalIndex
+from utils.timezone_utils import VIETNAM_TZ
+
+DAY = datetime(2025, 3, 5, tzinfo=VIETNAM_TZ)  # thứ 4
+
+
+def _add(conn, start, minutes):
+    conn.execute('INSERT INTO schedules (title, start_time, end_time, created_at) VALUES (?, ?, ?, ?)',
+                 ('Lịch', start.isoformat(), (start + timedelta(minutes=minutes)).isoformat(), start.isoformat()))
+    conn.commit()
+
+
+def _setup(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    return db_path, sqlite3.connect(db_path)
+
+
+def test_sweep_helpers():
+    assert merge_intervals([(5, 7), (1, 3), (3, 4), (6, 9), (10, 10)]) == [(1, 4), (5, 9)]
+    assert free_gaps(0, 10, [(-2, 1), (3, 4), (9, 12)]) == [(1, 3), (4, 9)]
+    assert free_gaps(0, 10, []) == [(0, 10)]
+
+
+def test_slots_avoid_busy_and_lunch(tmp_path):
+    db_path, conn = _setup(tmp_path)
+    _add(conn, DAY.replace(hour=9), 90)      # 09:00-10:30
+    _add(conn, DAY.replace(hour=15), 120)    # 15:00-17:00
+    advisor = ScheduleAdvisor(db_path=db_path)
+
+    slots = advisor.find_available_slots(DAY, 60, limit=None)
+    assert slots == ['08:00 - 09:00', '10:30 - 11:30', '10:45 - 11:45', '11:00 - 12:00',
+                     '13:00 - 14:00', '13:15 - 14:15', '13:30 - 14:30', '13:45 - 14:45', '14:00 - 15:00']
+    assert advisor.find_available_slots(DAY, 60, step_minutes=60, limit=None) == \
+        ['08:00 - 09:00', '11:00 - 12:00', '13:00 - 14:00', '14:00 - 15:00']
+    assert len(advisor.find_available_slots(DAY, 30)) == 10
+    # 0 là "không có ưu tiên" (giá trị mặc định từ function call): vẫn tìm trong giờ làm việc
+    assert advisor.find_available_slots(DAY, 60, preferred_start_hour=0, preferred_end_hour=0, limit=None) == slots
+    assert advisor.find_available_slots(DAY, 60, preferred_start_hour=13, limit=None) == slots[4:]
+
+    finder = advisor.free_slot_finder
+    gaps = finder.free_intervals(DAY, DAY + timedelta(days=1))
+    assert [(s.strftime('%H:%M'), e.strftime('%H:%M')) for s, e in gaps] == \
+        [('08:00', '09:00'), ('10:30', '12:00'), ('13:00', '15:00')]
+
+    # Nhiều ngày: ngày sau trống cả ngày, thứ 7/CN bị bỏ khi skip_weekends
+    multi = advisor.find_available_slots(DAY, 240, step_minutes=60, days=4, limit=None)
+    assert multi == [f'{d:02d}/03 {h}' for d in (6, 7, 8) for h in ('08:00 - 12:00', '13:00 - 17:00')]
+    weekdays = FreeSlotFinder(advisor.schedule_index, VIETNAM_TZ, skip_weekends=True)
+    assert [s.day for s, _ in weekdays.slots(DAY, DAY + timedelta(days=5), 240, step_minutes=60)] == [6, 6, 7, 7]
+    conn.close()
+
+
+def test_slots_match_stepping_search(tmp_path):
+    db_path, conn = _setup(tmp_path)
+    rng = random.Random(3)
+    for _ in range(60):
+        _add(conn, DAY + timedelta(minutes=5 * rng.randrange(8 * 12, 7 * 24 * 12)), 5 * rng.randrange(2, 30))
+    index = ScheduleIntervalIndex(db_path)
+    finder = FreeSlotFinder(index, VIETNAM_TZ, business_hours=(8, 17), lunch_time=(12, 13))
+
+    for duration, step in ((30, 15), (45, 5), (90, 30)):
+        expected = []
+        for offset in range(7):
+            day = DAY + timedelta(days=offset)
+            slot, close = day.replace(hour=8), day.replace(hour=17)
+            while slot + timedelta(minutes=duration) <= close:
+                end = slot + timedelta(minutes=duration)
+                if index.is_free(slot, end) and (end <= day.replace(hour=12) or slot >= day.replace(hour=13)):
+                    expected.append((slot, end))
+                slot += timedelta(minutes=step)
+        assert finder.slots(DAY, DAY + timedelta(days=7), duration, step_minutes=step) == expected
+    conn.close()
+    index.close()
@@ -0,0 +1,128 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from core.services.google_calendar_service import FreeBusyUnavailableError, GoogleCalendarService
+from core.services.group_availability import GroupAvailability, LocalFreeBusyService, merge_busy
+from core.services.schedule_index import to_epoch
+from utils.timezone_utils import VIETNAM_TZ
+
+DAY = datetime(2025, 3, 5, tzinfo=VIETNAM_TZ)
+
+
+def _local_calendar(tmp_path, name, events):
+    db_path = str(tmp_path / f'{name}.db')
+    ScheduleAdvisor(db_path=db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO schedules (title, start_time, end_time, created_at) VALUES (?, ?, ?, ?)',
+                     [('Lịch', s.isoformat(), e.isoformat(), s.isoformat()) for s, e in events])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _at(hour, minute=0, days=0):
+    return DAY + timedelta(days=days, hours=hour, minutes=minute)
+
+
+def test_merge_busy_k_way():
+    assert merge_busy([[(1, 3), (8, 9)], [(2, 5)], [], [(5, 6), (10, 10), (12, 14)]]) == [(1, 6), (8, 9), (12, 14)]
+
+
+def test_common_slots_across_local_and_google(tmp_path):
+    alice = _local_calendar(tmp_path, 'alice', [(_at(8), _at(9, 30))])
+    bob = _local_calendar(tmp_path, 'bob', [(_at(10), _at(11)), (_at(14), _at(15))])
+    calendars = {
+        'room-a@example.com': [(_at(9), _at(10)), (_at(15, 30), _at(17))],
+        'carol@example.com': [(_at(13), _at(14))],
+    }
+    # Đủ calendar để phải chia nhiều request (tối đa 50 calendar mỗi request)
+    calendars.update({f'free-{i}@example.com': [] for i in range(60)})
+    stand_in = LocalFreeBusyService(calendars)
+    group = GroupAvailability([alice, bob], list(calendars),
+                              calendar_service=GoogleCalendarService(db_path=str(tmp_path / 'google.db')),
+                              freebusy_service=stand_in)
+
+    busy = group.busy_by_calendar(DAY, DAY + timedelta(days=1))
+    assert stand_in.requests == 2
+    assert busy['room-a@example.com'] == [(to_epoch(_at(9)), to_epoch(_at(10))), (to_epoch(_at(15, 30)), to_epoch(_at(17)))]
+
+    free = group.free_intervals(DAY, DAY + timedelta(days=1))
+    assert [(s.strftime('%H:%M'), e.strftime('%H:%M')) for s, e in free] == [('11:00', '12:00'), ('15:00', '15:30')]
+    slots = group.free_slots(DAY, DAY + timedelta(days=1), 30, step_minutes=15)
+    assert [s.strftime('%H:%M') for s, _ in slots] == ['11:00', '11:15', '11:30', '15:00']
+    assert group.free_slots(DAY, DAY + timedelta(days=1), 90) == []
+
+
+class _FailingFreeBusy(LocalFreeBusyService):
+    def query(self, body):
+        if any(item['id'] == 'boom@example.com' for item in body['items']):
+            raise HttpError(httplib2.Response({'status': 403}), b'{"error": {"message": "forbidden"}}')
+        return super().query(body)
+
+
+def test_unavailable_calendar_is_not_treated_as_free(tmp_path):
+    calendar_service = GoogleCalendarService(db_path=str(tmp_path / 'google.db'))
+    calendars = {'carol@example.com': [(_at(13), _at(14))]}
+    group = GroupAvailability(google_calendar_ids=['carol@example.com', 'missing@example.com'],
+                              calendar_service=calendar_service, freebusy_service=LocalFreeBusyService(calendars))
+    with pytest.raises(FreeBusyUnavailableError) as exc:
+        group.free_slots(DAY, DAY + timedelta(days=1), 30)
+    assert exc.value.calendars == {'missing@example.com': 'notFound'}
+    assert list(exc.value.busy) == ['carol@example.com']
+
+    # Cả batch lỗi HTTP: mọi calendar trong batch đó đều không có dữ liệu
+    ids = [f'free-{i}@example.com' for i in range(49)] + ['boom@example.com', 'carol@example.com']
+    group = GroupAvailability(google_calendar_ids=ids, calendar_service=calendar_service,
+                              freebusy_service=_FailingFreeBusy(dict(calendars, **{i: [] for i in ids[:49]})))
+    with pytest.raises(FreeBusyUnavailableError) as exc:
+        group.busy_by_calendar(DAY, DAY + timedelta(days=1))
+    assert sorted(exc.value.calendars) == sorted(ids[:50])
+    assert set(exc.value.calendars.values()) == {'HTTP 403'}
+    assert list(exc.value.busy) == ['carol@example.com']
+
+
+def test_matches_pairwise_check(tmp_path):
+    rng = random.Random(4)
+    calendars = {}
+    for person in range(25):
+        events = []
+        for _ in range(rng.randrange(0, 6)):
+            start = _at(8, 5 * rng.randrange(0, 108), days=rng.randrange(3))
+            events.append((start.isoformat(), (start + timedelta(minutes=5 * rng.randrange(1, 12))).isoformat()))
+        calendars[f'p{person}'] = events
+    group = GroupAvailability(google_calendar_ids=list(calendars),
+                              calendar_service=GoogleCalendarService(db_path=str(tmp_path / 'google.db')),
+                              freebusy_service=LocalFreeBusyService(calendars))
+    end = DAY + timedelta(days=3)
+    slots = group.free_slots(DAY, end, 30, step_minutes=5)
+
+    # Đối chiếu: mỗi điểm lưới trong giờ làm việc, kiểm tra từng người một
+    expected = []
+    for day in range(3):
+        slot = _at(8, days=day)
+        while slot + timedelta(minutes=30) <= _at(17, days=day):
+            slot_end = slot + timedelta(minutes=30)
+            outside_lunch = slot_end <= _at(12, days=day) or slot >= _at(13, days=day)
+            if outside_lunch and all(to_epoch(e) <= to_epoch(slot) or to_epoch(s) >= to_epoch(slot_end)
+                                     for events in calendars.values() for s, e in events):
+                expected.append((slot, slot_end))
+            slot += timedelta(minutes=5)
+    assert slots == expected
+
+
+def test_advisor_common_slots(tmp_path):
+    me = _local_calendar(tmp_path, 'me', [(_at(8), _at(12))])
+    other = _local_calendar(tmp_path, 'other', [(_at(13), _at(16))])
+    advisor = ScheduleAdvisor(db_path=me)
+    assert advisor.find_common_slots(DAY, 60, [other], step_minutes=30) == ['16:00 - 17:00']
+    assert advisor.find_common_slots(DAY, 60, [other], step_minutes=60, days=2, limit=2) == \
+        ['05/03 16:00 - 17:00', '06/03 08:00 - 09:00']
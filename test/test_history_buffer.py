@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from core.services.history_buffer import HistoryWriteBuffer
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+@pytest.fixture
+def service(tmp_path):
+    """ConversationService write-behind với bộ đệm riêng, thread nền không tự flush trong test."""
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=6, pool=pool)
+    svc._buffer = HistoryWriteBuffer(pool, flush_interval=3600, max_batch=10000)
+    svc._buffer.set_after_flush(svc._cleanup_sessions)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        yield svc, clock, db_path
+    svc._buffer.close()
+    pool.close()
+
+
+def _db_count(db_path, session_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM conversation_history WHERE session_id = ?',
+                            (session_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_pending_messages_are_readable_before_flush(service):
+    svc, clock, db_path = service
+    for i in range(4):
+        svc.add_user_message(f'câu hỏi {i}', 's1')
+        clock.advance(seconds=1)
+        svc.add_assistant_message(f'trả lời {i}', session_id='s1')
+        clock.advance(seconds=1)
+
+    assert _db_count(db_path, 's1') == 0
+    assert [m['content'] for m in svc.get_conversation_history('s1', 2)] == ['câu hỏi 0', 'trả lời 0']
+    assert 'trả lời 3' in svc.get_recent_context('s1', 3)
+    stats = svc.get_session_stats('s1')
+    assert (stats['total_messages'], stats['user_messages'], stats['assistant_messages']) == (8, 4, 4)
+    assert [r['content'] for r in svc.search_conversations('CÂU', 's1', 2)] == ['câu hỏi 3', 'câu hỏi 2']
+
+
+def test_flush_writes_one_batch_and_trims(service):
+    svc, clock, db_path = service
+    for i in range(8):
+        svc.add_user_message(f'tin {i}', 's1')
+        clock.advance(seconds=1)
+    svc.add_user_message('khác', 's2')
+
+    assert svc._buffer.flush() == 9
+    stats = svc._buffer.get_stats()
+    assert stats['pending_messages'] == 0
+    assert stats['batch_size']['count'] == 1 and stats['batch_size']['max'] == 9
+    assert stats['flush_latency_seconds']['count'] == 1
+
+    # Cắt theo max_history trong cùng transaction với batch
+    assert _db_count(db_path, 's1') == 6
+    assert [m['content'] for m in svc.get_conversation_history('s1')][0] == 'tin 2'
+
+    svc.add_user_message('chưa ghi', 's1')
+    assert svc.clear_session('s1') == 7
+    svc._buffer.close()
+    assert _db_count(db_path, 's1') == 0 and _db_count(db_path, 's2') == 1
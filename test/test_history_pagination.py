@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+import pytest
+
+from core.ai_agent import AIAgent
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+@pytest.fixture
+def service(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=1000, pool=pool, write_behind=False)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        for i in range(23):
+            svc.add_user_message(f'tin {i}', 's1')
+            # Từng cặp message trùng timestamp: cursor phải phân biệt bằng id
+            if i % 2:
+                clock.advance(seconds=1)
+        svc.add_user_message('khác', 's2')
+    yield svc
+    pool.close()
+
+
+def _contents(page):
+    return [m['content'] for m in page['messages']]
+
+
+def test_keyset_pages_in_both_directions(service):
+    seen, page = [], service.get_history_page('s1', limit=5)
+    assert page['prev_cursor'] is None
+    while True:
+        seen += _contents(page)
+        if page['next_cursor'] is None:
+            break
+        page = service.get_history_page('s1', limit=5, after=page['next_cursor'])
+    assert seen == [f'tin {i}' for i in range(23)]
+
+    seen, page = [], service.get_history_page('s1', limit=5, newest=True)
+    assert page['next_cursor'] is None and _contents(page) == [f'tin {i}' for i in range(18, 23)]
+    while True:
+        seen = _contents(page) + seen
+        if page['prev_cursor'] is None:
+            break
+        page = service.get_history_page('s1', limit=5, before=page['prev_cursor'])
+    assert seen == [f'tin {i}' for i in range(23)]
+
+    with pytest.raises(ValueError):
+        service.get_history_page('s1', after='không-phải-cursor')
+
+
+def test_streaming_export_matches_history(service):
+    messages = list(service.iter_conversation('s1', batch_size=4))
+    assert messages == service.get_conversation_history('s1')
+
+    agent = AIAgent.__new__(AIAgent)
+    agent.session_id = 's1'
+    agent.conversation_service = service
+    text = agent.export_conversation()
+    assert text.startswith('=== LỊCH SỬ CUỘC TRÒ CHUYỆN - SESSION: s1 ===\n\n[')
+    assert text.endswith('Người dùng:\ntin 22\n')
+    lines = list(agent.iter_export('ndjson'))
+    assert len(lines) == 23 and lines[0].startswith('{"id": 1, "role": "user", "content": "tin 0"')
+
+    agent.session_id = 'trống'
+    assert agent.export_conversation() == 'Chưa có lịch sử conversation nào.'
+    with pytest.raises(ValueError):
+        agent.iter_export('csv')
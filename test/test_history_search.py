@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_fts_search_folds_diacritics_ranks_and_paginates(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('Họp đội ngũ ở Đà Nẵng lúc 10h', 's1')
+        svc.add_user_message('Đi khám bác sĩ', 's1')
+        svc.add_user_message('họp họp họp', 's1')
+        svc.add_user_message('Họp với đối tác', 's2')
+
+    results = svc.search_conversations('HOP', 's1')
+    assert [r['content'] for r in results] == ['họp họp họp', 'Họp đội ngũ ở Đà Nẵng lúc 10h']
+    assert results[0]['score'] > results[1]['score']
+    assert svc.search_conversations('da nang', 's1')[0]['snippet'].startswith('Họp đội ngũ ở [Đà] [Nẵng]')
+    assert svc.search_conversations('kham BAC', 's1')[0]['content'] == 'Đi khám bác sĩ'
+
+    assert len(svc.search_conversations('họp', None)) == 3
+    assert [r['content'] for r in svc.search_conversations('họp', 's1', limit=1, offset=1)] == \
+        ['Họp đội ngũ ở Đà Nẵng lúc 10h']
+
+    # Xóa/cắt lịch sử cập nhật chỉ mục qua trigger
+    svc.clear_session('s1')
+    assert svc.search_conversations('họp', None)[0]['content'] == 'Họp với đối tác'
+    pool.close()
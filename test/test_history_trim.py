@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def test_trim_is_amortized_and_keeps_newest(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=10, pool=pool, write_behind=False)
+    assert svc.trim_high_water == 12
+
+    def count():
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM conversation_history WHERE session_id = ?',
+                                ('s1',)).fetchone()[0]
+        finally:
+            conn.close()
+
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        for i in range(12):
+            svc.add_user_message(f'tin {i}', 's1')
+            clock.advance(seconds=1)
+        assert count() == 12
+        svc.add_user_message('tin 12', 's1')
+    assert count() == 10
+    assert [m['content'] for m in svc.get_conversation_history('s1')][0] == 'tin 3'
+
+    # Service mới trong cùng process dùng chung bộ đếm, không COUNT lại
+    other = ConversationService(db_path=db_path, max_history=10, pool=pool, write_behind=False)
+    assert other._counts['s1'] == 10
+    assert svc.clear_session('s1') == 10 and other._counts['s1'] == 0
+    pool.close()
@@ -0,0 +1,157 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+from core.logger import (ContextFilter, DebugSamplingFilter, JsonFormatter, RequestContextMiddleware,
+                         StructuredQueueHandler, TextFormatter, get_request_id, get_session_id, log_context)
+
+
+def _pipeline(name, sample_every=1, formatter=None):
+    """Logger riêng đi qua queue handler + QueueListener như setup_logging, ghi JSON vào bộ nhớ."""
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(formatter or JsonFormatter())
+    log_queue = queue.Queue(-1)
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter(sample_every))
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+
+    def records():
+        listener.stop()
+        if formatter is not None:
+            return stream.getvalue()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+    return logger, records
+
+
+def test_json_fields():
+    logger, records = _pipeline('test.logger.json')
+    with log_context(request_id='req-1', session_id='s1'):
+        logger.info("Đã lưu lịch %s", 42, extra={'schedule_id': 42, 'skipped': None})
+    try:
+        raise ValueError('hỏng')
+    except ValueError:
+        logger.exception("Lỗi")
+
+    first, second = records()
+    assert set(first) == {'ts', 'level', 'logger', 'msg', 'thread', 'request_id', 'session_id', 'schedule_id'}
+    assert first['ts'].endswith('+00:00')
+    assert (first['level'], first['logger'], first['msg']) == ('INFO', 'test.logger.json', 'Đã lưu lịch 42')
+    assert first['thread'] == threading.current_thread().name
+    assert (first['request_id'], first['session_id'], first['schedule_id']) == ('req-1', 's1', 42)
+    # Ngoài log_context: không có request_id/session_id, có traceback
+    assert 'request_id' not in second and 'session_id' not in second
+    assert second['level'] == 'ERROR' and second['msg'] == 'Lỗi'
+    assert second['exc'].startswith('Traceback') and 'ValueError: hỏng' in second['exc']
+
+
+def test_text_format_keeps_traceback():
+    logger, output = _pipeline('test.logger.text', formatter=TextFormatter())
+    with log_context(request_id='req-2'):
+        try:
+            raise KeyError('x')
+        except KeyError:
+            logger.exception("Lỗi %s", 'y')
+    text = output()
+    assert 'ERROR test.logger.text [req=req-2 session=None] Lỗi y\nTraceback' in text
+    assert "KeyError: 'x'" in text
+
+
+def test_debug_sampling_per_message():
+    logger, records = _pipeline('test.logger.sampling', sample_every=3)
+    for i in range(7):
+        logger.debug("Không parse được thời gian: %s", i)
+        logger.debug("Cache miss %s", i)
+    logger.info("Luôn giữ")
+    logger.info("Luôn giữ")
+
+    by_msg = {}
+    for record in records():
+        by_msg.setdefault(record['msg'].split(':')[0].split(' ')[0], []).append(record)
+    # Mỗi template được lấy mẫu riêng: record thứ 0, 3, 6 của từng template
+    assert [r['msg'] for r in by_msg['Không']] == [f"Không parse được thời gian: {i}" for i in (0, 3, 6)]
+    assert [r['msg'] for r in by_msg['Cache']] == [f"Cache miss {i}" for i in (0, 3, 6)]
+    assert all(r['sample_rate'] == 3 for r in by_msg['Không'] + by_msg['Cache'])
+    # Mức trên DEBUG không bị lấy mẫu
+    assert len(by_msg['Luôn']) == 2 and all('sample_rate' not in r for r in by_msg['Luôn'])
+
+
+def test_log_context_propagation():
+    logger, records = _pipeline('test.logger.context')
+
+    async def handle(request_id, session_id):
+        with log_context(request_id=request_id, session_id=session_id):
+            await asyncio.sleep(0.01)
+            # Task con và thread của asyncio.to_thread kế thừa context của request
+            await asyncio.gather(asyncio.create_task(asyncio.sleep(0)),
+                                 asyncio.to_thread(logger.info, "to_thread %s", request_id))
+            logger.info("task %s", request_id)
+            with log_context(session_id='inner'):
+                assert (get_request_id(), get_session_id()) == (request_id, 'inner')
+            assert get_session_id() == session_id
+
+    async def main():
+        await asyncio.gather(handle('r1', 's1'), handle('r2', 's2'))
+
+    asyncio.run(main())
+    assert (get_request_id(), get_session_id()) == (None, None)
+    seen = {(r['msg'], r['request_id'], r['session_id']) for r in records()}
+    assert seen == {('to_thread r1', 'r1', 's1'), ('task r1', 'r1', 's1'),
+                    ('to_thread r2', 'r2', 's2'), ('task r2', 'r2', 's2')}
+
+
+def test_request_context_middleware():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append((get_request_id(), get_session_id()))
+
+    middleware = RequestContextMiddleware(app)
+    asyncio.run(middleware({'type': 'http', 'headers': [(b'x-request-id', b'abc')],
+                            'query_string': b'session_id=s9'}, None, None))
+    asyncio.run(middleware({'type': 'http', 'headers': [], 'query_string': b''}, None, None))
+    assert seen[0] == ('abc', 's9')
+    assert len(seen[1][0]) == 12 and seen[1][1] is None
+    assert (get_request_id(), get_session_id()) == (None, None)
+
+
+def test_user_input_only_logged_raw_at_debug(monkeypatch):
+    from core.ai_agent import AIAgent
+    from core.replay import get_turn_recorder
+
+    # Logger thật của module: trả lại cấu hình cũ sau test
+    target = logging.getLogger('core.ai_agent')
+    for attr in ('handlers', 'propagate', 'level'):
+        monkeypatch.setattr(target, attr, getattr(target, attr))
+    logger, records = _pipeline('core.ai_agent')
+    monkeypatch.setattr(get_turn_recorder(), 'enabled', False)
+    agent = AIAgent.__new__(AIAgent)
+    agent.session_id = 's1'
+
+    async def handle(user_input):
+        return 'ok'
+
+    agent._handle_user_input = handle
+    logger.setLevel(logging.INFO)
+    asyncio.run(agent.process_user_input('Họp với an@example.com lúc 9h'))
+    logger.setLevel(logging.DEBUG)
+    asyncio.run(agent.process_user_input('Họp với an@example.com lúc 9h'))
+
+    info, info_again, debug = records()
+    assert 'user_input' not in info and 'an@example.com' not in json.dumps(info, ensure_ascii=False)
+    assert info['input_chars'] == 29 and len(info['input_hash']) == 12
+    assert info_again['input_hash'] == info['input_hash'] and info['session_id'] == 's1'
+    assert debug['level'] == 'DEBUG' and debug['user_input'] == 'Họp với an@example.com lúc 9h'
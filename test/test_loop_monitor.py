@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import time
+
+from core.monitoring.loop_monitor import _APP_ROOT, EventLoopMonitor, LagHistogram
+
+# Hàm "của app" (tên file nằm trong core/) gọi lại một hàm chặn, để kiểm tra việc lọc frame
+_APP_FILE = os.path.join(_APP_ROOT, 'core', 'services', 'fake_blocking.py')
+_app_namespace = {}
+exec(compile('def busy_handler(block):\n    block()\n', _APP_FILE, 'exec'), _app_namespace)
+
+
+def test_lag_histogram_buckets():
+    histogram = LagHistogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.01, 0.05, 0.5, 2.0, -1.0):
+        histogram.observe(value)
+    snap = histogram.snapshot()
+    # Bucket tích lũy, giá trị bằng cận trên rơi vào bucket đó, giá trị âm tính là 0
+    assert snap['buckets'] == [{'le': 0.01, 'count': 3}, {'le': 0.1, 'count': 4},
+                               {'le': 1.0, 'count': 5}, {'le': '+Inf', 'count': 6}]
+    assert snap['count'] == 6
+    assert snap['sum'] == 2.565
+    assert snap['max'] == 2.0
+    assert snap['avg'] == round(2.565 / 6, 6)
+
+    text = histogram.to_prometheus('loop_lag_seconds')
+    assert 'loop_lag_seconds_bucket{le="0.1"} 4' in text
+    assert 'loop_lag_seconds_bucket{le="+Inf"} 6' in text
+    assert 'loop_lag_seconds_count 6' in text
+
+    assert LagHistogram().snapshot()['avg'] == 0.0
+
+
+def test_blocking_call_stack_is_captured():
+    monitor = EventLoopMonitor(interval=0.01, threshold=0.1)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        # Chặn loop bằng lời gọi đồng bộ đi qua một hàm của app
+        _app_namespace['busy_handler'](lambda: time.sleep(0.5))
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(run())
+    status = monitor.get_status()
+    assert status['is_running'] is False
+    assert len(status['blocking_reports']) == 1
+    report = status['blocking_reports'][0]
+    assert report['stalled_ms'] >= 100
+    assert report['app_function'].startswith(os.path.join('core', 'services', 'fake_blocking.py') + ':2 ')
+    assert report['app_function'].endswith('busy_handler')
+    assert report['app_stack'] == [report['app_function']]
+    # Frame trong cùng là hàm thực sự đang chặn (lambda của test)
+    assert 'test_blocking_call_stack_is_captured' in report['innermost_frame']
+    # Lượt chặn cũng được ghi vào histogram độ trễ
+    assert status['lag_seconds']['max'] >= 0.4
@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from core.config import Config
+from core.dependencies import require_admin
+from core.exceptions import ProfilerBusyError
+from core.monitoring.profiler import ProfileSession, ProfilerMiddleware, SamplingProfiler, get_profiler
+from core.routers.admin_router import run_profiler
+
+
+def _busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_duration_session_samples_other_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name='busy-worker')
+    worker.start()
+    try:
+        session = SamplingProfiler().start('duration', seconds=0.2, interval=0.002)
+        assert session.wait(5)
+    finally:
+        stop.set()
+        worker.join()
+    assert session.sample_count > 0
+    lines = session.to_collapsed().splitlines()
+    assert any(line.startswith('thread:busy-worker;') and '_busy_loop' in line for line in lines)
+    # Định dạng collapsed: "frame;frame;... số_lần"
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'mode': 'duration', 'seconds': Config.PROFILER_MAX_SECONDS + 1},
+    {'mode': 'requests', 'route': '/x', 'request_count': 1, 'timeout': 0},
+    {'mode': 'requests', 'route': '/x', 'request_count': 1, 'timeout': Config.PROFILER_MAX_SECONDS + 1},
+    {'mode': 'duration', 'seconds': 1, 'interval': Config.PROFILER_MIN_INTERVAL / 10},
+    {'mode': 'requests', 'route': '/x', 'request_count': 0},
+])
+def test_out_of_range_arguments_are_rejected(kwargs):
+    profiler = SamplingProfiler()
+    with pytest.raises(ValueError):
+        profiler.start(**kwargs)
+    assert profiler.active_session is None
+
+
+def test_admin_route_status_codes():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_profiler(route='/x', requests=1, timeout=10 ** 6))
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_profiler(seconds=1, interval_ms=0))
+    assert exc.value.status_code == 400
+
+    # Chỉ một phiên tại một thời điểm
+    session = get_profiler().start('duration', seconds=5)
+    try:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run_profiler(seconds=1))
+        assert exc.value.status_code == 409
+        with pytest.raises(ProfilerBusyError):
+            get_profiler().start('duration', seconds=1)
+    finally:
+        session.stop()
+        assert session.wait(5)
+    assert get_profiler().active_session is None
+
+
+def test_admin_requires_configured_token(monkeypatch):
+    # Chưa thiết lập token: /admin tắt hẳn thay vì mở cho mọi client
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', None)
+    with pytest.raises(HTTPException) as exc:
+        require_admin('bất kỳ')
+    assert exc.value.status_code == 503
+
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'bí-mật')
+    for token in (None, '', 'sai'):
+        with pytest.raises(HTTPException) as exc:
+            require_admin(token)
+        assert exc.value.status_code == 403
+    require_admin('bí-mật')
+
+
+def test_middleware_counts_requests_of_profiled_route():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(scope['path'])
+        await asyncio.sleep(0.03)
+
+    async def serve(path):
+        await ProfilerMiddleware(app)({'type': 'http', 'path': path}, None, None)
+
+    session = get_profiler().start('requests', route='/slow', request_count=2, timeout=5, interval=0.002)
+
+    async def scenario():
+        await serve('/other')
+        await asyncio.gather(serve('/slow'), serve('/slow'))
+        assert session.wait(5)
+        await serve('/slow')  # phiên đã dừng: không đếm nữa
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        session.stop()
+        session.wait(5)
+    assert seen == ['/other', '/slow', '/slow', '/slow']
+    assert session.summary()['completed_requests'] == 2
+    assert session.sample_count > 0
+    assert session.summary()['elapsed_seconds'] < 5
+
+
+def test_session_clamps_timeout_and_interval():
+    # ProfileSession tạo trực tiếp (không qua start) cũng không vượt giới hạn
+    session = ProfileSession('requests', route='/x', request_count=1, interval=1e-6, timeout=10 ** 6)
+    assert session.timeout == Config.PROFILER_MAX_SECONDS
+    assert session.interval == Config.PROFILER_MIN_INTERVAL
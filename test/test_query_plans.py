@@ -0,0 +1,215 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.timezone_utils import VIETNAM_TZ
+
+# Kích thước gần với DB production sau vài năm sử dụng
+SCHEDULE_ROWS = 20000
+SESSIONS = 200
+MESSAGES_PER_SESSION = 50
+
+# Câu lệnh được phép SCAN / dùng temp B-tree, kèm lý do
+ALLOWLIST = {
+    r"^SELECT \* FROM schedules WHERE COALESCE\(deleted, 0\) = 0 ORDER BY start_time$":
+        "get_schedules liệt kê toàn bộ lịch theo yêu cầu",
+    r"^SELECT id, title, start_time, end_time FROM schedules WHERE COALESCE\(deleted, 0\) = 0$":
+        "chỉ mục lịch trong bộ nhớ nạp toàn bộ lịch, chỉ khi data_version đổi",
+    r"^SELECT COUNT\(\*\) FROM schedules$":
+        "thống kê tổng số lịch cho trang trạng thái",
+    r"^SELECT COUNT\(\*\) FROM schedules WHERE COALESCE\(notified, 0\) = 0$":
+        "thống kê, duyệt trên partial index các lịch chưa thông báo",
+    r"FROM sqlite_master":
+        "kiểm tra schema một lần khi khởi tạo service",
+    r"^SELECT .* FROM conversation_sessions ORDER BY last_activity DESC, session_id DESC LIMIT \?$":
+        "trang đầu danh bạ session duyệt index hoạt động theo thứ tự và dừng sau LIMIT",
+}
+
+_STATEMENT_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def _normalize(sql: str) -> str:
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def _template(sql: str) -> str:
+    """Giữ nguyên literal của allowlist (vd: COALESCE(deleted, 0)), chỉ gom khoảng trắng."""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+@pytest.fixture
+def statements(tmp_path, monkeypatch):
+    """Ghi lại mọi câu lệnh SQL các service phát ra (đã bind giá trị)."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('database', exist_ok=True)
+    collected = []
+    real_connect = sqlite3.connect
+
+    def tracing_connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        conn.set_trace_callback(collected.append)
+        return conn
+
+    monkeypatch.setattr(sqlite3, 'connect', tracing_connect)
+    return collected
+
+
+def _seed(db_path: str):
+    rng = random.Random(42)
+    base = datetime(2024, 1, 1, 8, 0, tzinfo=VIETNAM_TZ)
+    conn = sqlite3.connect(db_path)
+    conn.set_trace_callback(None)
+    rows = []
+    for i in range(SCHEDULE_ROWS):
+        start = base + timedelta(days=rng.randrange(0, 900), minutes=15 * rng.randrange(0, 40))
+        end = start + timedelta(minutes=rng.choice((30, 60, 90)))
+        rows.append((f'Lịch {i}', '', start.isoformat(), end.isoformat(), start.isoformat(),
+                     int(rng.random() < 0.05), int(rng.random() < 0.7)))
+    conn.executemany('''
+        INSERT INTO schedules (title, description, start_time, end_time, created_at, deleted, notified)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    messages = []
+    for s in range(SESSIONS):
+        for m in range(MESSAGES_PER_SESSION):
+            ts = (base + timedelta(minutes=s * 1000 + m)).isoformat()
+            messages.append((f'session-{s}', 'user' if m % 2 == 0 else 'assistant', f'tin nhắn {m}', ts, ts))
+    conn.executemany('''
+        INSERT INTO conversation_history (session_id, role, content, timestamp, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', messages)
+    conn.commit()
+    conn.close()
+
+
+def _exercise_hot_paths():
+    """Gọi các đường đi nóng của service như khi xử lý hội thoại và chạy scheduler."""
+    from core.services.ExecuteSchedule import ExecuteSchedule
+    from core.services.ScheduleAdvisor import ScheduleAdvisor, check_schedule_overlap
+    from core.services.google_calendar_service import GoogleCalendarService
+    from core.services.conversation_service import ConversationService
+    from core.notification.NotificationCore import NotificationDatabaseService
+
+    day = datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ)
+
+    executor = ExecuteSchedule(enable_google_calendar=False)
+    executor.get_schedules()
+    executor.get_schedules_by_date('2025-03-03')
+    executor.get_schedules_by_month(2025, 3)
+    executor.get_schedules_by_year(2025)
+    executor.validate_time(day.isoformat(), (day + timedelta(hours=1)).isoformat())
+    executor.add_schedule('Họp', '', (day + timedelta(days=3000)).isoformat(),
+                          (day + timedelta(days=3000, hours=1)).isoformat())
+    executor.update_schedule(1, title='Họp team')
+    executor.delete_schedule(2)
+    executor.close()
+
+    advisor = ScheduleAdvisor()
+    advisor._get_schedules_for_day(day)
+    conn = sqlite3.connect('database/schedule.db')
+    check_schedule_overlap(conn, day, day + timedelta(hours=1))
+    conn.close()
+
+    calendar = GoogleCalendarService()
+    calendar.is_time_slot_free(day.isoformat(), (day + timedelta(hours=1)).isoformat())
+    calendar.find_conflicts(day.isoformat(), (day + timedelta(hours=1)).isoformat())
+
+    notifications = NotificationDatabaseService()
+    notifications.get_upcoming_schedules(15)
+    notifications.mark_notification_sent(3)
+    notifications.get_notification_stats()
+
+    conversations = ConversationService()
+    conversations.add_user_message('xin chào', 'session-1')
+    conversations.get_recent_context('session-1', 12)
+    conversations.get_relevant_context('session-1', 'tin nhắn')
+    conversations.get_conversation_history('session-1', 20)
+    page = conversations.get_history_page('session-1', 10)
+    conversations.get_history_page('session-1', 10, after=page['next_cursor'])
+    conversations.get_history_page('session-1', 10, newest=True)
+    conversations.get_history_page('session-1', 10, before=page['next_cursor'])
+    conversations.get_session_stats('session-1')
+    directory = conversations.list_sessions(20)
+    conversations._archiver.archive_inactive(max_sessions=2)
+    conversations._archiver.archive_session('session-3')
+    conversations.restore_session('session-3')
+    conversations.list_sessions(20, directory['next_cursor'])
+    conversations.search_conversations('chào', 'session-1')
+    conversations.search_conversations('tin nhan', None, 10, 10)
+    # Vượt high-water mark để chạy range delete cắt lịch sử
+    for i in range(MESSAGES_PER_SESSION // 4):
+        conversations.add_user_message(f'tin mới {i}', 'session-2')
+
+
+def _create_schema():
+    from core.services.google_calendar_service import GoogleCalendarService
+    from core.services.ExecuteSchedule import ExecuteSchedule
+    from core.services.conversation_service import ConversationService
+    from core.notification.NotificationCore import NotificationDatabaseService
+
+    GoogleCalendarService()
+    ExecuteSchedule(enable_google_calendar=False).close()
+    NotificationDatabaseService()
+    ConversationService()
+
+
+def test_hot_statements_use_indexes(statements):
+    _create_schema()
+    _seed('database/schedule.db')
+    statements.clear()
+
+    _exercise_hot_paths()
+
+    unique = {}
+    for sql in statements:
+        if _template(sql).upper().startswith(_STATEMENT_PREFIXES):
+            unique.setdefault(_normalize(sql), sql)
+    assert len(unique) >= 15, f"Harness thu được quá ít câu lệnh: {list(unique)}"
+
+    conn = sqlite3.connect('database/schedule.db')
+    conn.set_trace_callback(None)
+    violations = []
+    for normalized, sql in unique.items():
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+        bad = [step for step in plan
+               if (step.startswith('SCAN') and 'CONSTANT ROW' not in step and 'VIRTUAL TABLE INDEX' not in step)
+               or 'TEMP B-TREE' in step]
+        if not bad:
+            continue
+        if any(re.search(pattern, normalized) or re.search(pattern, _template(sql)) for pattern in ALLOWLIST):
+            continue
+        violations.append(f"{normalized}\n    -> {'; '.join(plan)}")
+    conn.close()
+
+    assert not violations, "Câu lệnh không dùng được index:\n" + "\n".join(violations)
+
+
+def test_validate_time_with_mixed_stored_formats(tmp_path):
+    from core.services.ExecuteSchedule import ExecuteSchedule
+
+    executor = ExecuteSchedule(db_path=str(tmp_path / 'schedule.db'), enable_google_calendar=False)
+    # Lịch lưu nguyên chuỗi người gọi truyền vào: không timezone, UTC dạng Z, +07:00, lệch ngày
+    executor.conn.executemany('INSERT INTO schedules (title, start_time, end_time) VALUES (?, ?, ?)', [
+        ('naive', '2030-10-20 09:00:00', '2030-10-20 10:00:00'),
+        ('utc', '2030-10-21T02:00:00Z', '2030-10-21T03:00:00Z'),
+        ('vn', '2030-10-22T09:00:00+07:00', '2030-10-22T10:00:00+07:00'),
+        ('utc qua ngày', '2030-10-22T18:00:00+00:00', '2030-10-22T19:00:00+00:00'),
+    ])
+    executor.conn.commit()
+
+    assert not executor.validate_time('2030-10-20T09:30:00+07:00', '2030-10-20T10:30:00+07:00')
+    assert not executor.validate_time('2030-10-21T09:30:00+07:00', '2030-10-21T10:30:00+07:00')
+    assert not executor.validate_time('2030-10-22 09:30:00', '2030-10-22 10:30:00')
+    assert not executor.validate_time('2030-10-23T01:30:00+07:00', '2030-10-23T02:30:00+07:00')
+    assert executor.validate_time('2030-10-20T10:00:00+07:00', '2030-10-20T11:00:00+07:00')
+    assert executor.validate_time('2030-10-21T10:00:00+07:00', '2030-10-21T11:00:00+07:00')
+    assert "❌" in executor.add_schedule('Trùng', '', '2030-10-20T09:30:00+07:00', '2030-10-20T10:30:00+07:00')
+    executor.close()
@@ -0,0 +1,153 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+class StubGeminiService:
+    """Luôn gọi advise_schedule, không gọi mạng."""
+
+    def generate_with_timeout(self, system_prompt, functions, **kwargs):
+        return SimpleNamespace(function_call=SimpleNamespace(
+            name='advise_schedule', args={'user_request': 'họp team 10h thứ 5 tuần sau'}))
+
+    def extract_function_call(self, response):
+        return getattr(response, 'function_call', None)
+
+    def get_ai_response(self, prompt, **kwargs):
+        return "ok"
+
+    def format_response(self, response):
+        return response if isinstance(response, str) else str(response)
+
+    async def process_message(self, message, **kwargs):
+        return "Bạn muốn họp bao lâu?"
+
+
+@pytest.fixture
+def recorded_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('database', exist_ok=True)
+    import core.ai_agent
+    import core.handlers.function_handler
+    from core.replay import TurnRecorder
+    monkeypatch.setattr(core.ai_agent, 'GeminiService', StubGeminiService)
+    monkeypatch.setattr(core.handlers.function_handler, 'GeminiService', StubGeminiService)
+
+    recorder = TurnRecorder(directory=str(tmp_path / 'recordings'), enabled=True)
+    monkeypatch.setattr(core.ai_agent, 'get_turn_recorder', lambda: recorder)
+
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        agent = core.ai_agent.AIAgent(session_id='replay-test')
+        for text in ('tư vấn họp team 10h thứ 5 tuần sau', 'sáng mai họp 30 phút'):
+            asyncio.run(agent.process_user_input(text))
+            clock.advance(minutes=1)
+    assert recorder.recorded_turns == 2
+    return str(tmp_path / 'recordings')
+
+
+def test_replay_is_deterministic(recorded_dir):
+    from core.replay import ReplayRunner, read_recordings
+
+    turns = list(read_recordings([recorded_dir]))
+    assert [t['user_input'] for t in turns] == ['tư vấn họp team 10h thứ 5 tuần sau', 'sáng mai họp 30 phút']
+    assert turns[0]['clock'].startswith('2025-03-03T09:00')
+    assert turns[0]['llm_calls'][0]['response']['function_call']['name'] == 'advise_schedule'
+
+    report = ReplayRunner().run([recorded_dir])
+    assert report['summary']['turns'] == 2
+    assert report['summary']['changed_outputs'] == 0, report['turns']
+    assert report['summary']['changed_prompts'] == 0
+
+
+def test_replay_reports_output_diff(recorded_dir, monkeypatch):
+    from core.replay import ReplayRunner
+    from core.handlers.function_handler import FunctionCallHandler
+
+    async def regressed(self, args, user_input):
+        return "regression"
+    monkeypatch.setattr(FunctionCallHandler, '_handle_advise_schedule', regressed)
+
+    report = ReplayRunner().run([recorded_dir])
+    assert report['summary']['changed_outputs'] == 2
+    assert any(line.startswith('+regression') for line in report['turns'][0]['output_diff'])
+
+
+def test_snapshot_keeps_only_history_the_prompt_can_use(tmp_path):
+    import sqlite3
+    from core.replay import TurnRecorder
+    from core.services.ScheduleAdvisor import ScheduleAdvisor
+    from core.services.conversation_service import ConversationService
+
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    svc = ConversationService(db_path=db_path, max_history=20, write_behind=False)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('''
+        INSERT INTO conversation_history (session_id, role, content, timestamp, created_at) VALUES (?, ?, ?, ?, ?)
+    ''', [('long', 'user', f'tin {i}', f'2025-03-03T09:{i // 60:02d}:{i % 60:02d}', '') for i in range(500)])
+    conn.commit()
+    conn.close()
+
+    recorder = TurnRecorder(directory=str(tmp_path / 'recordings'), db_path=db_path, enabled=True)
+    now = datetime(2025, 3, 3, 10, 0, tzinfo=VIETNAM_TZ)
+    state = recorder._snapshot_state('long', now, svc)
+    assert len(state['conversation']) == svc.trim_high_water == 24
+    assert [m['content'] for m in state['conversation'][-2:]] == ['tin 498', 'tin 499']
+    assert len(recorder._snapshot_state('long', now)['conversation']) == 60
+
+
+def test_snapshot_includes_buffered_messages(tmp_path, monkeypatch):
+    from core.config import Config
+    from core.replay import TurnRecorder
+    from core.services.conversation_service import ConversationService
+
+    monkeypatch.setattr(Config, 'HISTORY_FLUSH_INTERVAL', 60)
+    db_path = str(tmp_path / 'schedule.db')
+    svc = ConversationService(db_path=db_path, write_behind=True)
+    svc.add_user_message('đã ghi', 'wb')
+    svc._buffer.flush()
+    svc.add_user_message('email tôi là an@example.com', 'wb')
+    svc.add_assistant_message('đã lưu email', session_id='wb')
+    assert svc._buffer.get_stats()['pending_messages'] == 2
+
+    recorder = TurnRecorder(directory=str(tmp_path / 'recordings'), db_path=db_path, enabled=True)
+    state = recorder._snapshot_state('wb', datetime(2025, 3, 3, 10, 0, tzinfo=VIETNAM_TZ), svc)
+    assert [m['content'] for m in state['conversation']] == ['đã ghi', 'email tôi là an@example.com', 'đã lưu email']
+    assert 'an@example.com' in state['profile']
+    svc._buffer.close()
+
+
+def test_ephemeral_session_is_recorded_and_replayed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('database', exist_ok=True)
+    import core.ai_agent
+    import core.handlers.function_handler
+    from core.replay import ReplayRunner, TurnRecorder, read_recordings
+    monkeypatch.setattr(core.ai_agent, 'GeminiService', StubGeminiService)
+    monkeypatch.setattr(core.handlers.function_handler, 'GeminiService', StubGeminiService)
+    recorder = TurnRecorder(directory=str(tmp_path / 'recordings'), enabled=True)
+    monkeypatch.setattr(core.ai_agent, 'get_turn_recorder', lambda: recorder)
+
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        agent = core.ai_agent.AIAgent(session_id='guest-replay')
+        for text in ('tư vấn họp team 10h thứ 5 tuần sau', 'sáng mai họp 30 phút'):
+            asyncio.run(agent.process_user_input(text))
+            clock.advance(minutes=1)
+
+    turns = list(read_recordings([str(tmp_path / 'recordings')]))
+    assert [t['ephemeral'] for t in turns] == [True, True]
+    # Lượt thứ hai thấy lượt đầu (lấy từ kho session tạm, không phải file DB)
+    assert turns[1]['conversation'][0]['content'] == 'tư vấn họp team 10h thứ 5 tuần sau'
+    report = ReplayRunner().run([str(tmp_path / 'recordings')])
+    assert report['summary']['changed_outputs'] == 0, report['turns']
+    assert report['summary']['changed_prompts'] == 0, report['turns']
@@ -0,0 +1,126 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor, check_schedule_overlap
+from core.services.schedule_index import ScheduleIntervalIndex, to_epoch
+from utils.clock import FixedClock
+from utils.timezone_utils import VIETNAM_TZ
+
+BASE = datetime(2025, 3, 5, 8, 0, tzinfo=VIETNAM_TZ)
+
+
+def _add(conn, title, start, minutes, deleted=0):
+    cursor = conn.execute(
+        'INSERT INTO schedules (title, start_time, end_time, created_at, deleted) VALUES (?, ?, ?, ?, ?)',
+        (title, start.isoformat(), (start + timedelta(minutes=minutes)).isoformat(), start.isoformat(), deleted))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def test_index_follows_writes_from_other_connections(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    advisor = ScheduleAdvisor(db_path=db_path, clock=FixedClock(BASE))
+    index = ScheduleIntervalIndex(db_path)
+    writer = sqlite3.connect(db_path)
+
+    assert index.is_free(BASE, BASE + timedelta(hours=1))
+    meeting = _add(writer, 'Họp team', BASE + timedelta(minutes=30), 60)
+    _add(writer, 'Lịch đã xóa', BASE, 600, deleted=1)
+    assert not index.is_free(BASE, BASE + timedelta(hours=1))
+    assert [row['title'] for row in index.conflicts(BASE, BASE + timedelta(hours=4))] == ['Họp team']
+    # Hai đầu mút chạm nhau không tính là trùng
+    assert index.is_free(BASE + timedelta(minutes=90), BASE + timedelta(hours=2))
+    loads = index.loads
+    index.is_free(BASE, BASE + timedelta(hours=1))
+    assert index.loads == loads  # DB không đổi thì không nạp lại
+
+    writer.execute('UPDATE schedules SET deleted = 1 WHERE id = ?', (meeting,))
+    writer.commit()
+    assert index.is_free(BASE, BASE + timedelta(hours=1))
+
+    # Advisor dùng chỉ mục chung: thấy lịch do connection khác tạo
+    _add(writer, 'Gọi khách', BASE + timedelta(days=1, hours=1), 60)
+    tomorrow_nine = BASE + timedelta(days=1, hours=1)
+    assert not advisor.schedule_index.is_free(tomorrow_nine, tomorrow_nine + timedelta(minutes=30))
+    assert [s['title'] for s in advisor._get_schedules_for_day(tomorrow_nine)] == ['Gọi khách']
+    writer.close()
+    index.close()
+
+
+def test_index_matches_sql_overlap_check(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(7)
+    for i in range(200):
+        _add(conn, f'Lịch {i}', BASE + timedelta(minutes=15 * rng.randrange(0, 2000)),
+             15 * rng.randrange(1, 12), deleted=int(rng.random() < 0.1))
+    index = ScheduleIntervalIndex(db_path)
+    for _ in range(500):
+        start = BASE + timedelta(minutes=5 * rng.randrange(0, 6000))
+        end = start + timedelta(minutes=5 * rng.randrange(1, 40))
+        assert index.is_free(start, end) == check_schedule_overlap(conn, start, end)
+        assert (not index.conflicts(start, end)) == index.is_free(start, end)
+    conn.close()
+    index.close()
+
+
+def test_next_gap_skips_merged_busy_blocks(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    conn = sqlite3.connect(db_path)
+    _add(conn, 'A', BASE, 60)                           # 08:00-09:00
+    _add(conn, 'B', BASE + timedelta(minutes=45), 45)   # 08:45-09:30 (gộp với A)
+    _add(conn, 'C', BASE + timedelta(minutes=120), 60)  # 10:00-11:00
+    index = ScheduleIntervalIndex(db_path)
+
+    assert index.next_gap(BASE, 30) == to_epoch(BASE + timedelta(minutes=90))
+    # 30 phút trống 09:30-10:00 không đủ cho 45 phút
+    assert index.next_gap(BASE, 45) == to_epoch(BASE + timedelta(hours=3))
+    assert index.next_gap(BASE, 45, until=BASE + timedelta(hours=3)) is None
+    assert index.next_gap(BASE - timedelta(hours=1), 60) == to_epoch(BASE - timedelta(hours=1))
+    assert index.get_stats()['busy_blocks'] == 2
+    conn.close()
+    index.close()
+
+
+class _LockedConnection:
+    """Kết nối giả: PRAGMA đọc bình thường, đọc bảng schedules báo database is locked."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql.lstrip().upper().startswith('PRAGMA'):
+            return self.conn.execute(sql, *args)
+        raise sqlite3.OperationalError('database is locked')
+
+    def close(self):
+        self.conn.close()
+
+
+def test_read_error_keeps_last_good_snapshot(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    ScheduleAdvisor(db_path=db_path)
+    writer = sqlite3.connect(db_path)
+    _add(writer, 'Họp team', BASE, 60)
+    index = ScheduleIntervalIndex(db_path)
+    assert not index.is_free(BASE, BASE + timedelta(minutes=30))
+
+    real = index._conn
+    index._conn = _LockedConnection(real)
+    _add(writer, 'Khám răng', BASE + timedelta(hours=2), 60)
+    # Nạp lại lỗi: vẫn thấy lịch cũ, không coi cả ngày là trống
+    assert not index.is_free(BASE, BASE + timedelta(minutes=30))
+    assert [row['title'] for row in index.conflicts(BASE, BASE + timedelta(hours=4))] == ['Họp team']
+
+    index._conn = real
+    # Phiên bản chưa được ghi nhận nên lần gọi sau nạp lại
+    assert not index.is_free(BASE + timedelta(hours=2), BASE + timedelta(hours=3))
+    assert len(index.conflicts(BASE, BASE + timedelta(hours=4))) == 2
+    writer.close()
+    index.close()
@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+from datetime import datetime
+
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def _aggregate(db_path, session_id):
+    """Thống kê tính lại trực tiếp từ conversation_history để so với bảng conversation_sessions."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('''
+            SELECT COUNT(*), SUM(role = 'user'), SUM(role = 'assistant'), MIN(timestamp), MAX(timestamp)
+            FROM conversation_history WHERE session_id = ?
+        ''', (session_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_session_stats_follow_inserts_trims_and_clear(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, max_history=10, pool=pool, write_behind=False)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        for i in range(30):
+            session_id = f's{i % 3}'
+            svc.add_user_message(f'hỏi {i}', session_id)
+            svc.add_assistant_message(f'đáp {i}', session_id=session_id)
+            clock.advance(minutes=1)
+        # s0 cũ nhất vừa có hoạt động mới
+        svc.add_user_message('quay lại', 's0')
+
+    for session_id in ('s0', 's1', 's2'):
+        stats = svc.get_session_stats(session_id)
+        assert (stats['total_messages'], stats['user_messages'], stats['assistant_messages'],
+                stats['first_message'], stats['last_message']) == _aggregate(db_path, session_id)
+    assert svc.get_session_stats('s1')['total_messages'] <= svc.trim_high_water
+
+    first = svc.list_sessions(limit=2)
+    assert [s['session_id'] for s in first['sessions']] == ['s0', 's2']
+    second = svc.list_sessions(limit=2, cursor=first['next_cursor'])
+    assert [s['session_id'] for s in second['sessions']] == ['s1'] and second['next_cursor'] is None
+
+    svc.clear_session('s2')
+    assert svc.get_session_stats('s2')['total_messages'] == 0
+    assert [s['session_id'] for s in svc.list_sessions()['sessions']] == ['s0', 's1']
+
+    # DB cũ chưa có bảng: dựng lại từ lịch sử khi khởi tạo service
+    conn = sqlite3.connect(db_path)
+    conn.execute('DROP TABLE conversation_sessions')
+    conn.close()
+    svc = ConversationService(db_path=db_path, max_history=10, pool=pool, write_behind=False)
+    stats = svc.get_session_stats('s0')
+    assert (stats['total_messages'], stats['user_messages'], stats['assistant_messages'],
+            stats['first_message'], stats['last_message']) == _aggregate(db_path, 's0')
+    pool.close()
@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+import re
+from datetime import datetime
+
+from core.services.ScheduleAdvisor import ScheduleAdvisor
+from utils.clock import FixedClock
+from utils.time_matcher import TimeExpressionMatcher, get_time_matcher
+from utils.timezone_utils import VIETNAM_TZ
+
+WORDS = ('họp', 'thứ', '2', 't3', 't7', 'cn', 'chủ', 'nhật', 'sáng', 'chiều', 'tối', 'mai', 'hôm', 'nay',
+         'ngày', 'kia', 'tuần', 'này', 'sau', 'tháng', '9h', '14:30', '15/11', '10-12-2025', 'giờ', 'phút',
+         'lúc', 'vào', 'today', 'tomorrow', 'next', 'week', 'this', 'month', 'Long', 'thứba', 'chủnhật', '٣')
+
+
+def test_matcher_finds_same_patterns_as_cascade(tmp_path):
+    advisor = ScheduleAdvisor(db_path=str(tmp_path / 'schedule.db'),
+                              clock=FixedClock(datetime(2025, 3, 5, 10, 0, tzinfo=VIETNAM_TZ)))
+    patterns = [pattern for pattern, _, _ in advisor.time_patterns]
+    # Điều kiện lọc khai báo cạnh mỗi pattern phải là điều kiện cần: lọc không được bỏ sót pattern khớp
+    matcher = TimeExpressionMatcher([(pattern, requires) for pattern, _, requires in advisor.time_patterns],
+                                    cache_size=0)
+    rng = random.Random(5)
+    for _ in range(3000):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+        if rng.random() < 0.3:
+            text = text.replace(' ', '')
+        expected = [i for i, pattern in enumerate(patterns) if re.search(pattern, text.lower())]
+        assert [i for i, _ in matcher.matches(text)] == expected, text
+    # Lọc theo atom loại phần lớn pattern trước khi chạy re.search
+    assert matcher.get_stats()['searches'] < 3000 * len(patterns) // 3
+
+    # Kết quả parse giữ nguyên ngữ nghĩa "pattern đầu tiên cho thời điểm tương lai"
+    assert advisor._extract_time('họp lúc 9h thứ 7 tuần này') == datetime(2025, 3, 8, 9, 0, tzinfo=VIETNAM_TZ)
+    assert advisor._extract_time('Họp   team  SÁNG MAI') == datetime(2025, 3, 6, 8, 0, tzinfo=VIETNAM_TZ)
+    assert advisor._extract_time('họp với Long') is None
+
+
+def test_matcher_cache_is_shared_and_keyed_by_normalized_text():
+    matcher = get_time_matcher([r"(\d{1,2})h", r"(?:ngày\s*mai|mai)"])
+    assert matcher is get_time_matcher([r"(\d{1,2})h", r"(?:ngày\s*mai|mai)"])
+    first = matcher.matches('Họp 9h  ngày mai')
+    assert [i for i, _ in first] == [0, 1]
+    hits = matcher.get_stats()['hits']
+    assert matcher.matches('họp 9h ngày mai') is first
+    assert matcher.get_stats()['hits'] == hits + 1
@@ -0,0 +1,42 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import threading
+import time
+
+from core.monitoring.usage import UsageTracker
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT session_id, calls FROM llm_usage_hourly').fetchall()
+    finally:
+        conn.close()
+
+
+def test_record_never_writes_on_caller_thread(tmp_path):
+    db_path = str(tmp_path / 'usage.db')
+    tracker = UsageTracker(db_path=db_path, flush_every=3, flush_interval=30)
+    flush_threads = []
+    original = tracker.flush
+
+    def flush():
+        flush_threads.append(threading.current_thread().name)
+        return original()
+
+    tracker.flush = flush
+    for _ in range(3):
+        tracker.record('chat', 'gemini', 0.2, session_id='s1')
+    # Đủ flush_every: thread nền được đánh thức, lượt gọi không tự ghi
+    deadline = time.monotonic() + 5
+    while not _rows(db_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _rows(db_path) == [('s1', 3)]
+    assert flush_threads and threading.current_thread().name not in flush_threads
+
+    tracker.record('chat', 'gemini', 0.1, session_id='s1')
+    tracker.close()
+    assert _rows(db_path) == [('s1', 4)]
+    assert tracker.summary('session')[0]['calls'] == 4
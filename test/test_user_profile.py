@@ -0,0 +1,61 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+from datetime import datetime
+
+from core.ai_agent import AIAgent
+from core.services.connection_pool import SQLitePool
+from core.services.conversation_service import ConversationService
+from core.services.user_profile import PROFILE_HEADER, UserProfileStore
+from utils.clock import FixedClock, use_clock
+from utils.timezone_utils import VIETNAM_TZ
+
+
+def _add_schedule(svc, session_id, start, end):
+    svc.add_assistant_message('Đã thêm lịch', function_call={
+        'name': 'smart_add_schedule', 'args': {'title': 'Họp', 'start_time': start, 'end_time': end}
+    }, session_id=session_id)
+
+
+def test_profile_is_updated_incrementally_and_answers_questions(tmp_path):
+    db_path = str(tmp_path / 'schedule.db')
+    pool = SQLitePool(db_path)
+    svc = ConversationService(db_path=db_path, pool=pool, write_behind=False)
+    clock = FixedClock(datetime(2025, 3, 3, 9, 0, tzinfo=VIETNAM_TZ))
+    with use_clock(clock):
+        svc.add_user_message('Chào bạn, tên tôi là Minh', 's1')
+        svc.add_user_message('gửi thông báo về minh.nguyen@example.com nhé', 's1')
+        _add_schedule(svc, 's1', '2025-03-04T09:00:00', '2025-03-04T10:00:00')
+        _add_schedule(svc, 's1', '2025-03-05T09:30:00', '2025-03-05T10:30:00')
+        _add_schedule(svc, 's1', '2025-03-06T14:00:00', '2025-03-06T14:30:00')
+
+    assert svc.get_profile('s1') == {
+        'name': 'Minh', 'email': 'minh.nguyen@example.com',
+        'preferred_times': ['09:00', '14:00'], 'typical_durations': [60, 30]
+    }
+    assert svc.get_profile_context('s1') == (
+        f"{PROFILE_HEADER} Tên: Minh | Email nhận thông báo: minh.nguyen@example.com | "
+        "Giờ hay đặt lịch: 09:00, 14:00 | Thời lượng thường dùng: 60 phút, 30 phút"
+    )
+
+    agent = AIAgent.__new__(AIAgent)
+    agent.session_id = 's1'
+    agent.conversation_service = svc
+    assert agent._can_answer_from_context('bạn có biết tên tôi không?')
+    assert agent._answer_from_context('bạn có biết tên tôi không?') == \
+        'Dạ, tôi nhớ bạn tên là Minh! Bạn cần giúp gì về lập lịch không?'
+    assert 'minh.nguyen@example.com' in agent._answer_from_context('email của tôi là gì')
+    assert agent._conversation_context().startswith(PROFILE_HEADER)
+
+    # DB cũ chưa có hồ sơ: dựng một lần từ lịch sử đang lưu
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM user_profiles')
+    conn.commit()
+    conn.close()
+    fresh = UserProfileStore(pool)
+    assert fresh.get('s1') == svc.get_profile('s1')
+
+    svc.clear_session('s1')
+    assert svc.get_profile('s1')['name'] is None
+    pool.close()
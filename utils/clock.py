@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional
+
+from utils.timezone_utils import VIETNAM_TZ
+
+
+class SystemClock:
+    """Đồng hồ thật của hệ thống (mặc định theo giờ Việt Nam)."""
+
+    def now(self, tz: Optional[tzinfo] = None) -> datetime:
+        return datetime.now(tz or VIETNAM_TZ)
+
+
+class FixedClock:
+    """Đồng hồ đứng yên, dùng khi replay hoặc test để kết quả parse thời gian tất định."""
+
+    def __init__(self, current: datetime):
+        self.set(current)
+
+    def set(self, current: datetime):
+        self._current = current if current.tzinfo else current.replace(tzinfo=VIETNAM_TZ)
+
+    def advance(self, **kwargs):
+        self._current += timedelta(**kwargs)
+
+    def now(self, tz: Optional[tzinfo] = None) -> datetime:
+        if tz is None:
+            return self._current
+        # pytz timezone cần normalize qua astimezone để có offset đúng
+        return self._current.astimezone(tz)
+
+
+_clock = SystemClock()
+
+def get_clock():
+    return _clock
+
+def set_clock(clock) -> object:
+    """Thay đồng hồ dùng chung, trả về đồng hồ cũ để khôi phục."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+@contextmanager
+def use_clock(clock):
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
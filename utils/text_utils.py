@@ -0,0 +1,7 @@
+import unicodedata
+
+
+def fold_text(text: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả 'đ') và chữ hoa để so khớp không phân biệt dấu."""
+    text = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
@@ -0,0 +1,126 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Sequence, Tuple, Union
+
+from core.config import Config
+
+# Atom đặc biệt trong điều kiện lọc: câu có ít nhất một chữ số (\d khớp mọi chữ số Unicode)
+DIGIT = r'\d'
+_DIGIT_RE = re.compile(r'\d')
+_MAX_CANDIDATE_SETS = 4096
+
+Clause = FrozenSet[str]
+# Điều kiện lọc của một pattern: mỗi phần tử là một atom bắt buộc, hoặc tuple các atom mà câu
+# phải chứa ít nhất một (vd: các nhánh của (?:h|:)). Chỉ là điều kiện cần: mọi câu pattern khớp
+# đều phải thỏa, nên chỉ khai báo các phần bắt buộc của pattern.
+Requires = Sequence[Union[str, Tuple[str, ...]]]
+
+
+def normalize_time_text(text: str) -> str:
+    """Chuẩn hóa câu trước khi so khớp: NFC, chữ thường, gộp khoảng trắng (mọi pattern dùng \\s*)."""
+    return ' '.join(unicodedata.normalize('NFC', text).lower().split())
+
+
+def _clauses(requires: Requires) -> List[Clause]:
+    return [frozenset([item] if isinstance(item, str) else item) for item in requires]
+
+
+class TimeExpressionMatcher:
+    """
+    So khớp các pattern thời gian (thứ tự ưu tiên như danh sách truyền vào) trên một câu.
+    Mỗi pattern là regex hoặc (regex, điều kiện lọc khai báo cạnh pattern, xem Requires),
+    được biên dịch một lần; một lượt kiểm tra atom trên câu loại các pattern chắc chắn
+    không khớp, chỉ các pattern còn lại mới chạy re.search. Kết quả theo câu đã chuẩn hóa được giữ trong cache LRU
+    (không phụ thuộc thời điểm hiện tại: phần parse theo thời gian vẫn chạy mỗi lần gọi).
+    """
+
+    def __init__(self, patterns: Sequence[Union[str, Tuple[str, Requires]]], cache_size: int = None):
+        patterns = [(pattern, ()) if isinstance(pattern, str) else pattern for pattern in patterns]
+        self.patterns = [re.compile(pattern) for pattern, _ in patterns]
+        requirements = [_clauses(requires) for _, requires in patterns]
+        atoms = sorted({atom for clauses in requirements for clause in clauses for atom in clause
+                        if atom != DIGIT})
+        # Mỗi atom là một bit; clause thỏa khi mặt nạ atom có trong câu giao với mặt nạ của clause
+        bits = {atom: 1 << i for i, atom in enumerate(atoms)}
+        bits[DIGIT] = 1 << len(atoms)
+        self._atom_bits = [(atom, bits[atom]) for atom in atoms]
+        self._digit_bit = bits[DIGIT]
+        self._clause_masks = [[sum(bits[atom] for atom in clause) for clause in clauses]
+                              for clauses in requirements]
+        # Mặt nạ atom -> các pattern có thể khớp (số tổ hợp atom gặp thực tế nhỏ)
+        self._candidates: Dict[int, Tuple[int, ...]] = {}
+        self.cache_size = Config.TIME_MATCH_CACHE_SIZE if cache_size is None else cache_size
+        self._cache: "OrderedDict[str, Tuple[Tuple[int, re.Match], ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+
+    def _candidate_patterns(self, text: str) -> Tuple[int, ...]:
+        """Chỉ số các pattern mà mọi clause điều kiện cần đều thỏa trên câu, theo thứ tự ưu tiên."""
+        present = self._digit_bit if _DIGIT_RE.search(text) else 0
+        for atom, bit in self._atom_bits:
+            if atom in text:
+                present |= bit
+        candidates = self._candidates.get(present)
+        if candidates is None:
+            candidates = tuple(index for index, masks in enumerate(self._clause_masks)
+                               if all(mask & present for mask in masks))
+            if len(self._candidates) >= _MAX_CANDIDATE_SETS:
+                self._candidates.clear()
+            self._candidates[present] = candidates
+        return candidates
+
+    def _scan(self, text: str) -> Tuple[Tuple[int, re.Match], ...]:
+        found = []
+        for index in self._candidate_patterns(text):
+            self.searches += 1
+            match = self.patterns[index].search(text)
+            if match:
+                found.append((index, match))
+        return tuple(found)
+
+    def matches(self, text: str) -> Tuple[Tuple[int, re.Match], ...]:
+        """(chỉ số pattern, match đầu tiên của pattern đó) cho mọi pattern khớp, theo thứ tự ưu tiên."""
+        key = normalize_time_text(text)
+        with self._lock:
+            found = self._cache.get(key)
+            if found is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return found
+            self.misses += 1
+        found = self._scan(key)
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = found
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'patterns': len(self.patterns),
+                'cached': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'searches': self.searches
+            }
+
+
+_matchers: Dict[Tuple[str, ...], TimeExpressionMatcher] = {}
+_matchers_lock = threading.Lock()
+
+def get_time_matcher(patterns: Sequence[Union[str, Tuple[str, Requires]]]) -> TimeExpressionMatcher:
+    """Matcher dùng chung trong process cho một danh sách pattern (các ScheduleAdvisor dùng chung cache)."""
+    key = tuple(patterns)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        with _matchers_lock:
+            matcher = _matchers.get(key)
+            if matcher is None:
+                matcher = _matchers[key] = TimeExpressionMatcher(key)
+    return matcher
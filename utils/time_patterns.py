@@ -1,4 +1,10 @@
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+
+from utils.time_matcher import DIGIT
+
+# Chuỗi con bắt buộc của (thứ\s*[2-7]|chủ\s*nhật|cn|t[2-7]) và (sáng|chiều|tối), dùng làm điều kiện lọc
+WEEKDAY_ATOMS = ('thứ', 'chủ', 'cn', 't2', 't3', 't4', 't5', 't6', 't7')
+PERIOD_ATOMS = ('sáng', 'chiều', 'tối')
 
 def parse_weekday(match, current_time, weekday_map):
     weekday_str = match.group(1).lower().replace(' ', '')
@@ -230,16 +236,20 @@ def parse_next_month(match, current_time):
         year += 1
     return datetime(year, next_month, 1, 8, 0)
 
-def get_time_patterns(current_time):
+def get_time_patterns():
+    """
+    Các pattern thời gian chung: (regex, parser(match, current_time), điều kiện lọc); thời điểm tham chiếu
+    truyền vào mỗi lần parse. Điều kiện lọc là các chuỗi con bắt buộc của regex (xem time_matcher.Requires).
+    """
     return [
-        (r"ngày\s*(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?", lambda m: parse_specific_date(m, current_time)),
-        (r"(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?", lambda m: parse_specific_date(m, current_time)),
-        (r"(\d{1,2})(?:h|:)(\d{2})?(?:\s*(?:sáng|chiều|tối))?", lambda m: parse_time(m, current_time)),
-        (r"(\d{1,2})\s*giờ\s*(\d{2})?\s*phút?", lambda m: parse_time(m, current_time)),
-        (r"(?:hôm\s*nay|today)", lambda m: parse_today(m, current_time)),
-        (r"(?:ngày\s*mai|mai|tomorrow)", lambda m: parse_tomorrow(m, current_time)),
-        (r"(?:ngày\s*kia|послезавтра)", lambda m: parse_day_after_tomorrow(m, current_time)),
-        (r"(?:tuần\s*sau|next\s*week)", lambda m: parse_next_week(m, current_time)),
-        (r"(?:tuần\s*này|this\s*week)", lambda m: parse_this_week(m, current_time)),
-        (r"(?:tháng\s*sau|next\s*month)", lambda m: parse_next_month(m, current_time)),
+        (r"ngày\s*(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?", parse_specific_date, ('ngày', DIGIT, ('/', '-'))),
+        (r"(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?", parse_specific_date, (DIGIT, ('/', '-'))),
+        (r"(\d{1,2})(?:h|:)(\d{2})?(?:\s*(?:sáng|chiều|tối))?", parse_time, (DIGIT, ('h', ':'))),
+        (r"(\d{1,2})\s*giờ\s*(\d{2})?\s*phút?", parse_time, (DIGIT, 'giờ', 'phú')),
+        (r"(?:hôm\s*nay|today)", parse_today, (('hôm', 'today'),)),
+        (r"(?:ngày\s*mai|mai|tomorrow)", parse_tomorrow, (('mai', 'tomorrow'),)),
+        (r"(?:ngày\s*kia|послезавтра)", parse_day_after_tomorrow, (('kia', 'послезавтра'),)),
+        (r"(?:tuần\s*sau|next\s*week)", parse_next_week, (('tuần', 'week'),)),
+        (r"(?:tuần\s*này|this\s*week)", parse_this_week, (('tuần', 'week'),)),
+        (r"(?:tháng\s*sau|next\s*month)", parse_next_month, (('tháng', 'month'),)),
     ]